@@ -0,0 +1,203 @@
+# baleen.cache
+# An on-disk cache of downloaded feeds.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 17:41:09 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: cache.py [] benjamin@bengfort.com $
+
+"""
+An on-disk cache of downloaded feeds.
+
+Feed models store the ETag and Last-Modified validators of their last
+download, but feeds that are given as a url or as an OPML outline have
+nowhere to keep them, so every ingest of an OPML file downloads the entire
+body of every feed again. The cache stores the validators of these feeds
+along with their (zlib compressed) body, keyed by url, so that subsequent
+requests are conditional and a 304 Not Modified is answered with the body
+from the cache rather than with a second download.
+
+Every entry is a single file whose name is the SHA1 hash of the url. The
+file contains a line of JSON with the validators and headers, followed by
+the compressed body. Files are written to a temporary file first and then
+renamed, so concurrent workers and processes never read a partial entry.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import json
+import zlib
+import hashlib
+import requests
+import tempfile
+
+from requests.structures import CaseInsensitiveDict
+
+from baleen.config import settings
+
+
+##########################################################################
+## Module Constants
+##########################################################################
+
+# Response headers that are stored with the body of the response.
+CACHED_HEADERS = ('etag', 'last-modified', 'content-type')
+
+
+##########################################################################
+## HTTP Cache
+##########################################################################
+
+class HTTPCache(object):
+    """
+    A directory of cached responses keyed by url. Usage:
+
+        >>> cache = HTTPCache("~/.baleen/cache")
+        >>> headers = cache.headers(url)
+        >>> response = http.get(url, headers=headers)
+        >>> response = cache.update(url, response)
+
+    Where update stores a 200 response and replaces a 304 response with the
+    cached response, so that the response is always complete.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def key(self, url):
+        """
+        Returns the path of the cache entry for the url.
+        """
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return os.path.join(self.path, hashlib.sha1(url).hexdigest())
+
+    def meta(self, url):
+        """
+        Returns the url and headers of the cached response for the url
+        without reading its body, or None if it isn't cached.
+        """
+        try:
+            with open(self.key(url), 'rb') as f:
+                return json.loads(f.readline())
+        except (IOError, ValueError):
+            return None
+
+    def get(self, url):
+        """
+        Returns the cached response for the url or None if it isn't cached
+        (or the entry can't be read, in which case it is simply replaced).
+        """
+        try:
+            with open(self.key(url), 'rb') as f:
+                meta = json.loads(f.readline())
+                body = zlib.decompress(f.read())
+        except (IOError, ValueError, zlib.error):
+            return None
+
+        response = requests.Response()
+        response._content    = body
+        response.status_code = 200
+        response.url         = meta['url']
+        response.headers     = CaseInsensitiveDict(meta['headers'])
+        response.from_cache  = True
+        return response
+
+    def set(self, url, response):
+        """
+        Stores the body of the response and its validators for the url. The
+        response is only stored if it has a validator, since otherwise the
+        next request could not be made conditional; any stale entry of the
+        url is removed so its old validators aren't sent with the next one.
+        """
+        headers = {
+            key: response.headers[key] for key in CACHED_HEADERS
+            if response.headers.get(key)
+        }
+
+        if 'etag' not in headers and 'last-modified' not in headers:
+            self.delete(url)
+            return False
+
+        meta = json.dumps({'url': response.url, 'headers': headers})
+        body = zlib.compress(response.content)
+
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(meta + "\n")
+                f.write(body)
+            os.rename(tmp, self.key(url))
+        except:
+            os.remove(tmp)
+            raise
+
+        return True
+
+    def delete(self, url):
+        """
+        Removes the cached response for the url if it exists.
+        """
+        try:
+            os.remove(self.key(url))
+        except OSError:
+            pass
+
+    def headers(self, url):
+        """
+        Returns the conditional request headers for the cached response of
+        the url (an empty dict if it isn't cached).
+        """
+        meta = self.meta(url)
+        if meta is None:
+            return {}
+
+        # If there is an etag use it (even if there is also modified)
+        headers = CaseInsensitiveDict(meta['headers'])
+        if headers.get('etag'):
+            return {'If-None-Match': headers['etag']}
+        if headers.get('last-modified'):
+            return {'If-Modified-Since': headers['last-modified']}
+        return {}
+
+    def update(self, url, response):
+        """
+        Stores a successful response or replaces a 304 Not Modified response
+        with the cached response. Any other response is returned unchanged.
+        """
+        if response.status_code == 304:
+            cached = self.get(url)
+            if cached is not None:
+                return cached
+
+        elif response.status_code == 200:
+            self.set(url, response)
+
+        return response
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def cache():
+    """
+    Returns the cache in the directory of the http.cache setting, or None
+    if caching is disabled.
+    """
+    if not settings.http.cache:
+        return None
+    return HTTPCache(settings.http.cache)
@@ -32,6 +32,7 @@ class MongoConfiguration(confire.Configuration):
     host = "localhost"
     port = 27017
     name = "baleen"
+    compression = None  # Compress the content of posts ('zlib') or store it as text
 
 
 class ServerConfiguration(confire.Configuration):
@@ -43,6 +44,85 @@ class ServerConfiguration(confire.Configuration):
     port = 5000
 
 
+class HTTPConfiguration(confire.Configuration):
+    """
+    Configuration for the shared pool of HTTP connections and the limits
+    that keep requests to any single host polite.
+    """
+
+    pool_hosts      = 256   # Number of hosts to keep connection pools for
+    pool_maxsize    = 4     # Idle connections kept alive to a single host
+    host_rate       = 2.0   # Requests per second to a single host (refill rate)
+    host_burst      = 8     # Requests that can be made to a host in a burst
+    host_inflight   = 4     # Maximum concurrent requests to a single host
+    retries         = 2     # Retries of a request throttled with Retry-After
+    backoff         = 60    # Seconds to back off a 429 without a Retry-After
+    max_retry_after = 3600  # Never back off a host for longer than this
+    user_agent      = "Baleen/{version} (+https://github.com/bbengfort/baleen)"
+    cache           = None  # Directory to cache feeds that aren't models (None disables)
+
+
+class PipelineConfiguration(confire.Configuration):
+    """
+    Number of workers for each stage of the pipelined ingestor.
+    """
+
+    fetch    = 16       # Download feeds (network bound)
+    parse    = 2        # Parse feeds with feedparser (CPU bound)
+    wrangle  = 2        # Wrangle entries into posts (CPU bound)
+    persist  = 4        # Write posts to the database
+    maxsize  = 256      # Maximum number of items queued for each stage
+    interval = 60       # Seconds between logging the stage statistics
+
+
+class FetchConfiguration(confire.Configuration):
+    """
+    Configuration for the concurrent fetching of the webpages of posts.
+    """
+
+    workers   = 8       # Number of webpages to download concurrently
+    retries   = 2       # Retries of a download that failed with a transient error
+    delay     = 30      # Seconds before the first retry (doubled on every retry)
+    maxsize   = 256     # Maximum number of posts queued to be fetched
+    deferred  = False   # Queue posts for the `baleen fetch` workers instead
+    lease     = 600     # Seconds a fetch worker holds a task before it is retried
+    max_bytes = 4194304 # Abort downloads of webpages larger than this (4 MB)
+    mimetypes = [       # Only download webpages of these content types
+        'text/html', 'application/xhtml+xml', 'text/plain',
+    ]
+
+
+class PollingConfiguration(confire.Configuration):
+    """
+    Configuration for the adaptive polling intervals of feeds, which are
+    scheduled from the observed arrival rate of their posts.
+    """
+
+    minimum   = 300     # Never poll a feed more often than this (seconds)
+    maximum   = 86400   # Poll every feed at least this often (seconds)
+    default   = 3600    # Interval of a feed whose rate is not yet known
+    target    = 1.0     # Number of new posts expected on each poll
+    smoothing = 0.3     # Weight of the latest poll in the arrival rate
+    backoff   = 2.0     # Interval multiplier per consecutive 304 or error
+    tick      = 300     # Seconds between checks for feeds that are due
+
+
+class MongoLogConfiguration(confire.Configuration):
+    """
+    Configuration for logging to Mongo, which is buffered so that writing
+    log records never blocks ingestion.
+    """
+
+    buffered  = True    # Insert records in batches from a background thread
+    capacity  = 100     # Maximum number of records inserted in one batch
+    interval  = 5.0     # Seconds a record can wait for its batch to fill
+    maxsize   = 10000   # Records buffered before they are spilled or dropped
+    spill     = None    # File to append records to when the buffer is full
+    retention = None    # Days to keep logs (None keeps them forever)
+    archive   = None    # Directory to archive logs to before they are removed
+    capped    = None    # Keep logs in a capped collection of this many bytes instead
+
+
 class BaleenConfiguration(confire.Configuration):
     """
     Meaningful defaults and required configurations.
@@ -60,10 +140,21 @@ class BaleenConfiguration(confire.Configuration):
     debug      = True
     database   = MongoConfiguration()
     server     = ServerConfiguration()
+    http       = HTTPConfiguration()
+    pipeline   = PipelineConfiguration()
+    fetch      = FetchConfiguration()
+    polling    = PollingConfiguration()
+    mongolog   = MongoLogConfiguration()
     logfile    = 'baleen.log'                    # Location to write log
     loglevel   = 'DEBUG'                         # Log messages to record
     fetch_html = True                            # Actually fetch HTML link
-    timeout    = 180                             # Timeout for fetching posts/feeds
+    timeout    = 180                             # Total timeout for fetching a post/feed
+    connect_timeout = 10                         # Timeout to connect to a post/feed host
+    read_timeout = 60                            # Timeout between bytes of a post/feed
+    workers    = 1                               # Feeds to sync concurrently (one thread each)
+    engine     = 'threaded'                      # Ingestor: threaded or pipeline
+    batch      = 0                               # Posts per bulk insert (0 saves one at a time)
+    stream     = False                           # Parse feeds incrementally, skip known posts
 
 ## Load settings immediately for import
 settings = BaleenConfiguration.load()
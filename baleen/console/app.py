@@ -32,6 +32,9 @@ DESCRIPTION = "Management and administration commands for Baleen"
 EPILOG      = "If there are any bugs or concerns, submit an issue on Github"
 COMMANDS    = (
     IngestCommand,
+    FetchCommand,
+    IndexesCommand,
+    LogsCommand,
     ExportCommand,
     LoadOPMLCommand,
     SummaryCommand,
@@ -18,6 +18,9 @@ Comamnds for the Baleen CLI utility.
 ##########################################################################
 
 from .ingest import IngestCommand
+from .fetch import FetchCommand
+from .indexes import IndexesCommand
+from .logs import LogsCommand
 from .export import ExportCommand
 from .load import LoadOPMLCommand
 from .summary import SummaryCommand
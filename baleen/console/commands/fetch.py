@@ -0,0 +1,95 @@
+# baleen.console.commands.fetch
+# Fetches the webpages of queued posts or posts not fetched yet.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 18:57:40 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: fetch.py [] benjamin@bengfort.com $
+
+"""
+Fetches the webpages of queued posts or posts not fetched yet.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import baleen.models as db
+
+from datetime import datetime, timedelta
+from commis import Command
+from baleen.fetch import FetchWorker, catchup
+from baleen.utils.timez import Timer
+
+##########################################################################
+## Command
+##########################################################################
+
+class FetchCommand(Command):
+
+    name = 'fetch'
+    help = 'fetches the webpages of the posts on the fetch queue'
+    args = {
+        '--catchup': {
+            'action': 'store_true',
+            'default': False,
+            'help': 'Fetch all posts that have not been fetched, not the queue',
+        },
+        '--forever': {
+            'action': 'store_true',
+            'default': False,
+            'help': 'Keep waiting for queued posts once the queue is drained',
+        },
+        '--since': {
+            'type': int,
+            'default': None,
+            'metavar': 'DAYS',
+            'help': 'Catch up only the posts created in the last DAYS days',
+        },
+        '--limit': {
+            'type': int,
+            'default': None,
+            'metavar': 'N',
+            'help': 'Fetch the webpages of at most N posts',
+        },
+        '--workers': {
+            'type': int,
+            'default': None,
+            'metavar': 'N',
+            'help': 'Download N webpages concurrently',
+        },
+    }
+
+    def handle(self, args):
+        db.connect()
+
+        if args.catchup:
+            since = None
+            if args.since is not None:
+                since = datetime.now() - timedelta(days=args.since)
+
+            with Timer() as timer:
+                counts = catchup(limit=args.limit, since=since, workers=args.workers)
+
+            return (
+                "Fetched {fetched} posts ({timer}) with {errors} errors "
+                "after {retried} retries"
+            ).format(
+                timer=timer, fetched=counts['fetched'],
+                errors=counts['errors'], retried=counts['retried'],
+            )
+
+        worker = FetchWorker(workers=args.workers)
+        with Timer() as timer:
+            counts = worker.drain(limit=args.limit, forever=args.forever)
+
+        return (
+            "Fetched {fetched} queued posts ({timer}) with {failed} failures, "
+            "{retried} rescheduled"
+        ).format(
+            timer=timer, fetched=counts['fetched'],
+            failed=counts['failed'], retried=counts['retried'],
+        )
@@ -0,0 +1,71 @@
+# baleen.console.commands.indexes
+# Builds the indexes of the database and reports their usage.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 19:48:12 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: indexes.py [] benjamin@bengfort.com $
+
+"""
+Builds the indexes of the database and reports their usage.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import baleen.models as db
+
+from commis import Command
+from baleen.utils.timez import Timer
+
+##########################################################################
+## Command
+##########################################################################
+
+class IndexesCommand(Command):
+
+    name = 'indexes'
+    help = 'builds the indexes of the database in the background and reports their usage'
+    args = {
+        '--report': {
+            'action': 'store_true',
+            'default': False,
+            'help': 'Only report the usage of the indexes, do not build them',
+        },
+    }
+
+    def handle(self, args):
+        db.connect()
+        output = []
+
+        if not args.report:
+            with Timer() as timer:
+                db.ensure_indexes()
+            output.append("Ensured the indexes of {} collections ({})".format(
+                len(db.INDEXED_MODELS), timer
+            ))
+
+        for model in db.INDEXED_MODELS:
+            for stat in db.index_stats(model):
+                output.append(self.format_stat(stat))
+
+        return "\n".join(output)
+
+    def format_stat(self, stat):
+        """
+        Formats the name, usage and size of an index as a line of the report.
+        """
+        ops  = "unknown" if stat['ops'] is None else stat['ops']
+        size = "unknown" if stat['size'] is None else "{:0.1f} KB".format(stat['size'] / 1024.0)
+
+        line = "{collection}.{name}: {ops} ops, {size}".format(
+            ops=ops, size=size, **stat
+        )
+
+        if stat['since'] is not None:
+            line += " (since {:%Y-%m-%d %H:%M})".format(stat['since'])
+        return line
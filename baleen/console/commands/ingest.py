@@ -17,11 +17,13 @@ Handles the ingestion utility both for OPML and feeds.
 ## Imports
 ##########################################################################
 
+import uuid
 import baleen.models as db
 
 from commis import Command
 from commis.exceptions import ConsoleError
-from baleen.ingest import Ingestor, MongoIngestor, OPMLIngestor
+from baleen.ingest import Ingestor, OPMLIngestor, ENGINES
+from baleen.ingest import engine, shard_ingest
 
 ##########################################################################
 ## Command
@@ -37,6 +39,50 @@ class IngestCommand(Command):
             'default': None,
             'help': 'Ingest directly from an OPML file',
         },
+        '--processes': {
+            'type': int,
+            'default': None,
+            'metavar': 'N',
+            'help': 'Ingest the feeds in N shards with N local processes',
+        },
+        '--shards': {
+            'type': int,
+            'default': 1,
+            'metavar': 'N',
+            'help': 'Partition the feeds into N shards (for multiple hosts)',
+        },
+        '--shard': {
+            'type': int,
+            'default': 0,
+            'metavar': 'IDX',
+            'help': 'The shard of the feeds to ingest (requires --shards)',
+        },
+        '--batch': {
+            'type': int,
+            'default': None,
+            'metavar': 'N',
+            'help': 'Save posts in unordered bulk inserts of N posts',
+        },
+        '--due': {
+            'action': 'store_true',
+            'default': False,
+            'help': 'Only ingest the feeds whose next poll is due',
+        },
+        '--defer': {
+            'action': 'store_true',
+            'default': False,
+            'help': 'Queue the posts for the fetch workers rather than fetching them',
+        },
+        '--engine': {
+            'choices': sorted(ENGINES),
+            'default': None,
+            'help': 'The ingestor to use (default from the engine setting)',
+        },
+        '--jobid': {
+            'type': str,
+            'default': None,
+            'help': 'The job id shared by all shards of the ingestion',
+        },
         'feeds': {
             'type': str,
             'nargs': "*",
@@ -46,9 +92,46 @@ class IngestCommand(Command):
         }
     }
 
+    def options(self, args):
+        """
+        Returns the ingestor options specified on the command line.
+        """
+        options = {'due': args.due}
+        if args.batch is not None:
+            options['batch'] = args.batch
+        if args.defer:
+            options['deferred'] = True
+        return options
+
     def handle(self, args):
 
-        ingestor = MongoIngestor()
+        try:
+            klass = engine(args.engine)
+        except ValueError as e:
+            raise ConsoleError(str(e))
+
+        if args.jobid:
+            try:
+                args.jobid = uuid.UUID(args.jobid)
+            except ValueError:
+                raise ConsoleError("'{}' is not a valid job id (a UUID)".format(args.jobid))
+
+        if args.processes:
+            jobid = shard_ingest(
+                args.processes, klass=klass, jobid=args.jobid, **self.options(args)
+            )
+            return "Processed job {} in {} shards".format(jobid, args.processes)
+
+        if not 0 <= args.shard < args.shards:
+            raise ConsoleError("shard must be between 0 and {}".format(args.shards-1))
+
+        # Every host of a sharded ingestion must share the job to merge it
+        if args.shards > 1 and not args.jobid:
+            raise ConsoleError("--jobid is required to ingest a shard (--shards > 1)")
+
+        ingestor = klass(
+            shard=args.shard, shards=args.shards, **self.options(args)
+        )
 
         if args.opml:
             ingestor = OPMLIngestor(args.opml)
@@ -59,10 +142,10 @@ class IngestCommand(Command):
             raise ConsoleError("feed ingestion is an untested utility!")
 
         db.connect()
-        ingestor.ingest()
+        ingestor.ingest(jobid=args.jobid)
         return (
-            "Processed {feeds} feeds ({timer}): "
-            "{posts} posts with {errors} errors"
+            "Processed {feeds} feeds ({unchanged} unchanged) ({timer}): "
+            "{posts} posts ({skipped} skipped) with {errors} errors"
         ).format(
             timer=ingestor.timer, **ingestor.counts
         )
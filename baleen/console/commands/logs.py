@@ -0,0 +1,72 @@
+# baleen.console.commands.logs
+# Applies the retention policy of the logs stored in the database.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 20:41:27 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: logs.py [] benjamin@bengfort.com $
+
+"""
+Applies the retention policy of the logs stored in the database.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import baleen.models as db
+
+from commis import Command
+from baleen.config import settings
+from baleen.utils.timez import Timer
+
+##########################################################################
+## Command
+##########################################################################
+
+class LogsCommand(Command):
+
+    name = 'logs'
+    help = 'archives and expires the logs according to their retention policy'
+    args = {
+        '--retention': {
+            'type': int,
+            'default': None,
+            'metavar': 'DAYS',
+            'help': 'Keep the logs of the last DAYS days (default from settings)',
+        },
+        '--archive': {
+            'default': None,
+            'metavar': 'DIR',
+            'help': 'Archive logs to DIR before they are removed (default from settings)',
+        },
+    }
+
+    def handle(self, args):
+        db.connect()
+
+        retention = args.retention or settings.mongolog.retention
+        archive   = args.archive or settings.mongolog.archive
+
+        db.Log.ensure_retention(retention=retention, archive=archive)
+
+        if settings.mongolog.capped:
+            return "Logs are kept in a capped collection of {} bytes".format(
+                settings.mongolog.capped
+            )
+
+        if not retention:
+            return "Logs are kept forever (no retention is configured)"
+
+        if not archive:
+            return "Logs expire after {} days".format(retention)
+
+        with Timer() as timer:
+            archived = db.Log.prune(retention=retention, archive=archive)
+
+        return "Archived {} logs older than {} days to {} ({})".format(
+            archived, retention, archive, timer
+        )
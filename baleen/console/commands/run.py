@@ -23,8 +23,10 @@ import schedule
 import baleen.models as db
 
 from commis import Command
+from commis.exceptions import ConsoleError
 from functools import partial
-from baleen.ingest import MongoIngestor
+from baleen.config import settings
+from baleen.ingest import ENGINES, engine, shard_ingest
 from baleen.utils.logger import IngestLogger
 
 ##########################################################################
@@ -34,21 +36,54 @@ from baleen.utils.logger import IngestLogger
 class RunCommand(Command):
 
     name = 'run'
-    help = 'runs the ingest command every hour'
-    args = {}
+    help = 'runs the ingest command for feeds as they become due'
+    args = {
+        '--processes': {
+            'type': int,
+            'default': None,
+            'metavar': 'N',
+            'help': 'Ingest the feeds in N shards with N local processes',
+        },
+        '--engine': {
+            'choices': sorted(ENGINES),
+            'default': None,
+            'help': 'The ingestor to use (default from the engine setting)',
+        },
+    }
 
     def ingest(self, args):
+        klass = engine(args.engine)
+        if args.processes:
+            shard_ingest(args.processes, klass=klass, due=True)
+            return
+
         db.connect()
-        ingestor = MongoIngestor()
+        ingestor = klass(due=True)
         ingestor.ingest()
 
+    def prune(self):
+        """
+        Archives and removes the logs that are past their retention.
+        """
+        db.connect()
+        db.Log.prune()
+
     def handle(self, args):
+        try:
+            engine(args.engine)
+        except ValueError as e:
+            raise ConsoleError(str(e))
+
         logger = IngestLogger()
         logger.info(
-            "Starting Baleen v{} ingestion service every hour.".format(baleen.get_version())
+            "Starting Baleen v{} ingestion service every {} seconds.".format(
+                baleen.get_version(), settings.polling.tick
+            )
         )
 
-        schedule.every().hour.do(partial(self.ingest, args))
+        schedule.every(settings.polling.tick).seconds.do(partial(self.ingest, args))
+        if settings.mongolog.retention and settings.mongolog.archive:
+            schedule.every().day.do(self.prune)
 
         while True:
             try:
@@ -37,7 +37,12 @@ class SummaryCommand(Command):
             'action': 'store_true',
             'default': False,
             'help': 'Also print the configuration',
-        }
+        },
+        '--recount': {
+            'action': 'store_true',
+            'default': False,
+            'help': 'Recount the post statistics of every feed first (slow)',
+        },
     }
 
     def handle(self, args):
@@ -45,6 +50,11 @@ class SummaryCommand(Command):
         output = []
         db.connect()
 
+        # Rebuild the statistics, e.g. for posts stored before they existed.
+        if args.recount:
+            for feed in db.Feed.objects():
+                feed.recount()
+
         # Printout configuration details as necessary.
         if args.config:
             output.append(u"Configuration:")
@@ -89,7 +99,11 @@ class SummaryCommand(Command):
             u"    eTag: \"{}\"".format(latest.etag),
             u"    Modified: {}".format(latest.modified),
             u"    Updated: {}".format(latest.updated.strftime(HUMAN_DATETIME)),
-            # u"    Posts: {}".format(latest.count_posts()), # This is very slow need to fix.
+            u"    Posts: {} ({} bytes)".format(latest.post_count, latest.content_bytes),
+            u"    Latest Post: {}".format(
+                latest.last_post.strftime(HUMAN_DATETIME) if latest.last_post else None
+            ),
+            u"    Sync Errors: {}".format(latest.sync_errors),
         ])
 
         latest = db.Post.objects.order_by('-id').first()
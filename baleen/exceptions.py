@@ -59,6 +59,13 @@ class FetchError(WranglingError):
     pass
 
 
+class ContentError(BaleenError):
+    """
+    A response has a type or size that should not be downloaded or stored
+    """
+    pass
+
+
 class ExportError(BaleenError):
     """
     Something went wrong with the export of the corpus
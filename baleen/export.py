@@ -163,7 +163,10 @@ class MongoExporter(object):
         Writes information about the feeds to disk for performing lookups on
         the feeds themselves from the object id in each individual post.
         """
-        fields = ('id', 'title', 'link', 'category', 'active')
+        fields = (
+            'id', 'title', 'link', 'category', 'active', 'fetched',
+            'post_count', 'content_bytes', 'last_post', 'sync_errors',
+        )
         feeds = Feed.objects(category__in=self.categories).only(*fields)
         with open(path, 'w') as f:
             f.write(feeds.to_json(indent=2))
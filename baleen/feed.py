@@ -17,14 +17,18 @@ Handles the synchronization of documents from an RSS feeds.
 ## Imports
 ##########################################################################
 
+import hashlib
 import feedparser
 
-from baleen.config import settings
+from baleen import http
+from baleen import polling
+from baleen.cache import cache
 from baleen.models import Feed
+from baleen.stream import FeedStream
 from baleen.utils.timez import localnow
 from baleen.exceptions import FeedTypeError
 from baleen.exceptions import SynchronizationError
-from baleen.utils.decorators import memoized, reraise, timeout
+from baleen.utils.decorators import memoized, reraise
 
 
 ##########################################################################
@@ -36,6 +40,14 @@ FEEDPARSER_IGNORABLE_FIELDS = {
     'published', 'published_parsed', 'category',
 }
 
+# Number of streamed entries that are looked up together to skip known posts.
+KNOWN_CHUNK = 50
+
+# Requests decodes the body, so these headers no longer apply to the content.
+RESPONSE_IGNORABLE_HEADERS = {
+    'content-encoding', 'content-length', 'transfer-encoding',
+}
+
 
 ##########################################################################
 ## Feed Synchronization
@@ -70,6 +82,7 @@ class FeedSync(object):
         Feed can be a string (url), a dictionary with an `xmlUrl` or a Feed.
         """
         self.feed = feed
+        self.unchanged = False  # Set if the body is the same as the last fetch
 
     @memoized
     def type(self):
@@ -104,51 +117,142 @@ class FeedSync(object):
             self.MODEL: lambda: self.feed.link,
         }[self.type]()
 
-    @timeout(settings.timeout)
-    def parse(self):
+    @memoized
+    def cache(self):
+        """
+        Returns the on-disk cache for feeds that aren't models (which have
+        no other place to keep their etag/modified), or None if disabled.
         """
-        Wraps the feedparser.parse function such that if the feed is an model,
-        it uses the etag or modified to prevent duplicating the download.
+        if self.type == self.MODEL:
+            return None
+        return cache()
 
-        NOTE: Calling this function will NOT update the feed use sync instead!
-        NOTE: Exceptions in this function will not be handled by Baleen!
+    def headers(self):
+        """
+        Returns the conditional request headers for the feed; models contain
+        the etag/modified information to prevent a duplicate download, other
+        feeds use the validators of their cached response (if any).
         """
-        # Only models contain the etag/modified saved information.
         if self.type == self.MODEL:
             # If there is an etag use it (even if there is also modified)
             if self.feed.etag:
-                return feedparser.parse(self.url, etag=self.feed.etag)
+                return {'If-None-Match': self.feed.etag}
 
             # If there is a modified date, then use it
             if self.feed.modified:
-                return feedparser.parse(self.url, modified=self.feed.modified)
+                return {'If-Modified-Since': self.feed.modified}
 
-        # Otherwise just return the parse of the URL
-        return feedparser.parse(self.url)
+        elif self.cache is not None:
+            return self.cache.headers(self.url)
+
+        return {}
+
+    def is_unchanged(self, response):
+        """
+        Many servers ignore conditional requests and return the same body on
+        every request. Returns True if the body of the response has the same
+        digest as the last fetched body of the feed (only models store it),
+        in which case there is nothing new to parse.
+        """
+        if response.status_code == 304 or self.type != self.MODEL:
+            return False
+        return self.feed.digest is not None and self.feed.digest == digest(response)
 
     @reraise(klass=SynchronizationError)
-    def sync(self, save=True):
+    def fetch(self, deadline=None):
+        """
+        Downloads the feed without parsing it, returning the response so that
+        the download can be performed separately from parsing (for example by
+        the fetch stage of the PipelineIngestor). Pass the response to sync.
+
+        Every feed gets its own deadline (from the timeout setting) unless
+        one is passed in; connect and read timeouts are also applied.
+
+        If the feed is cached, a successful response is stored in the cache
+        and a 304 Not Modified is replaced by the cached response, so that
+        its entries are parsed without downloading the feed again.
+        """
+        response = http.get(self.url, headers=self.headers(), deadline=deadline)
+
+        if response.status_code != 304:
+            response.raise_for_status()
+
+        if self.cache is not None:
+            response = self.cache.update(self.url, response)
+        return response
+
+    def parse(self, response=None):
+        """
+        Downloads the feed (using the etag or modified of a model to prevent
+        duplicating the download) and hands the content of the response to
+        feedparser, passing the response headers so that the etag, modified
+        and encoding are handled just as if feedparser had done the download.
+
+        If a response from fetch is passed in, its content is parsed rather
+        than downloading the feed again. If the body is unchanged since the
+        last fetch, it is not parsed and the result has no entries.
+
+        NOTE: Calling this function will NOT update the feed use sync instead!
+        NOTE: Exceptions in this function will not be handled by Baleen!
+        """
+        if response is None:
+            response = self.fetch()
+
+        headers = {
+            key: val for key, val in response.headers.items()
+            if key.lower() not in RESPONSE_IGNORABLE_HEADERS
+        }
+        headers['content-location'] = response.url
+
+        self.unchanged = self.is_unchanged(response)
+        if response.status_code == 304 or self.unchanged:
+            # The feed has not changed so there is nothing to parse.
+            result = feedparser.FeedParserDict(
+                feed=feedparser.FeedParserDict(), entries=[],
+                bozo=0, headers=headers,
+            )
+        else:
+            result = feedparser.parse(response.content, response_headers=headers)
+
+        result['href'] = response.url
+        result['status'] = response.status_code
+        result['unchanged'] = self.unchanged
+        if response.status_code != 304:
+            result['digest'] = digest(response)
+        return result
+
+    @reraise(klass=SynchronizationError)
+    def sync(self, save=True, response=None):
         """
         Calls the feedparser.parse function correctly but also synchronizes
         the state of the feed (e.g. last modified, etag, etc.) to MongoDB.
 
         Note: If the feed isn't a model, it just does the same as parse.
 
-        If save is True (default) will save the Feed back to MongoDB.
+        If save is True (default) will save the Feed back to MongoDB. If a
+        response is passed in, it is parsed instead of downloading the feed.
         """
         # Get the result from the parse function.
-        result = self.parse()
+        result = self.parse(response)
 
         # If this is not a model, bail out and return the result.
         if not self.type == self.MODEL:
             return result
 
-        # Otherwise update the model in MongoDB with synchronization info.
-        # Set the last fetched timestamp on the model.
+        return self.update(result, save)
+
+    def update(self, result, save=True):
+        """
+        Updates the model with the synchronization info of a parse result
+        (e.g. last modified, etag, etc.) and saves it if save is True.
+        """
+        # Update the model in MongoDB with synchronization info.
+        # Set the last fetched timestamp on the model and end an error streak.
         self.feed.fetched = localnow()
+        self.feed.sync_errors = 0
 
         # Update the feed properties from the result.
-        for key in ('etag', 'modified', 'version'):
+        for key in ('etag', 'modified', 'version', 'digest'):
             if key in result and getattr(result, key):
                 setattr(self.feed, key, getattr(result, key))
 
@@ -175,16 +279,97 @@ class FeedSync(object):
             else:
                 setattr(self.feed, key, val)
 
+        # Schedule the next poll from the arrival rate of posts.
+        polling.observe(self.feed, result)
+
         if save:
             self.feed.save()
 
         return result
 
-    def entries(self, save=True):
+    def stream(self, save=True, response=None, known=None):
+        """
+        Incrementally parses the feed, yielding its entries as they are
+        parsed rather than after the entire document has been parsed.
+
+        If known is given, entries that have already been stored are skipped.
+        It is passed chunks of up to KNOWN_CHUNK entries (so that they can be
+        looked up with one query per chunk) and returns a flag per entry that
+        is True if the entry is known. The stream doesn't stop at the first
+        known entry since not every feed lists its newest first.
+
+        Once the stream is exhausted or stopped, the synchronization info of
+        the feed is updated and saved just as with sync (for models only).
+        Errors are raised as a SynchronizationError while iterating. If the
+        body is unchanged since the last fetch, no entries are streamed.
+        """
+        try:
+            if response is None:
+                response = self.fetch()
+
+            # Only the dates of the entries are kept to schedule polling.
+            entries = []
+            stream  = FeedStream(
+                response.content, base=response.url,
+                lang=response.headers.get('content-language'),
+                encoding=http.charset(response),
+            )
+            self.unchanged = self.is_unchanged(response)
+            if response.status_code != 304 and not self.unchanged:
+                chunk = []
+                for entry in stream:
+                    entries.append({
+                        key: entry.get(key) for key in ('published_parsed', 'updated_parsed')
+                    })
+                    chunk.append(entry)
+                    if len(chunk) >= KNOWN_CHUNK:
+                        for entry in self.unknown(chunk, known):
+                            yield entry
+                        chunk = []
+
+                for entry in self.unknown(chunk, known):
+                    yield entry
+
+            if self.type == self.MODEL:
+                self.update(feedparser.FeedParserDict(
+                    feed=stream.feed, entries=entries,
+                    version=stream.version, href=response.url,
+                    status=response.status_code, unchanged=self.unchanged,
+                    digest=digest(response) if response.status_code != 304 else None,
+                    etag=response.headers.get('etag'),
+                    modified=response.headers.get('last-modified'),
+                ), save)
+        except SynchronizationError:
+            raise
+        except Exception as e:
+            error = SynchronizationError(e.message)
+            error.original = e
+            raise error
+
+    def unknown(self, chunk, known=None):
+        """
+        Returns the entries of the chunk that are not flagged as known.
+        """
+        if known is None or not chunk:
+            return chunk
+        return [entry for entry, skip in zip(chunk, known(chunk)) if not skip]
+
+    def entries(self, save=True, response=None):
         """
         A helper function to simultaneously call sync and iterate over the
         entries from the feed. This is the usual method of interacting with
         the feed sync object. Note that this just returns raw dicts not Posts.
         """
-        result = self.sync(save=save)
+        result = self.sync(save=save, response=response)
         return result.entries
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def digest(response):
+    """
+    Returns the SHA1 hex digest of the body of the response.
+    """
+    return hashlib.sha1(response.content).hexdigest()
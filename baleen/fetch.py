@@ -0,0 +1,410 @@
+# baleen.fetch
+# Concurrently fetches the webpages of posts.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 18:31:22 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: fetch.py [] benjamin@bengfort.com $
+
+"""
+Concurrently fetches the webpages of posts.
+
+Fetching the complete HTML of a post is by far the slowest part of an
+ingestion, since every page is a separate download from a (possibly slow)
+host. Rather than downloading each page in series as its post is saved,
+posts are handed to a PostFetcher, which downloads them on its own pool of
+workers while feeds continue to be synchronized. Downloads that fail with
+a transient error (a timeout, a connection error, or a 429/5xx response)
+are put on a retry queue and tried again after an exponential delay.
+
+The fetcher can also run as a catch-up pass over the posts whose webpage
+has not been fetched yet, e.g. posts ingested while fetch_html was off or
+whose downloads failed on every retry. Failed fetches are recorded on the
+post, and posts that failed permanently (e.g. with a 404) are not caught up
+again. Posts stored before fetches were recorded are not caught up either.
+
+Alternatively, ingestion can be deferred: posts are put on a persistent
+queue (the fetch_queue collection) and a FetchWorker, run by the `baleen
+fetch` command in as many processes or hosts as required, leases tasks
+from the queue and fetches them. Failed tasks are retried with exponential
+backoff, and the tasks of a worker that dies are leased again once their
+lease expires, so no work is lost across restarts.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import time
+import heapq
+import socket
+import requests
+import threading
+import mongoengine as me
+
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import count
+
+from baleen.models import Post, FetchTask
+from baleen.config import settings
+from baleen.wrangle import PostWrangler
+from baleen.utils.workers import WorkerPool
+from baleen.exceptions import FetchError, TimeoutError
+
+
+##########################################################################
+## Module Constants
+##########################################################################
+
+# Response status codes that are worth retrying after a delay.
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def retryable(exception):
+    """
+    Returns True if the (wrapped) exception of a failed fetch is transient,
+    e.g. a timeout, rather than an error that will happen again (a 404).
+    """
+    original = getattr(exception, 'original', exception)
+
+    if isinstance(original, requests.HTTPError):
+        response = original.response
+        return response is None or response.status_code in RETRY_STATUSES
+
+    return isinstance(original, (
+        requests.ConnectionError, requests.Timeout, TimeoutError,
+    ))
+
+
+def unfetched(limit=None, since=None, batch=100):
+    """
+    Yields the posts whose webpage has not been fetched and has not failed
+    permanently, oldest first, optionally only those created since the given
+    datetime. Posts are loaded a batch at a time, each batch starting after
+    the last post of the previous one (on the index of fetched, fetch_failed
+    and created), so that no cursor is held open while the webpages are
+    downloaded and the ids of the posts are never all loaded at once.
+
+    Posts stored before fetches were recorded have no fetch_failed field and
+    are not matched, so that a catch-up doesn't download the whole corpus.
+    """
+    query = me.Q(fetched=None, fetch_failed=False)
+    if since is not None:
+        query &= me.Q(created__gte=since)
+
+    last  = None
+    count = 0
+    while limit is None or count < limit:
+        size = batch if limit is None else min(batch, limit - count)
+        page = query
+        if last is not None:
+            page &= (
+                me.Q(created__gt=last.created) |
+                me.Q(created=last.created, id__gt=last.id)
+            )
+
+        posts = list(Post.objects(page).order_by('created', 'id').limit(size))
+        for post in posts:
+            yield post
+
+        count += len(posts)
+        if len(posts) < size:
+            return
+        last = posts[-1]
+
+
+def catchup(limit=None, since=None, **kwargs):
+    """
+    Fetches the webpages of the posts that have not been fetched yet (that
+    were created since the given datetime, if any), and returns the counts
+    of the fetcher. Keyword arguments are passed to the PostFetcher (e.g.
+    the number of workers).
+    """
+    with PostFetcher(**kwargs) as fetcher:
+        for post in unfetched(limit, since):
+            fetcher.put(PostWrangler(post))
+    return fetcher.counts
+
+
+##########################################################################
+## Post Fetcher
+##########################################################################
+
+class PostFetcher(object):
+    """
+    Fetches the webpages of post wranglers on a pool of worker threads,
+    retrying transient failures after a delay that doubles on every
+    attempt. Usage:
+
+        >>> with PostFetcher(workers=8) as fetcher:
+        ...     for post in posts:
+        ...         fetcher.put(post)
+
+    The callback is called with every post that is fetched and the errback
+    with every post (and its error) that could not be fetched, from the
+    worker threads, once the failure has been recorded on the post. The
+    workers are started on the first put, and join waits for every post,
+    including posts waiting to be retried.
+    """
+
+    def __init__(self, workers=None, retries=None, delay=None, maxsize=None,
+                 callback=None, errback=None):
+        self.workers  = workers or settings.fetch.workers
+        self.retries  = settings.fetch.retries if retries is None else retries
+        self.delay    = settings.fetch.delay if delay is None else delay
+        self.maxsize  = maxsize or settings.fetch.maxsize
+        self.callback = callback
+        self.errback  = errback
+        self.counts   = Counter()
+        self.pool     = None
+        self.retrier  = None
+        self.waiting  = []          # Heap of (due, seq, post, attempt)
+        self.sequence = count()     # Breaks ties between posts in the heap
+        self.pending  = 0           # Posts that are queued, fetching or waiting
+        self.closed   = False
+        self.cond     = threading.Condition()
+
+    def start(self):
+        """
+        Starts the workers and the retry thread (if not already started).
+        """
+        with self.cond:
+            if self.pool is not None:
+                return self
+
+            self.closed = False
+            self.pool   = WorkerPool(self.execute, self.workers, self.maxsize, name="fetch")
+            self.pool.start()
+
+            self.retrier = threading.Thread(target=self.retry_loop, name="fetch-retry")
+            self.retrier.daemon = True
+            self.retrier.start()
+
+        return self
+
+    def put(self, post):
+        """
+        Queues a wrangled post to be fetched, blocking if the queue is full.
+        """
+        self.start()
+        with self.cond:
+            self.pending += 1
+        self.pool.put((post, 0))
+
+    def execute(self, item):
+        """
+        Fetches the webpage of a post, scheduling a retry on transient errors.
+        """
+        post, attempt = item
+        outcome = 'errors'
+
+        try:
+            try:
+                post.fetch()
+            except FetchError as e:
+                if attempt < self.retries and retryable(e):
+                    outcome = 'retried'
+                else:
+                    post.failed(e, permanent=not retryable(e))
+                    if self.errback is not None:
+                        self.errback(post, e)
+            else:
+                outcome = 'fetched'
+                if self.callback is not None:
+                    self.callback(post)
+        finally:
+            with self.cond:
+                self.counts[outcome] += 1
+                if outcome == 'retried':
+                    due = time.time() + self.delay * (2 ** attempt)
+                    heapq.heappush(self.waiting, (due, next(self.sequence), post, attempt+1))
+                else:
+                    self.pending -= 1
+                self.cond.notify_all()
+
+    def next_retry(self):
+        """
+        Blocks until a post is due to be retried and returns it, or returns
+        None once the fetcher is closed. Must be called holding the condition.
+        """
+        while True:
+            if not self.waiting:
+                if self.closed:
+                    return None
+                self.cond.wait()
+                continue
+
+            delay = self.waiting[0][0] - time.time()
+            if delay > 0:
+                self.cond.wait(delay)
+                continue
+
+            due, seq, post, attempt = heapq.heappop(self.waiting)
+            return (post, attempt)
+
+    def retry_loop(self):
+        """
+        The run loop of the retry thread, which puts posts back on the queue
+        of the workers once their delay has passed.
+        """
+        while True:
+            with self.cond:
+                item = self.next_retry()
+            if item is None:
+                return
+
+            try:
+                self.pool.put(item)
+            except Exception:
+                # The pool has failed and join will raise its error.
+                with self.cond:
+                    self.pending -= 1
+                    self.cond.notify_all()
+
+    def join(self):
+        """
+        Waits for every post to be fetched (or to fail every retry), then
+        stops the workers. Raises the exception of a failed worker, if any.
+        The fetcher can be started again afterwards.
+        """
+        if self.pool is None:
+            return
+
+        with self.cond:
+            while self.pending and self.pool.error is None:
+                self.cond.wait(1.0)
+
+            # Don't wait to retry posts once the workers have failed.
+            if self.pool.error is not None:
+                self.waiting = []
+            self.closed = True
+            self.cond.notify_all()
+
+        pool, self.pool = self.pool, None
+        self.retrier.join()
+        self.retrier = None
+        pool.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, value, tb):
+        try:
+            self.join()
+        except Exception:
+            # Do not mask an exception raised by the producer.
+            if typ is None:
+                raise
+
+
+##########################################################################
+## Fetch Queue Worker
+##########################################################################
+
+class FetchWorker(object):
+    """
+    Drains the persistent fetch queue, fetching the webpages of the queued
+    posts on a pool of worker threads. Usage:
+
+        >>> worker = FetchWorker(workers=8)
+        >>> counts = worker.drain()
+
+    Tasks are leased atomically, so any number of workers (in any number of
+    processes) can drain the queue at once. A leased task is not due again
+    until its lease expires; it is deleted once fetched, or rescheduled with
+    exponential backoff if the fetch failed with a transient error.
+    """
+
+    def __init__(self, workers=None, lease=None, name=None):
+        self.workers = workers or settings.fetch.workers
+        self.lease   = lease or settings.fetch.lease
+        self.name    = name or "{}:{}".format(socket.gethostname(), os.getpid())
+        self.counts  = Counter()
+        self.lock    = threading.Lock()
+
+    def acquire(self, now=None):
+        """
+        Leases the task that has been due the longest, returning None if no
+        tasks are due.
+        """
+        now = now or datetime.utcnow()
+        return FetchTask.objects(failed=False, due__lte=now).order_by('due').modify(
+            new=True, set__due=now + timedelta(seconds=self.lease),
+            set__worker=self.name,
+        )
+
+    def complete(self, task):
+        """
+        Removes a fetched task from the queue.
+        """
+        task.delete()
+
+    def fail(self, task, exception, now=None):
+        """
+        Reschedules a task that could not be fetched with a delay that
+        doubles on every attempt, or marks it as failed if the error is not
+        transient or the task has no retries left.
+        """
+        now = now or datetime.utcnow()
+        task.attempts += 1
+        task.error = unicode(exception)[:1024]
+
+        if task.attempts > settings.fetch.retries or not retryable(exception):
+            task.failed = True
+            if isinstance(task.post, Post):
+                PostWrangler(task.post).failed(exception, permanent=not retryable(exception))
+        else:
+            delay = settings.fetch.delay * (2 ** (task.attempts - 1))
+            task.due = now + timedelta(seconds=delay)
+
+        task.save()
+
+    def execute(self, task):
+        """
+        Fetches the webpage of the post of a leased task.
+        """
+        if not isinstance(task.post, Post):
+            # The post has been deleted since it was queued.
+            outcome = 'missing'
+            self.complete(task)
+        else:
+            try:
+                PostWrangler(task.post).fetch()
+                outcome = 'fetched'
+                self.complete(task)
+            except FetchError as e:
+                self.fail(task, e)
+                outcome = 'failed' if task.failed else 'retried'
+
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def drain(self, limit=None, forever=False, wait=5):
+        """
+        Leases due tasks and fetches them until no more tasks are due (or
+        the limit is reached), then returns the counts. If forever is True,
+        waits for more tasks to become due instead of returning.
+        """
+        leased = 0
+        with WorkerPool(self.execute, self.workers, name="fetch") as pool:
+            while limit is None or leased < limit:
+                task = self.acquire()
+                if task is None:
+                    if not forever:
+                        break
+                    time.sleep(wait)
+                    continue
+
+                pool.put(task)
+                leased += 1
+
+        return self.counts
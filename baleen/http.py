@@ -0,0 +1,439 @@
+# baleen.http
+# HTTP utilities for downloading feeds and web pages.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 11:02:17 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: http.py [] benjamin@bengfort.com $
+
+"""
+HTTP utilities for downloading feeds and web pages.
+
+Downloads are bounded by three budgets: a connect timeout, a read timeout
+(the maximum time between bytes from the server) and a total deadline for
+the entire download. None of these rely on signals, so downloads can be
+safely performed from worker threads, pipeline stages, or subprocesses.
+
+All downloads share a pooled session per process so that connections to
+the same host are kept alive and reused rather than opening a new TCP and
+TLS connection for every request. The pool size is the number of idle
+connections kept alive per host; the pools never block, since a request
+waiting on a pool has no deadline (and redirects open connections to other
+hosts), so the number of requests to a host is capped by its limits below.
+
+Requests are also polite: every host has a token bucket that limits the
+rate of requests to it, a cap on the number of requests in flight to it,
+and honors the Retry-After header of 429 (Too Many Requests) and 503
+responses by holding back all requests to that host until the time given.
+
+Downloads can also be limited by the type and size of the response, e.g. so
+that a post that links to a video or an endless page is aborted as soon as
+its headers (or the first bytes over the limit) are received, rather than
+being read into memory in its entirety.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import time
+import baleen
+import requests
+import threading
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from email.utils import parsedate_tz, mktime_tz
+from requests.adapters import HTTPAdapter
+from urlparse import urlparse
+
+from baleen.config import settings
+from baleen.exceptions import ContentError, TimeoutError
+from baleen.utils.timez import Deadline
+
+
+##########################################################################
+## Module Constants
+##########################################################################
+
+CHUNK_SIZE = 16384  # Number of bytes to read between deadline checks
+THROTTLED  = {429, 503}  # Status codes that may include a Retry-After
+
+_session = None     # The shared session of the current process
+_hosts   = None     # The politeness limits of the current process
+_pid     = None     # The process the shared state was created in
+_lock    = threading.Lock()
+
+
+##########################################################################
+## Session Management
+##########################################################################
+
+def create_session():
+    """
+    Creates a session whose adapters keep a pool of connections per host,
+    keeping up to the configured number of idle connections to each host.
+    Requests never wait for a pooled connection; when all of the pooled
+    connections to a host are busy (e.g. after a redirect) a new one is
+    opened and then discarded rather than returned to the full pool.
+    """
+    session = requests.Session()
+    session.headers['User-Agent'] = settings.http.user_agent.format(
+        version=baleen.get_version()
+    )
+
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, HTTPAdapter(
+            pool_connections=settings.http.pool_hosts,
+            pool_maxsize=settings.http.pool_maxsize,
+            pool_block=False,
+        ))
+
+    return session
+
+
+def _process_state():
+    """
+    Returns the shared session and host limits, creating them on first use.
+    Sockets and locks can't be shared across a fork, so each process creates
+    its own session and hosts.
+    """
+    global _session, _hosts, _pid
+
+    with _lock:
+        if _session is None or _pid != os.getpid():
+            _session = create_session()
+            _hosts   = Hosts()
+            _pid     = os.getpid()
+        return _session, _hosts
+
+
+def session():
+    """
+    Returns the shared session of the current process.
+    """
+    return _process_state()[0]
+
+
+def hosts():
+    """
+    Returns the politeness limits of the current process.
+    """
+    return _process_state()[1]
+
+
+##########################################################################
+## Politeness
+##########################################################################
+
+def hostname(url):
+    """
+    Returns the (lowercase) host name of the url, used to group requests.
+    """
+    return (urlparse(url or "").hostname or "").lower()
+
+
+def interleave(items, key=hostname):
+    """
+    Reorders the items (urls by default) so that consecutive items belong
+    to different hosts, taking one item from each host in turn. The order
+    of the items of the same host is preserved.
+    """
+    groups = OrderedDict()
+    for item in items:
+        groups.setdefault(key(item), deque()).append(item)
+
+    while groups:
+        for name in list(groups):
+            yield groups[name].popleft()
+            if not groups[name]:
+                del groups[name]
+
+
+def retry_after(response, default=None):
+    """
+    Returns the number of seconds to wait from the Retry-After header of a
+    response, which is either a number of seconds or an HTTP date. Returns
+    the default if the header is missing or can't be parsed.
+    """
+    value = response.headers.get('retry-after')
+    if not value:
+        return default
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    date = parsedate_tz(value)
+    if date is None:
+        return default
+    return max(0.0, mktime_tz(date) - time.time())
+
+
+class Host(object):
+    """
+    The politeness limits of a single host: a token bucket that allows a
+    burst of requests and then refills at the given rate (per second), a
+    maximum number of requests in flight, and a time before which no
+    requests may be made at all (e.g. from a Retry-After header). Usage:
+
+        >>> with host.limit(deadline):
+        ...     response = session.get(url)
+    """
+
+    def __init__(self, name, rate=1.0, burst=4, inflight=4):
+        self.name      = name
+        self.rate      = float(rate)
+        self.burst     = burst
+        self.maxflight = inflight
+        self.inflight  = 0
+        self.tokens    = float(burst)
+        self.updated   = time.time()
+        self.until     = 0.0
+        self.cond      = threading.Condition()
+
+    def delay(self):
+        """
+        Refills the bucket and returns the number of seconds until a request
+        may be made, or None if it must wait for a request to complete. Must
+        be called while holding the condition.
+        """
+        now = time.time()
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.inflight >= self.maxflight:
+            return None
+        if now < self.until:
+            return self.until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, deadline=None):
+        """
+        Blocks until a request may be made to the host. Raises TimeoutError
+        if the deadline expires while waiting, or right away if the host is
+        held back for longer than the time remaining to the deadline.
+        """
+        with self.cond:
+            while True:
+                wait = self.delay()
+                if wait == 0.0:
+                    self.tokens   -= 1
+                    self.inflight += 1
+                    return
+
+                if deadline is not None:
+                    held = self.until - time.time()
+                    remaining = deadline.remaining
+                    if remaining is not None and held >= remaining:
+                        raise TimeoutError(
+                            "Host {} is held back for {:0.0f} more seconds".format(
+                                self.name, held
+                            )
+                        )
+                    wait = deadline.timeout(wait)
+                self.cond.wait(wait)
+
+    def release(self):
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify_all()
+
+    def backoff(self, seconds):
+        """
+        Holds back all requests to the host for the given number of seconds.
+        """
+        with self.cond:
+            seconds = min(seconds, settings.http.max_retry_after)
+            self.until = max(self.until, time.time() + seconds)
+
+    @contextmanager
+    def limit(self, deadline=None):
+        self.acquire(deadline)
+        try:
+            yield self
+        finally:
+            self.release()
+
+
+class Hosts(object):
+    """
+    Thread-safe registry of the politeness limits of every host.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.lock  = threading.Lock()
+
+    def __getitem__(self, url):
+        name = hostname(url)
+        with self.lock:
+            if name not in self.hosts:
+                self.hosts[name] = Host(
+                    name,
+                    rate=settings.http.host_rate,
+                    burst=settings.http.host_burst,
+                    inflight=settings.http.host_inflight,
+                )
+            return self.hosts[name]
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def get(url, headers=None, deadline=None, connect=None, read=None,
+        max_bytes=None, accept=None):
+    """
+    Performs an HTTP GET request for the url and downloads the body of the
+    response within the deadline, which is checked between every chunk
+    read from the server and also bounds the wait for the host. If no
+    deadline is passed in, a new deadline is created from the timeout
+    setting. The connect and read timeouts default to the settings, and
+    are bounded by the time remaining to the deadline.
+
+    If max_bytes is given, the download is aborted as soon as the body is
+    larger than max_bytes. If accept is a collection of mimetypes, the body
+    of a successful response of any other content type is not downloaded.
+    Both raise a ContentError.
+
+    Requests wait for the politeness limits of the host. If the host asks
+    us to back off (429 or 503 with a Retry-After), the request is retried
+    after the delay as long as it fits within the deadline.
+
+    Returns the response with its content already downloaded and its
+    connection released back to the pool. Raises a TimeoutError if the
+    deadline expires or a requests exception on error.
+    """
+    host = hosts()[url]
+    if deadline is None:
+        deadline = Deadline(settings.timeout)
+
+    for attempt in xrange(settings.http.retries + 1):
+        with host.limit(deadline):
+            response = fetch(url, headers, deadline, connect, read, max_bytes, accept)
+
+        if response.status_code not in THROTTLED:
+            break
+
+        default = settings.http.backoff if response.status_code == 429 else None
+        delay   = retry_after(response, default)
+        if delay is None:
+            break
+
+        host.backoff(delay)
+        remaining = deadline.remaining
+        if remaining is not None and delay >= remaining:
+            break
+
+    return response
+
+
+def fetch(url, headers, deadline, connect=None, read=None, max_bytes=None, accept=None):
+    """
+    Performs a single request and downloads the body within the deadline.
+    """
+    timeout = (
+        deadline.timeout(connect or settings.connect_timeout),
+        deadline.timeout(read or settings.read_timeout),
+    )
+
+    response = session().get(url, headers=headers, timeout=timeout, stream=True)
+    try:
+        check(response, max_bytes, accept)
+        response._content = download(response, deadline, max_bytes)
+        response._content_consumed = True
+    except BaseException:
+        abort(response)
+        raise
+
+    response.close()
+    return response
+
+
+def abort(response):
+    """
+    Closes a response whose body was not entirely read. Closing the response
+    alone only closes its body and never returns the connection to the pool,
+    leaking a slot of the host's pool. Instead the connection is closed (so
+    that its unread data is never read by another request) and released back
+    to the pool, which reconnects it when it is next used.
+    """
+    response.close()
+    if response.raw is None:
+        return
+
+    connection = getattr(response.raw, '_connection', None)
+    if connection is not None:
+        connection.close()
+    response.raw.release_conn()
+
+
+def mimetype(response):
+    """
+    Returns the (lowercase) mimetype of the response without its parameters
+    or None if the response has no content type.
+    """
+    value = response.headers.get('content-type') or ""
+    return value.split(";", 1)[0].strip().lower() or None
+
+
+def charset(response):
+    """
+    Returns the (lowercase) charset parameter of the content type of the
+    response or None if it has none. Unlike the encoding of requests, text
+    types without a charset are not assumed to be ISO-8859-1, so that the
+    encoding declared by an XML document is used instead.
+    """
+    value = response.headers.get('content-type') or ""
+    for param in value.split(";")[1:]:
+        key, _, val = param.partition("=")
+        if key.strip().lower() == 'charset':
+            return val.strip().strip("'\"").lower() or None
+    return None
+
+
+def check(response, max_bytes=None, accept=None):
+    """
+    Checks the headers of a response before its body is downloaded, raising
+    a ContentError if the body is declared to be larger than max_bytes or
+    if a successful response is not one of the accepted mimetypes. Responses
+    without a content type are accepted, since many servers omit it.
+    """
+    if max_bytes is not None:
+        length = response.headers.get('content-length')
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ContentError(
+                "{} bytes is larger than {} bytes".format(length, max_bytes)
+            )
+
+    if accept is not None and response.status_code < 400:
+        mtype = mimetype(response)
+        if mtype is not None and mtype not in accept:
+            raise ContentError("{} is not an accepted type".format(mtype))
+
+
+def download(response, deadline, max_bytes=None):
+    """
+    Reads the body of a streaming response, checking the deadline between
+    each chunk so that slow servers cannot hold the download open forever.
+    The download is aborted once it is larger than max_bytes, since the
+    Content-Length header may be missing or wrong.
+    """
+    chunks = []
+    size   = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        deadline.check()
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise ContentError(
+                "body is larger than {} bytes".format(max_bytes)
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
@@ -18,18 +18,27 @@ The ingestion runner that implements ingestion for a collection of feeds.
 ##########################################################################
 
 import uuid
+import baleen
+import logging
+import threading
+import multiprocessing
 
+from baleen import http
+from baleen import polling
 from baleen.opml import OPML
 from baleen.exceptions import *
 from baleen import models as db
 from baleen.feed import FeedSync
+from baleen.fetch import PostFetcher
 from baleen.config import settings
 from baleen.utils.timez import Timer
-from baleen.wrangle import PostWrangler
+from baleen.wrangle import PostWrangler, entry_url
 from baleen.utils.logger import LoggingMixin
+from baleen.utils.workers import WorkerPool, Stage, Pipeline
 from baleen.utils.decorators import memoized
 
 from datetime import datetime
+from mongoengine import Q
 from collections import Counter
 
 
@@ -49,6 +58,49 @@ def stype(obj):
     return type(obj).__name__
 
 
+def feed_shard(feed, shards):
+    """
+    Returns the shard (0 to shards-1) that the Feed belongs to by hashing
+    its id, so that every process ingesting the same shard agrees.
+    """
+    return int(str(feed.id), 16) % shards
+
+
+def shard_ingest(shards, klass=None, **options):
+    """
+    Ingests the feeds with one process per shard on the local machine, each
+    using the same job id so that their counts are merged into one Job.
+    Blocks until all of the processes are complete and returns the job id.
+    """
+    klass = klass or MongoIngestor
+    jobid = options.pop('jobid', None) or uuid.uuid1()
+
+    processes = [
+        multiprocessing.Process(
+            target=_ingest_shard, args=(klass, jobid),
+            kwargs=dict(options, shard=shard, shards=shards),
+            name="shard-{}".format(shard),
+        ) for shard in xrange(shards)
+    ]
+
+    for process in processes: process.start()
+    for process in processes: process.join()
+    return jobid
+
+
+def _ingest_shard(klass, jobid, **options):
+    """
+    Target of a shard ingestion process (reconnects after the fork). The
+    process exits without running the exit handlers, so buffered log
+    records are flushed before it does.
+    """
+    db.connect(reconnect=True)
+    try:
+        klass(**options).ingest(jobid=jobid)
+    finally:
+        logging.shutdown()
+
+
 ##########################################################################
 ## Base Ingestion Class
 ##########################################################################
@@ -62,6 +114,19 @@ class Ingestor(LoggingMixin):
     either get feeds from a list of strings, an OPML file or a Mongo query.
 
     Ingestors also perform logging and exception handling.
+
+    If more than one worker is specified (either as an option or by the
+    workers setting), feeds are synchronized concurrently by a bounded pool
+    of threads; the counts and errors are shared and updated under a lock.
+    Every worker blocks on its own feed download, so concurrency is bounded
+    by the number of OS threads the process can run: use workers in the
+    tens or hundreds, not the thousands (or shard the feeds across
+    processes with shard_ingest).
+
+    The webpages of saved posts are fetched (if fetch_html is set) by a
+    separate PostFetcher with its own workers and retry queue, so that feed
+    synchronization never waits on a page download; ingest waits for the
+    fetcher to finish before the job is finished.
     """
 
     def __init__(self, feeds=None, **options):
@@ -70,18 +135,45 @@ class Ingestor(LoggingMixin):
         self.options = options      # Any other options passed in
         self._feeds  = feeds        # Allows pass in feed collection
         self.errors  = Counter()    # Count the number of error types
+        self.lock    = threading.RLock() # Guards counts from worker threads
+
+    @property
+    def workers(self):
+        return self.options.get('workers', settings.workers)
+
+    @property
+    def batch(self):
+        return self.options.get('batch', settings.batch)
+
+    @property
+    def stream(self):
+        return self.options.get('stream', settings.stream)
+
+    @property
+    def deferred(self):
+        return self.options.get('deferred', settings.fetch.deferred)
 
     @property
     def name(self):
         return self.__class__.__name__
 
+    @memoized
+    def fetcher(self):
+        """
+        The concurrent fetcher of the webpages of saved posts.
+        """
+        return PostFetcher(
+            workers=self.options.get('fetchers', settings.fetch.workers),
+            callback=self.post_fetched, errback=self.fetch_error,
+        )
+
     @memoized
     def counts(self):
         """
         Keep track of counts and ensure zero keys exist.
         """
         counts = Counter()
-        for key in ('feeds', 'posts', 'errors', 'feed_error'):
+        for key in ('feeds', 'unchanged', 'posts', 'skipped', 'errors', 'feed_error'):
             counts[key] = 0
         return counts
 
@@ -97,6 +189,16 @@ class Ingestor(LoggingMixin):
             "No feeds specified for {} ingestion!".format(self.name)
         )
 
+    def schedule(self):
+        """
+        Yields (index, feed sync) pairs for every feed, interleaved by host so
+        that feeds from the same host are spread out rather than fetched back
+        to back, which would otherwise wait on the politeness limits.
+        """
+        syncs = FeedSync.factory(self.feeds())
+        key   = lambda fsync: http.hostname(fsync.url)
+        return enumerate(http.interleave(syncs, key))
+
     def started(self):
         """
         Run when the ingestor is started and used for logging. Subclasses can
@@ -121,8 +223,8 @@ class Ingestor(LoggingMixin):
         """
         # Notify the results
         results = (
-            "Processed {feeds} feeds ({timer}) "
-            "{posts} posts with {errors} errors"
+            "Processed {feeds} feeds ({unchanged} unchanged) ({timer}) "
+            "{posts} posts ({skipped} skipped) with {errors} errors"
         ).format(
             timer=self.timer, **self.counts
         )
@@ -137,63 +239,213 @@ class Ingestor(LoggingMixin):
         Runs the ingestion process by iterating over the feeds, synchronizing
         and then wrangling posts into the database as well as fetching pages.
         """
-        for idx, fsync in enumerate(FeedSync.factory(self.feeds())):
-            try:
-                self.process_feed(fsync)
-                self.counts['feeds'] += 1
-            except SynchronizationError as e:
-                self.counts['feed_error'] += 1
-                self.errors[stype(e)] += 1
-                self.logger.error(
-                    u"Error on Feed {} ({}): {}".format(
-                        idx+1, fsync.feed, unicode(e)
-                    )
-                )
-
-    def process_feed(self, fsync):
+        # Ensure the counts and the fetcher exist before any worker threads
+        # access them, so that all of the workers share the same ones.
+        self.counts
+        self.fetcher
+
+        feeds = self.schedule()
+        if self.workers > 1:
+            pool = WorkerPool(self.process_sync, self.workers, name="feed")
+            pool.map(feeds)
+        else:
+            for item in feeds:
+                self.process_sync(item)
+
+    def process_sync(self, item, response=None):
+        """
+        Processes a single (index, feed sync) pair and catches exceptions.
+        This method is called concurrently if there are multiple workers.
+        """
+        idx, fsync = item
+        try:
+            self.process_feed(fsync, response)
+            self.feed_synced(fsync)
+        except SynchronizationError as e:
+            self.sync_error(idx, fsync, e)
+
+    def feed_synced(self, fsync):
+        """
+        Counts a synchronized feed, and whether its body was unchanged since
+        the last fetch (in which case none of its entries were processed).
+        """
+        with self.lock:
+            self.counts['feeds'] += 1
+            if fsync.unchanged:
+                self.counts['unchanged'] += 1
+
+    def process_feed(self, fsync, response=None):
         """
         Synchronizes a feed and catches exceptions
         """
-        factory = PostWrangler.factory(fsync.entries(), fsync.feed)
+        if self.stream:
+            entries = fsync.stream(response=response, known=self.known)
+            factory = PostWrangler.factory(entries, fsync.feed)
+        else:
+            entries = fsync.entries(response=response)
+            factory = self.wranglers(fsync, entries)
+
+        if self.batch > 1:
+            return self.process_batches(fsync, factory)
+
         for idx, post in enumerate(factory):
             try:
                 self.process_post(post)
-                self.counts["posts"] += 1
+                with self.lock:
+                    self.counts["posts"] += 1
             except WranglingError as e:
-                self.counts["errors"] += 1
-                self.errors[stype(e)] += 1
-                self.logger.error(
-                    u"Post Error for feed {} on entry {}: {}".format(
-                        fsync.feed, idx, unicode(e)
-                    )
-                )
+                self.post_error(fsync, idx, e)
+
+    def known(self, entries):
+        """
+        Returns a list of flags that are True for the entries that are already
+        stored, counting them as skipped. Used to skip the known entries of
+        streamed feeds, which are looked up a chunk of entries at a time.
+        """
+        urls  = PostWrangler.known(entries)
+        flags = [entry_url(entry) in urls for entry in entries]
+
+        with self.lock:
+            self.counts['skipped'] += sum(flags)
+        return flags
+
+    def process_batches(self, fsync, factory):
+        """
+        Wrangles the posts of a feed without saving them, then saves them in
+        unordered bulk inserts of the batch size rather than one at a time.
+        """
+        batch = []
+        for idx, post in enumerate(factory):
+            try:
+                post.wrangle(save=False)
+                batch.append((fsync, idx, post))
+            except WranglingError as e:
+                self.post_error(fsync, idx, e)
+
+            if len(batch) >= self.batch:
+                self.persist_batch(batch)
+                batch = []
+
+        if batch:
+            self.persist_batch(batch)
+
+    def persist_batch(self, batch):
+        """
+        Bulk inserts a batch of (feed sync, index, post) triples, reporting
+        errors (e.g. duplicates) per post, then queues every saved post to
+        be fetched.
+        """
+        try:
+            errors = PostWrangler.bulk_save([post for fsync, idx, post in batch])
+        except WranglingError as e:
+            errors = [e] * len(batch)
+
+        for (fsync, idx, post), error in zip(batch, errors):
+            if error is not None:
+                self.post_error(fsync, idx, error)
+                continue
+
+            with self.lock:
+                self.counts["posts"] += 1
+            self.fetch_post(post)
+
+    def wranglers(self, fsync, entries):
+        """
+        Returns post wranglers for the entries of the feed that are not
+        already stored, counting the known entries as skipped. Known entries
+        are dropped before they are wrangled or saved.
+        """
+        known = PostWrangler.known(entries)
+        fresh = [entry for entry in entries if entry_url(entry) not in known]
+
+        with self.lock:
+            self.counts['skipped'] += len(entries) - len(fresh)
+        return PostWrangler.factory(fresh, fsync.feed)
 
     def process_post(self, post):
         """
         Wrangles a post from a single feed and catches exceptions
         """
         post.wrangle()
-        if settings.fetch_html:
-            try:
-                post.fetch()
-            except FetchError as e:
-                self.counts["fetch_error"] += 1
-                self.errors[stype(e)] += 1
-                self.logger.error(
-                    u"Fetch Error for post \"{}\" ({}): {}".format(
-                        post.post.title, post.post.url, unicode(e)
-                    )
-                )
-
-    def ingest(self):
+        self.fetch_post(post)
+
+    def fetch_post(self, post):
+        """
+        Queues a saved post on the fetcher to fetch its webpage if required,
+        or on the persistent fetch queue if fetching is deferred to the
+        `baleen fetch` workers.
+        """
+        if not settings.fetch_html:
+            return
+
+        if not self.deferred:
+            return self.fetcher.put(post)
+
+        try:
+            post.enqueue()
+            with self.lock:
+                self.counts["queued"] += 1
+        except FetchError as e:
+            self.fetch_error(post, e)
+
+    def post_fetched(self, post):
+        """
+        Counts a post whose webpage was fetched (called by the fetcher).
+        """
+        with self.lock:
+            self.counts["fetched"] += 1
+
+    def sync_error(self, idx, fsync, exception):
+        """
+        Counts and logs an error synchronizing the feed at the given index.
+        """
+        with self.lock:
+            self.counts['feed_error'] += 1
+            self.errors[stype(exception)] += 1
+        self.logger.error(
+            u"Error on Feed {} ({}): {}".format(
+                idx+1, fsync.feed, unicode(exception)
+            )
+        )
+
+    def post_error(self, fsync, idx, exception):
+        """
+        Counts and logs an error wrangling the entry at the given index.
+        """
+        with self.lock:
+            self.counts["errors"] += 1
+            self.errors[stype(exception)] += 1
+        self.logger.error(
+            u"Post Error for feed {} on entry {}: {}".format(
+                fsync.feed, idx, unicode(exception)
+            )
+        )
+
+    def fetch_error(self, post, exception):
+        """
+        Counts and logs an error fetching the webpage of a post.
+        """
+        with self.lock:
+            self.counts["fetch_error"] += 1
+            self.errors[stype(exception)] += 1
+        self.logger.error(
+            u"Fetch Error for post \"{}\" ({}): {}".format(
+                post.post.title, post.post.url, unicode(exception)
+            )
+        )
+
+    def ingest(self, jobid=None):
         """
         Subclasses do not typically override the ingest method. Instead they
         will override the process hooks for start, failed, and finish,  or the
         process method directly.
+
+        A job id can be passed in, e.g. so that all shards share one job.
         """
         # Set a unique job id for every time run is called.
         # The job id is based on the hostname and a time sequence.
-        self.jobid = uuid.uuid1()
+        # Shards of a single job are all passed the same job id instead.
+        self.jobid = uuid.UUID(str(jobid)) if jobid else uuid.uuid1()
 
         # Call the started hook for logging and notification.
         self.started()
@@ -201,7 +453,11 @@ class Ingestor(LoggingMixin):
         # Time how long it takes to perform the processing
         with Timer() as self.timer:
             try:
-                self.process()
+                try:
+                    self.process()
+                finally:
+                    # Wait for the webpages of the saved posts to be fetched.
+                    self.fetcher.join()
             except Exception as e:
                 # If something goes wrong, call the failed hook, then raise.
                 self.failed(e)
@@ -219,28 +475,87 @@ class MongoIngestor(Ingestor):
     """
     Ingests feeds that are stored in the database.
     This type of ingestor also tracks information into the database.
+
+    The active feeds can be partitioned into shards by the hash of their id
+    so that several processes (on one or many machines) can each ingest one
+    shard of the feeds. Every shard must be passed the same shards option
+    and job id to ingest and a different shard option; the counts and errors
+    of each shard are merged into one Job record, finished by the last shard.
     """
 
+    @property
+    def shards(self):
+        return self.options.get('shards', 1)
+
+    @property
+    def shard(self):
+        return self.options.get('shard', 0)
+
+    @property
+    def sharded(self):
+        return self.shards > 1
+
+    @property
+    def due(self):
+        return self.options.get('due', False)
+
     def feeds(self):
         """
-        Returns an iterator of all active feeds from the database
+        Returns an iterator of all active feeds from the database. If the due
+        option is set, only feeds whose next poll is due are returned.
         """
-        for feed in db.Feed.objects(active=True):
+        feeds = db.Feed.objects(active=True)
+        if self.due:
+            feeds = feeds.filter(
+                Q(next_poll=None) | Q(next_poll__lte=datetime.utcnow())
+            )
+
+        for feed in feeds:
+            if self.sharded and feed_shard(feed, self.shards) != self.shard:
+                continue
             yield feed
 
+    def sync_error(self, idx, fsync, exception):
+        """
+        Backs off the polling interval of a feed that failed to synchronize
+        and extends its streak of consecutive errors.
+        """
+        super(MongoIngestor, self).sync_error(idx, fsync, exception)
+        if fsync.type == FeedSync.MODEL:
+            polling.backoff(fsync.feed)
+            fsync.feed.sync_errors = (fsync.feed.sync_errors or 0) + 1
+            fsync.feed.save()
+
     def started(self):
         """
         Save a record about the job start to the database.
         """
         super(MongoIngestor, self).started()
-        self.job = db.Job(jobid=self.jobid, name=self.name)
-        self.job.save()
+        if not self.sharded:
+            self.job = db.Job(jobid=self.jobid, name=self.name)
+            self.job.save()
+            return
+
+        # The first shard to start creates the job record.
+        now = datetime.now()
+        self.job = db.Job.objects(jobid=self.jobid).modify(
+            upsert=True, new=True,
+            set_on_insert__name=self.name,
+            set_on_insert__shards=self.shards,
+            set_on_insert__failed=False,
+            set_on_insert__version=baleen.get_version(),
+            set_on_insert__started=now,
+            set_on_insert__updated=now,
+        )
 
     def failed(self, exception):
         """
         Save information about the failure to the database.
         """
         super(MongoIngestor, self).failed(exception)
+        if self.sharded:
+            return self.merge(failed=True, reason=unicode(exception))
+
         self.job.failed = True
         self.job.reason = unicode(exception)
         self.job.finished = datetime.now()
@@ -251,16 +566,269 @@ class MongoIngestor(Ingestor):
         Update the job record in the database.
         """
         super(MongoIngestor, self).finished()
+        if self.sharded:
+            return self.merge()
+
         self.job.reason = u"OK"
         self.job.finished = datetime.now()
         self.job.counts = self.counts
         self.job.errors = self.errors
-        self.job.totals = {
+        self.job.totals = self.totals()
+        self.job.save()
+
+    def merge(self, failed=False, reason=None):
+        """
+        Atomically adds the counts and errors of this shard to the job and
+        marks the shard as completed. The last shard to complete finishes
+        the job record.
+        """
+        update = self.shard_update(failed, reason)
+        self.job = db.Job.objects(jobid=self.jobid).modify(new=True, __raw__=update)
+        if len(self.job.completed) < self.job.shards:
+            return
+
+        if not self.job.failed:
+            self.job.reason = u"OK"
+        self.job.finished = datetime.now()
+        self.job.totals = self.totals()
+        self.job.save()
+
+    def shard_update(self, failed=False, reason=None):
+        """
+        Returns the raw update that merges this shard into the job record.
+        """
+        # Map keys can't be transformed by mongoengine, so use a raw update.
+        update = {
+            '$addToSet': {'completed': self.shard},
+            '$inc': {
+                '{}.{}'.format(field, key): val
+                for field, counts in (('counts', self.counts), ('errors', self.errors))
+                for key, val in counts.items()
+            },
+        }
+
+        if failed:
+            update['$set'] = {'failed': True, 'reason': reason}
+        return update
+
+    def totals(self):
+        """
+        Returns the total number of documents in the database.
+        """
+        return {
             "feeds": db.Feed.objects.count(),
             "posts": db.Post.objects.count(),
             "jobs": db.Job.objects.count(),
         }
-        self.job.save()
+
+##########################################################################
+## Pipelined Ingestion Classes
+##########################################################################
+
+class PipelineIngestor(Ingestor):
+    """
+    Ingests feeds through a pipeline of stages connected by bounded queues:
+
+        fetch -> parse -> wrangle -> persist
+
+    Each stage has its own number of workers (set by the pipeline settings
+    or by options with the same name as the stage) so that network downloads,
+    CPU bound parsing and wrangling, and database writes do not wait on each
+    other. The bounded queues apply backpressure so a slow stage can't cause
+    the others to buffer without limit. The queue depth and throughput of
+    every stage are logged at a regular interval and when finished.
+    """
+
+    STAGES = ('fetch', 'parse', 'wrangle', 'persist')
+
+    def stage(self, name):
+        """
+        Creates the stage with the given name and its number of workers.
+        """
+        return Stage(
+            name, getattr(self, "{}_stage".format(name)),
+            workers=self.options.get(name, getattr(settings.pipeline, name)),
+            maxsize=self.options.get('maxsize', settings.pipeline.maxsize),
+        )
+
+    def process(self):
+        """
+        Puts every feed onto the pipeline, blocking when the fetch stage is
+        full, then waits for all of the stages to complete.
+        """
+        # Ensure the counts and the fetcher exist before any worker threads
+        # access them, so that all of the workers share the same ones.
+        self.counts
+        self.fetcher
+
+        self.pipeline = Pipeline(*[self.stage(name) for name in self.STAGES])
+        interval = self.options.get('interval', settings.pipeline.interval)
+        finished = threading.Event()
+
+        def monitor():
+            while not finished.wait(interval):
+                self.report()
+
+        reporter = threading.Thread(target=monitor, name="pipeline-monitor")
+        reporter.daemon = True
+        reporter.start()
+
+        # Posts waiting to be bulk inserted by the persist stage.
+        self.pending = []
+
+        try:
+            with self.pipeline:
+                for item in self.schedule():
+                    self.pipeline.put(item)
+
+            batch, self.pending = self.pending, []
+            if batch:
+                self.persist_batch(batch)
+        finally:
+            finished.set()
+
+    def fetch_stage(self, item):
+        """
+        Downloads the feed.
+        """
+        idx, fsync = item
+        try:
+            return [(idx, fsync, fsync.fetch())]
+        except SynchronizationError as e:
+            self.sync_error(idx, fsync, e)
+
+    def parse_stage(self, item):
+        """
+        Parses the downloaded feed and synchronizes it, yielding its entries.
+        """
+        idx, fsync, response = item
+        if self.stream:
+            return self.parse_stream(idx, fsync, response)
+
+        try:
+            entries = fsync.entries(response=response)
+        except SynchronizationError as e:
+            return self.sync_error(idx, fsync, e)
+
+        self.feed_synced(fsync)
+
+        factory = self.wranglers(fsync, entries)
+        return ((fsync, idx, post) for idx, post in enumerate(factory))
+
+    def parse_stream(self, idx, fsync, response):
+        """
+        Yields the entries of the feed as they are parsed, so that they are
+        passed on to the next stage before the rest of the feed is parsed.
+        """
+        entries = fsync.stream(response=response, known=self.known)
+        try:
+            for jdx, post in enumerate(PostWrangler.factory(entries, fsync.feed)):
+                yield (fsync, jdx, post)
+        except SynchronizationError as e:
+            self.sync_error(idx, fsync, e)
+            return
+
+        self.feed_synced(fsync)
+
+    def wrangle_stage(self, item):
+        """
+        Wrangles the entry into a post without saving it.
+        """
+        fsync, idx, post = item
+        try:
+            post.wrangle(save=False)
+            return [item]
+        except WranglingError as e:
+            self.post_error(fsync, idx, e)
+
+    def persist_stage(self, item):
+        """
+        Saves the post to the database then queues it to be fetched if required.
+        If the batch size is set, posts are collected from all of the feeds and
+        bulk inserted once there are enough of them (the rest when finished).
+        """
+        if self.batch > 1:
+            with self.lock:
+                self.pending.append(item)
+                if len(self.pending) < self.batch:
+                    return
+                batch, self.pending = self.pending, []
+            return self.persist_batch(batch)
+
+        fsync, idx, post = item
+        try:
+            post.save()
+        except WranglingError as e:
+            return self.post_error(fsync, idx, e)
+
+        with self.lock:
+            self.counts["posts"] += 1
+
+        self.fetch_post(post)
+
+    def report(self):
+        """
+        Logs the queue depth and throughput of every stage of the pipeline.
+        """
+        self.logger.info(u"{} job {} pipeline: {}".format(
+            self.name, self.jobid, u"; ".join(
+                u"{name} {depth}/{maxsize} queued, {processed} processed "
+                u"({throughput:0.2f}/sec)".format(**stats)
+                for stats in self.pipeline.stats()
+            )
+        ))
+
+    def finished(self):
+        """
+        Reports the final statistics of the pipeline.
+        """
+        self.report()
+        super(PipelineIngestor, self).finished()
+
+
+class PipelineMongoIngestor(PipelineIngestor, MongoIngestor):
+    """
+    Ingests the feeds that are stored in the database through the pipeline,
+    and stores the statistics of every stage on the job record. The stages
+    of every shard are appended to the job, each tagged with its shard.
+    """
+
+    def finished(self):
+        if not self.sharded:
+            self.job.stages = self.pipeline.stats()
+        super(PipelineMongoIngestor, self).finished()
+
+    def shard_update(self, failed=False, reason=None):
+        update = super(PipelineMongoIngestor, self).shard_update(failed, reason)
+        if not failed:
+            update['$push'] = {'stages': {'$each': [
+                dict(stats, shard=self.shard) for stats in self.pipeline.stats()
+            ]}}
+        return update
+
+##########################################################################
+## Ingestion Engines
+##########################################################################
+
+# The Mongo ingestors that can be selected by the engine setting (or the
+# --engine option of the ingest and run commands).
+ENGINES = {
+    'threaded': MongoIngestor,
+    'pipeline': PipelineMongoIngestor,
+}
+
+
+def engine(name=None):
+    """
+    Returns the Mongo ingestor class of the named engine (by default the
+    engine setting), raising a ValueError if there is no such engine.
+    """
+    name = name or settings.engine
+    if name not in ENGINES:
+        raise ValueError("Unknown ingestion engine '{}', use one of {}".format(
+            name, ", ".join(sorted(ENGINES))
+        ))
+    return ENGINES[name]
 
 ##########################################################################
 ## OPML Ingestion Class
@@ -17,11 +17,19 @@ Object Document Models for use with Mongo and mongoengine
 ## Imports
 ##########################################################################
 
+import os
+import gzip
+import zlib
 import baleen
 import hashlib
 import mongoengine as me
 
+from bson import json_util
+from collections import OrderedDict
+from bson.binary import Binary
+from pymongo.errors import OperationFailure
 from datetime import datetime,timedelta
+from dateutil.tz import tzutc
 from baleen.config import settings
 from baleen.utils.timez import humanizedelta
 
@@ -47,20 +55,120 @@ FEEDTYPES = (
     'rss20',
 )
 
+# Binary subtypes (user defined) of the compressed values of string fields
+COMPRESSION_SUBTYPES = {
+    'zlib': 0x80,
+}
+
 ##########################################################################
 ## Helper Functions
 ##########################################################################
 
+def compress(value, compression='zlib'):
+    """
+    Compresses a unicode string into a Binary value whose subtype records
+    the compression that was used.
+    """
+    if compression not in COMPRESSION_SUBTYPES:
+        raise ValueError("Unknown compression '{}'".format(compression))
+    return Binary(
+        zlib.compress(value.encode('utf-8')), COMPRESSION_SUBTYPES[compression]
+    )
+
+
+def decompress(value):
+    """
+    Decompresses a Binary value (created by compress) to a unicode string.
+    """
+    if value.subtype == COMPRESSION_SUBTYPES['zlib']:
+        return zlib.decompress(value).decode('utf-8')
+    raise ValueError("Unknown compression subtype {}".format(value.subtype))
+
+
+def content_size(content):
+    """
+    Returns the size of the (uncompressed) content of a post in UTF-8 bytes.
+    """
+    if not content:
+        return 0
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return len(content)
+
+
+def post_date(post):
+    """
+    Returns the publication date of a post as a naive UTC datetime (as it is
+    stored by Mongo), or None if the post isn't dated. Undated posts are not
+    used for the date of the latest post of a feed.
+    """
+    if post.pubdate is None:
+        return None
+    if post.pubdate.tzinfo is not None:
+        return post.pubdate.astimezone(tzutc()).replace(tzinfo=None)
+    return post.pubdate
+
+
 def connect(**kwargs):
     """
     Wrapper for mongoengine connect - connects with configuration details.
+    If reconnect is True, any existing connection is dropped first (e.g.
+    because connections can't be shared with a process after a fork).
     """
     name = kwargs.pop('name', settings.database.name)
     host = kwargs.pop('host', settings.database.host)
     port = kwargs.pop('port', settings.database.port)
 
+    if kwargs.pop('reconnect', False):
+        me.connection.disconnect()
+
     return me.connect(name, host=host, port=port, **kwargs)
 
+##########################################################################
+## Fields
+##########################################################################
+
+class CompressedStringField(me.StringField):
+    """
+    A string field that is stored compressed (as a Binary value) when the
+    compression database setting is enabled, e.g. for large HTML content.
+
+    Compressed values are decompressed lazily on the first access of the
+    field rather than when the document is loaded, so that queries that
+    don't use the content don't pay for its decompression. Values stored
+    before compression was enabled (or after it was disabled) are plain
+    strings, so both kinds of values can exist in the same collection.
+
+    NOTE: Compressed values can't be matched by queries on the field.
+    """
+
+    def __get__(self, instance, owner):
+        value = super(CompressedStringField, self).__get__(instance, owner)
+        if isinstance(value, Binary):
+            # Cache the decompressed value without marking it as changed.
+            value = decompress(value)
+            instance._data[self.name] = value
+        return value
+
+    def to_python(self, value):
+        # Leave compressed values to be decompressed on access.
+        if isinstance(value, Binary):
+            return value
+        return super(CompressedStringField, self).to_python(value)
+
+    def to_mongo(self, value):
+        compression = settings.database.compression
+
+        if isinstance(value, Binary):
+            if compression:
+                return value
+            value = decompress(value)
+
+        value = super(CompressedStringField, self).to_mongo(value)
+        if compression and value is not None:
+            return compress(value, compression)
+        return value
+
 ##########################################################################
 ## Models
 ##########################################################################
@@ -76,6 +184,16 @@ class Feed(me.DynamicDocument):
     category  = me.StringField(required=True)
     active    = me.BooleanField(default=True)
     fetched   = me.DateTimeField(default=None)
+    rate      = me.FloatField(default=None)     # Posts per hour
+    interval  = me.IntField(default=None)       # Seconds between polls
+    failures  = me.IntField(default=0)          # Consecutive 304s or errors
+    polled    = me.DateTimeField(default=None)  # UTC
+    next_poll = me.DateTimeField(default=None)  # UTC
+    digest    = me.StringField(default=None)    # SHA1 of the last fetched body
+    sync_errors   = me.IntField(default=0)      # Consecutive sync errors
+    post_count    = me.IntField(default=0)      # Number of stored posts
+    content_bytes = me.LongField(default=0)     # UTF-8 bytes of post content
+    last_post     = me.DateTimeField(default=None)  # UTC pubdate of newest post
     created   = me.DateTimeField(default=datetime.now, required=True)
     updated   = me.DateTimeField(default=datetime.now, required=True)
 
@@ -85,6 +203,8 @@ class Feed(me.DynamicDocument):
 
     meta      = {
         'collection': 'feeds',
+        'index_background': True,
+        'indexes': ['category', ('active', 'next_poll'), '-updated'],
     }
 
     @property
@@ -97,12 +217,52 @@ class Feed(me.DynamicDocument):
 
     def count_posts(self):
         """
-        Count the number of associated posts
-
-        TODO: This is very, very slow on Mongo (fix and make better).
+        Count the number of associated posts (uses the feed, pubdate index).
+        Use the post_count field instead unless an exact count is required.
         """
         return Post.objects(feed=self).count()
 
+    def record_posts(self, posts):
+        """
+        Atomically adds newly saved posts to the statistics of the feed: the
+        number of posts, the bytes of their content and the date of the
+        latest post. The statistics are updated in the database with a
+        single update rather than saved, so concurrent ingestors never
+        overwrite each other and the date of the latest post only moves
+        forward.
+        """
+        posts = list(posts)
+        if not posts or self.id is None:
+            return
+
+        update = {'$inc': {
+            'post_count': len(posts),
+            'content_bytes': sum(content_size(post.content) for post in posts),
+        }}
+
+        dates = [date for date in map(post_date, posts) if date is not None]
+        if dates:
+            update['$max'] = {'last_post': max(dates)}
+
+        Feed.objects(id=self.id).update_one(__raw__=update)
+
+    def recount(self):
+        """
+        Recomputes the post statistics of the feed from its posts, e.g. for
+        posts stored before the statistics existed. This is slow!
+        """
+        count, size, latest = 0, 0, None
+        for post in Post.objects(feed=self).only('pubdate', 'content', 'created'):
+            count += 1
+            size  += content_size(post.content)
+            date   = post_date(post)
+            if date is not None:
+                latest = max(latest, date) if latest else date
+
+        self.modify(
+            set__post_count=count, set__content_bytes=size, set__last_post=latest,
+        )
+
     def __unicode__(self):
         return self.title if self.title else self.link
 
@@ -112,9 +272,13 @@ class Post(me.DynamicDocument):
     title     = me.StringField( max_length=512 )
     url       = me.URLField( required=True, unique=True )
     pubdate   = me.DateTimeField()
-    content   = me.StringField( required=True )
+    content   = CompressedStringField( required=True )
     tags      = me.ListField(me.StringField(max_length=256))
     signature = me.StringField( required=True, max_length=64, min_length=64, unique=True )
+    fetched   = me.DateTimeField(default=None)  # When the webpage was fetched
+    fetch_failures = me.IntField(default=0)     # Fetches of the webpage that failed
+    fetch_failed   = me.BooleanField(default=False) # The webpage can't be fetched (e.g. a 404)
+    fetch_error    = me.StringField(max_length=1024) # Error of the last failed fetch
     created   = me.DateTimeField(default=datetime.now, required=True)
     updated   = me.DateTimeField(default=datetime.now, required=True)
 
@@ -125,6 +289,11 @@ class Post(me.DynamicDocument):
 
     meta      = {
         'collection': 'posts',
+        'index_background': True,
+        'indexes': [
+            ('feed', '-pubdate'), '-pubdate', 'created',
+            ('fetched', 'fetch_failed', 'created'),
+        ],
     }
 
     def hash(self):
@@ -135,6 +304,16 @@ class Post(me.DynamicDocument):
         sha.update(self.content.encode('UTF-8'))
         return sha.hexdigest()
 
+    def to_json(self, *args, **kwargs):
+        """
+        Returns the JSON of the post with its content as text, even if the
+        content is stored compressed.
+        """
+        son = self.to_mongo(kwargs.pop('use_db_field', True))
+        if self.content is not None:
+            son['content'] = self.content
+        return json_util.dumps(son, *args, **kwargs)
+
     def htmlize(self):
         """
         Returns an HTML string of the content of the Post.
@@ -148,6 +327,31 @@ class Post(me.DynamicDocument):
         return self.title if self.title else self.url
 
 
+class FetchTask(me.Document):
+    """
+    A post whose webpage is queued to be fetched by the `baleen fetch`
+    workers. A task is due when it can be leased by a worker; leasing a
+    task pushes its due date back by the lease duration, so that the task
+    is leased again if its worker dies. Tasks are deleted once fetched.
+    """
+
+    post      = me.ReferenceField(Post, required=True, unique=True)
+    due       = me.DateTimeField(default=datetime.utcnow)  # UTC
+    attempts  = me.IntField(default=0)          # Failed attempts to fetch
+    worker    = me.StringField(max_length=255)  # The last worker to lease it
+    failed    = me.BooleanField(default=False)  # Will not be retried
+    error     = me.StringField(max_length=1024)
+    created   = me.DateTimeField(default=datetime.now, required=True)
+
+    meta      = {
+        'collection': 'fetch_queue',
+        'indexes': [('failed', 'due')],
+    }
+
+    def __unicode__(self):
+        return u"Fetch {}".format(self.post.url)
+
+
 class Job(me.DynamicDocument):
 
     jobid     = me.UUIDField(binary=False, required=True)
@@ -161,6 +365,8 @@ class Job(me.DynamicDocument):
     errors    = me.MapField(field=me.IntField())
     counts    = me.MapField(field=me.IntField())
     totals    = me.MapField(field=me.IntField())
+    shards    = me.IntField(default=1)
+    completed = me.ListField(me.IntField())
 
     @classmethod
     def pre_save(cls, sender, document, **kwargs):
@@ -168,6 +374,8 @@ class Job(me.DynamicDocument):
 
     meta      = {
         'collection': 'jobs',
+        'index_background': True,
+        'indexes': ['jobid', '-started'],
     }
 
     def duration(self, humanize=False):
@@ -226,10 +434,184 @@ class Log(me.DynamicDocument):
     asctime   = me.StringField(max_length=64)
     timestamp = me.DateTimeField()
 
+    # The timestamp index is managed by ensure_retention, since its options
+    # (the TTL of the logs) are configured rather than declared.
     meta      = {
         'collection': 'logs',
+        'index_background': True,
+        'indexes': [('logger', '-id')],
     }
 
+    @classmethod
+    def ensure_indexes(cls):
+        """
+        Also ensures the index of the level filter, which can't be declared
+        in the meta since mongoengine can't index the keys of a DictField.
+        """
+        super(Log, cls).ensure_indexes()
+        cls._get_collection().create_index(
+            [('level.name', 1), ('_id', -1)], background=True
+        )
+
+    @classmethod
+    def estimated_count(cls):
+        """
+        Returns the number of logs from the metadata of the collection
+        rather than by counting them, which is fast but may be inaccurate
+        (e.g. after an unclean shutdown or while logs are expired). An
+        unfiltered count command reads the metadata in this pymongo version.
+        """
+        return cls._get_collection().count()
+
+    @classmethod
+    def page(cls, before=None, after=None, per_page=50, level=None,
+             logger=None, since=None, until=None):
+        """
+        Returns a page of logs, newest first, with keyset pagination on the
+        id: the page of logs older than the before id, newer than the after
+        id, or the newest logs if neither is given. The logs can be filtered
+        by level name, logger and a range of timestamps [since, until).
+
+        Returns a tuple (logs, newer, older) where newer and older are the
+        ids to pass as after and before to get the adjacent pages, or None
+        if there are no logs on that side. Unlike skipping to an offset,
+        every page takes the same time no matter how deep it is.
+        """
+        query = {}
+        if level:
+            # mongoengine can't query the keys of a DictField
+            query['__raw__'] = {'level.name': level}
+        if logger:
+            query['logger'] = logger
+        if since:
+            query['timestamp__gte'] = since
+        if until:
+            query['timestamp__lt'] = until
+
+        # Fetch one more log than the page to know if there are more logs
+        if after is not None:
+            logs  = list(cls.objects(id__gt=after, **query).order_by('id').limit(per_page+1))
+            more  = len(logs) > per_page
+            logs  = logs[:per_page][::-1]
+            newer = logs[0].id if logs and more else None
+            older = logs[-1].id if logs else None
+        else:
+            if before is not None:
+                query['id__lt'] = before
+            logs  = list(cls.objects(**query).order_by('-id').limit(per_page+1))
+            more  = len(logs) > per_page
+            logs  = logs[:per_page]
+            newer = logs[0].id if logs and before is not None else None
+            older = logs[-1].id if logs and more else None
+
+        return logs, newer, older
+
+    @classmethod
+    def ensure_retention(cls, retention=None, archive=None, capped=None):
+        """
+        Applies the retention policy of the logs (by default from the mongolog
+        settings) to the logs collection, in one of three ways:
+
+            - if capped is a size in bytes, the collection is converted to a
+              capped collection, so the oldest logs are overwritten by new
+              ones (a capped collection can't be converted back). Converting
+              drops the secondary indexes, so they are built again, and the
+              timestamp index doesn't expire logs;
+
+            - if logs are kept for retention days and aren't archived, the
+              timestamp index expires them (a TTL index);
+
+            - otherwise the timestamp index doesn't expire logs, and logs are
+              only removed by archive (after they are written to disk).
+
+        NOTE: timestamps are stored in local time but Mongo expires them as
+        UTC, so logs expire up to a time zone offset early or late.
+        """
+        retention = retention or settings.mongolog.retention
+        archive   = archive or settings.mongolog.archive
+        capped    = capped or settings.mongolog.capped
+
+        collection = cls._get_collection()
+        if capped and not collection.options().get('capped'):
+            collection.database.command(
+                'convertToCapped', collection.name, size=int(capped)
+            )
+            cls.ensure_indexes()
+
+        expire = retention and not archive and not capped
+        ttl  = int(retention * 86400) if expire else None
+        opts = {'expireAfterSeconds': ttl} if ttl is not None else {}
+        key  = [('timestamp', -1)]
+        name = 'timestamp_-1'
+
+        index = collection.index_information().get(name)
+        if index is None:
+            collection.create_index(key, background=True, **opts)
+        elif index.get('expireAfterSeconds') != ttl:
+            if ttl is not None and 'expireAfterSeconds' in index:
+                # Change the TTL without rebuilding the index
+                collection.database.command(
+                    'collMod', collection.name,
+                    index={'keyPattern': dict(key), 'expireAfterSeconds': ttl},
+                )
+            else:
+                collection.drop_index(name)
+                collection.create_index(key, background=True, **opts)
+
+    @classmethod
+    def archive(cls, before, path, batch=1000):
+        """
+        Writes the logs older than before (a datetime) to gzipped files of
+        JSON lines in the directory at path, one file per day, then removes
+        them. Returns the number of logs archived.
+
+        Logs are removed in batches once their batch is written, so if the
+        archive is interrupted, logs may be written twice but never lost.
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        collection = cls._get_collection()
+        archived   = 0
+
+        while True:
+            docs = list(
+                collection.find({'timestamp': {'$lt': before}})
+                .sort('timestamp', 1).limit(batch)
+            )
+            if not docs:
+                return archived
+
+            # Partition the batch by the day of the logs
+            days = OrderedDict()
+            for doc in docs:
+                day = doc['timestamp'].strftime("%Y-%m-%d")
+                days.setdefault(day, []).append(json_util.dumps(doc))
+
+            for day, lines in days.iteritems():
+                name = os.path.join(path, "logs-{}.json.gz".format(day))
+                with gzip.open(name, 'ab') as f:
+                    f.write("\n".join(lines) + "\n")
+
+            collection.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+            archived += len(docs)
+
+    @classmethod
+    def prune(cls, retention=None, archive=None, now=None):
+        """
+        Archives and removes the logs that are older than the retention (in
+        days) if logs are archived; otherwise the TTL index removes them.
+        Returns the number of logs archived.
+        """
+        retention = retention or settings.mongolog.retention
+        archive   = archive or settings.mongolog.archive
+        if not retention or not archive:
+            return 0
+
+        now = now or datetime.now()
+        return cls.archive(now - timedelta(days=retention), archive)
+
     @property
     def bootstrap_class(self):
         """
@@ -252,6 +634,65 @@ class Log(me.DynamicDocument):
     def __unicode__(self):
         return self.message
 
+##########################################################################
+## Indexes
+##########################################################################
+
+# The models whose indexes are managed by the `baleen indexes` command
+INDEXED_MODELS = (Feed, Post, FetchTask, Job, Log)
+
+
+def ensure_indexes(models=INDEXED_MODELS):
+    """
+    Builds the indexes declared in the meta of the models that don't exist
+    yet (in the background, so the collections remain available), and the
+    timestamp index of the logs according to their retention policy. The
+    retention policy is applied first, since converting the logs to a
+    capped collection drops their indexes.
+    """
+    for model in models:
+        if model is Log:
+            model.ensure_retention()
+        model.ensure_indexes()
+
+
+def index_stats(model):
+    """
+    Returns the indexes of the collection of a model as a list of dicts with
+    the name, key, size (in bytes) and usage of each index. The usage is the
+    number of operations that used the index since the time it was started
+    being tracked, which requires MongoDB 3.2 or later; otherwise (or if the
+    server can't report it) the ops and since values are None.
+    """
+    collection = model._get_collection()
+
+    try:
+        usage = {
+            stat['name']: stat['accesses']
+            for stat in collection.aggregate([{'$indexStats': {}}])
+        }
+    except OperationFailure:
+        usage = {}
+
+    try:
+        sizes = collection.database.command('collStats', collection.name)
+        sizes = sizes.get('indexSizes', {})
+    except OperationFailure:
+        sizes = {}
+
+    stats = []
+    for name, info in sorted(collection.index_information().items()):
+        accesses = usage.get(name, {})
+        stats.append({
+            'collection': collection.name,
+            'name': name,
+            'key': info['key'],
+            'size': sizes.get(name),
+            'ops': accesses.get('ops'),
+            'since': accesses.get('since'),
+        })
+    return stats
+
 ##########################################################################
 ## Signals
 ##########################################################################
@@ -0,0 +1,140 @@
+# baleen.polling
+# Adaptive polling intervals for feeds based on their update frequency.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 14:21:06 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: polling.py [] benjamin@bengfort.com $
+
+"""
+Adaptive polling intervals for feeds based on their update frequency.
+
+Every time a feed is polled, the number of entries published since the
+previous poll is used to update an exponentially weighted estimate of the
+arrival rate of posts (per hour). The next poll is then scheduled so that
+the target number of new posts are expected to have arrived, bounded by the
+minimum and maximum intervals. Polls that are not modified (304) or fail
+back off the interval exponentially until the feed is successfully polled.
+
+All of the timestamps used for polling are naive UTC datetimes.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import calendar
+
+from datetime import datetime, timedelta
+from baleen.config import settings
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def epoch(dt):
+    """
+    Returns the seconds since the epoch of a naive UTC datetime.
+    """
+    return calendar.timegm(dt.utctimetuple())
+
+
+def published(entry):
+    """
+    Returns the seconds since the epoch an entry was published or updated,
+    or None if the entry has no parsed date.
+    """
+    for key in ('published_parsed', 'updated_parsed', 'created_parsed'):
+        if entry.get(key):
+            return calendar.timegm(entry[key])
+    return None
+
+
+def arrival_rate(entries, since=None, now=None):
+    """
+    Returns the number of posts per hour from the dates of the entries. If
+    since is given, it is the number of entries published since then. If
+    not, the rate is estimated from the span of the entries in the feed.
+    Returns None if the rate can't be determined from the entries.
+    """
+    now   = now or datetime.utcnow()
+    dates = filter(None, (published(entry) for entry in entries))
+
+    if since is not None:
+        hours = (epoch(now) - epoch(since)) / 3600.0
+        if hours <= 0:
+            return None
+        return len([date for date in dates if date > epoch(since)]) / hours
+
+    if len(dates) < 2:
+        return None
+
+    hours = (max(dates) - min(dates)) / 3600.0
+    if hours <= 0:
+        return None
+    return (len(dates) - 1) / hours
+
+
+##########################################################################
+## Scheduling
+##########################################################################
+
+def schedule(feed, now=None):
+    """
+    Sets the interval and the next poll of the feed from its arrival rate
+    and the number of consecutive 304s or errors.
+    """
+    now = now or datetime.utcnow()
+
+    if feed.rate is None:
+        interval = float(settings.polling.default)
+    elif feed.rate <= 0:
+        interval = float(settings.polling.maximum)
+    else:
+        interval = settings.polling.target / feed.rate * 3600
+
+    # Cap the exponent, the interval is bounded by the maximum anyway.
+    interval *= settings.polling.backoff ** min(feed.failures or 0, 32)
+    interval  = max(settings.polling.minimum, min(settings.polling.maximum, interval))
+
+    feed.interval  = int(interval)
+    feed.next_poll = now + timedelta(seconds=feed.interval)
+    return feed.next_poll
+
+
+def observe(feed, result, now=None):
+    """
+    Updates the arrival rate of the feed from a successful poll (e.g. the
+    result of feedparser) and schedules the next poll. Not modified (304)
+    results (and unchanged bodies) count as a poll with no new posts and
+    back off the interval.
+    """
+    now = now or datetime.utcnow()
+    observed = arrival_rate(result.get('entries', []), feed.polled, now)
+
+    if observed is not None:
+        if feed.rate is None:
+            feed.rate = observed
+        else:
+            alpha = settings.polling.smoothing
+            feed.rate = alpha * observed + (1 - alpha) * feed.rate
+
+    if result.get('status') == 304 or result.get('unchanged'):
+        feed.failures = (feed.failures or 0) + 1
+    else:
+        feed.failures = 0
+
+    feed.polled = now
+    return schedule(feed, now)
+
+
+def backoff(feed, now=None):
+    """
+    Backs off the interval of a feed that could not be synchronized.
+    """
+    feed.failures = (feed.failures or 0) + 1
+    return schedule(feed, now)
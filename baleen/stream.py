@@ -0,0 +1,565 @@
+# baleen.stream
+# Incremental parsing of large RSS and Atom feeds.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 16:37:12 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: stream.py [] benjamin@bengfort.com $
+
+"""
+Incremental parsing of large RSS and Atom feeds.
+
+Where feedparser parses the entire document and builds every entry before
+returning any of them, a FeedStream yields each entry as soon as its element
+has been parsed and then discards the element, so that the entries can be
+wrangled and saved while the rest of the document is parsed. The downloaded
+body itself is still held in memory, but the parsed tree never holds more
+than the entry being parsed (rather than every entry of the feed).
+
+The entries are FeedParserDicts with the subset of the fields of feedparser
+entries in ENTRY_FIELDS, which are the ones used to wrangle posts. They are
+built the way feedparser builds them: the document is decoded with the
+charset of the response (if any), html entities are allowed, relative urls
+are resolved against the xml:base of the element (or the url of the feed),
+html content is sanitized with feedparser's own sanitizer and dates are
+parsed with feedparser's date handlers. Other fields (e.g. comments or the
+media and itunes extensions) are not streamed.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import re
+import feedparser
+
+from io import BytesIO
+from lxml import etree
+from copy import deepcopy
+from htmlentitydefs import name2codepoint
+from xml.sax.saxutils import escape
+from feedparser import FeedParserDict
+
+
+##########################################################################
+## Module Constants
+##########################################################################
+
+ATOM03  = "http://purl.org/atom/ns#"
+ATOM10  = "http://www.w3.org/2005/Atom"
+CONTENT = "http://purl.org/rss/1.0/modules/content/"
+DC      = "http://purl.org/dc/elements/1.1/"
+RDF     = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+XML     = "http://www.w3.org/XML/1998/namespace"
+
+XML_BASE = "{%s}base" % XML
+XML_LANG = "{%s}lang" % XML
+
+ENTRY_TAGS = {'item', 'entry'}
+ROOT_TAGS  = {'rss', 'RDF', 'feed'}
+FEED_TAGS  = {'channel', 'feed'}
+
+RSS_VERSIONS = {
+    '0.91': 'rss091n', '0.92': 'rss092', '0.93': 'rss093',
+    '0.94': 'rss094', '2.0': 'rss20',
+}
+
+CONTENT_TYPES = {
+    'text': u'text/plain', 'plain': u'text/plain',
+    'html': u'text/html', 'xhtml': u'application/xhtml+xml',
+}
+
+HTML_TYPES = {u'text/html', u'application/xhtml+xml'}
+
+# Email addresses in the text of authors (the pattern feedparser uses)
+EMAIL = re.compile(
+    r"(([a-zA-Z0-9\_\-\.\+]+)@((\[[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.)|"
+    r"(([a-zA-Z0-9\-]+\.)+))([a-zA-Z]{2,4}|[0-9]{1,3})(\]?))(\?subject=\S+)?"
+)
+
+# Elements of an author and the keys of the author detail they are saved to
+AUTHOR_FIELDS = {
+    'name': 'name', 'email': 'email', 'uri': 'href', 'url': 'href', 'homepage': 'href',
+}
+
+# Character data sections or named entity references in a document
+ENTITY = re.compile(r"(<!\[CDATA\[.*?\]\]>)|&([A-Za-z][A-Za-z0-9]*);", re.S)
+
+# Entities that are defined by XML itself
+XML_ENTITIES = {'amp', 'lt', 'gt', 'quot', 'apos'}
+
+# The fields of the streamed entries (see feedparser for their contents)
+ENTRY_FIELDS = (
+    'title', 'title_detail', 'link', 'links', 'id', 'guidislink',
+    'author', 'author_detail', 'authors', 'published', 'published_parsed',
+    'updated', 'updated_parsed', 'summary', 'summary_detail', 'content', 'tags',
+)
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def localname(elem):
+    return etree.QName(elem).localname
+
+
+def namespace(elem):
+    return etree.QName(elem).namespace
+
+
+def text(elem):
+    """
+    Returns the stripped text of an element or None if it has no text.
+    """
+    if elem is None or elem.text is None:
+        return None
+    return elem.text.strip()
+
+
+def inner(elem):
+    """
+    Returns the serialized children of an element (e.g. xhtml content)
+    without their namespaces, as feedparser reconstructs embedded markup.
+    """
+    parts = [escape(elem.text or u"")]
+    for child in elem:
+        if not isinstance(child.tag, basestring):
+            parts.append(escape(child.tail or u""))
+            continue
+
+        child = deepcopy(child)
+        for node in child.iter(tag=etree.Element):
+            node.tag = localname(node)
+        etree.cleanup_namespaces(child)
+        parts.append(etree.tostring(child, encoding=unicode, with_tail=True))
+    return u"".join(parts).strip()
+
+
+def xhtml(elem):
+    """
+    Returns the serialized xhtml content of an Atom element, without the
+    div that wraps it (if all of the content is nested underneath it).
+    """
+    children = [child for child in elem if isinstance(child.tag, basestring)]
+    if len(children) == 1 and localname(children[0]) == 'div':
+        div = children[0]
+        if not (elem.text or "").strip() and not (div.tail or "").strip():
+            return inner(div)
+    return inner(elem)
+
+
+def content_type(value):
+    """
+    Maps the short content types of Atom to mimetypes (as feedparser does).
+    """
+    value = value.lower()
+    return CONTENT_TYPES.get(value, value)
+
+
+def urljoin(base, url):
+    """
+    Resolves a (possibly relative) url against the base url.
+    """
+    return feedparser._urljoin(base or u"", url)
+
+
+def scope(elem, base, lang):
+    """
+    Returns the base url and the language of the element from its xml:base
+    and xml:lang attributes, where base and lang are those of its parent.
+    Only base urls with a safe scheme are used (as in feedparser).
+    """
+    value = elem.get(XML_BASE)
+    if value:
+        if base:
+            base = feedparser._makeSafeAbsoluteURI(base, value) or base
+        else:
+            base = urljoin(base, value)
+
+    value = elem.get(XML_LANG)
+    if value is not None:
+        lang = value or None
+    return base, lang
+
+
+def author_email(value):
+    """
+    Splits the text of an author into a name and an email address (either
+    of which can be None), e.g. "ben@example.com (Ben)" as feedparser does.
+    """
+    match = EMAIL.search(value or u"")
+    if match is None:
+        return value or None, None
+
+    email = match.group(0)
+    name  = value.replace(email, u"")
+    for empty in (u"()", u"<>", u"&lt;&gt;"):
+        name = name.replace(empty, u"")
+
+    name = name.strip()
+    if name.startswith(u"("):
+        name = name[1:]
+    if name.endswith(u")"):
+        name = name[:-1]
+    return name.strip() or None, email
+
+
+def link_text(value):
+    """
+    Fixes query variables in the text of link elements that were converted
+    to character references (e.g. ?a=1&b;=2) as feedparser does.
+    """
+    value = value.replace('&amp;', '&')
+    return re.sub(r"&([A-Za-z0-9_]+);", r"&\g<1>", value)
+
+
+def html_entities(content):
+    """
+    Replaces the named html entities (e.g. &nbsp;) in a document with
+    character references and escapes unknown entities so that they are kept
+    as text (as feedparser does), since neither is defined in XML and they
+    would otherwise be dropped by the parser. Character data is unchanged.
+    """
+    def replace(match):
+        name = match.group(2)
+        if name is None or name in XML_ENTITIES:
+            return match.group(0)
+        if name in name2codepoint:
+            return "&#{};".format(name2codepoint[name])
+        return "&amp;{};".format(name)
+
+    return ENTITY.sub(replace, content)
+
+
+##########################################################################
+## Feed Stream
+##########################################################################
+
+class FeedStream(object):
+    """
+    Iterates over the entries of an RSS or Atom document as they are
+    parsed. Usage:
+
+        >>> stream = FeedStream(response.content, base=response.url)
+        >>> for entry in stream:
+        ...     print entry.title
+
+    The version of the feed is detected from its root element and the
+    title and link of the feed are collected as they are encountered. The
+    base url (e.g. of the response) is used to resolve relative urls, lang
+    is the default language of the content (e.g. Content-Language) and the
+    encoding (e.g. the charset of the response) overrides the encoding
+    declared by the document, unless it is unknown.
+    """
+
+    def __init__(self, content, base=None, lang=None, encoding=None):
+        self.content  = content
+        self.base     = feedparser._makeSafeAbsoluteURI(base or u"")
+        self.lang     = lang
+        self.encoding = encoding
+        self.version  = None
+        self.feed     = FeedParserDict()
+
+    def events(self):
+        """
+        Returns an iterator of the start and end events of the elements.
+        """
+        source = BytesIO(html_entities(self.content))
+        kwargs = {
+            'events': ('start', 'end'), 'recover': True,
+            'resolve_entities': False, 'no_network': True, 'huge_tree': True,
+        }
+
+        if self.encoding:
+            try:
+                return etree.iterparse(source, encoding=self.encoding, **kwargs)
+            except LookupError:
+                pass
+        return etree.iterparse(source, **kwargs)
+
+    def __iter__(self):
+        # The base url and language of every open element
+        scopes = [(self.base, self.lang)]
+
+        for event, elem in self.events():
+            name = localname(elem)
+
+            if event == 'start':
+                scopes.append(scope(elem, *scopes[-1]))
+                if name in ROOT_TAGS and self.version is None:
+                    self.version = self.detect_version(elem)
+                continue
+
+            base, lang = scopes.pop()
+
+            if name in ENTRY_TAGS:
+                yield self.entry(elem, base, lang)
+
+                # Discard the parsed entry and any preceding siblings.
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+            elif name in ('title', 'link') and name not in self.feed:
+                parent = elem.getparent()
+                if parent is not None and localname(parent) in FEED_TAGS:
+                    if name == 'link' and elem.get('href'):
+                        if elem.get('rel', 'alternate') == 'alternate':
+                            self.feed['link'] = urljoin(base, elem.get('href'))
+                    elif name == 'link' and text(elem):
+                        self.feed['link'] = urljoin(base, link_text(text(elem)))
+                    elif text(elem):
+                        self.feed[name] = text(elem)
+
+    def detect_version(self, elem):
+        """
+        Returns the feedparser version string of the root element.
+        """
+        name = localname(elem)
+        if name == 'rss':
+            return RSS_VERSIONS.get(elem.get('version', '').strip(), 'rss')
+        if name == 'RDF':
+            return 'rss10'
+        if namespace(elem) == ATOM10:
+            return 'atom10'
+        if namespace(elem) == ATOM03:
+            return 'atom03'
+        return 'atom'
+
+    def detail(self, elem, default, base, lang):
+        """
+        Returns the content of an element with its type, language and base
+        url (as the *_detail fields of feedparser). Relative urls in html
+        content are resolved and the html is sanitized.
+        """
+        mimetype = content_type(elem.get('type', default))
+        if len(elem) and not mimetype.endswith(u'xml'):
+            # Markup that isn't escaped is xhtml (except bare divs)
+            for child in elem.iterdescendants(tag=etree.Element):
+                if localname(child) != 'div':
+                    mimetype = u'application/xhtml+xml'
+                    break
+
+        if mimetype == u'application/xhtml+xml' and len(elem):
+            value = xhtml(elem) if self.version == 'atom10' else inner(elem)
+        else:
+            value = text(elem) if len(elem) == 0 else inner(elem)
+        value = value or u""
+
+        # Some feed formats require guessing whether the text is html
+        version = self.version or ''
+        if not version.startswith('atom') and mimetype == u'text/plain':
+            if feedparser._FeedParserMixin.lookslikehtml(value):
+                mimetype = u'text/html'
+
+        if mimetype in HTML_TYPES and value:
+            value = feedparser._resolveRelativeURIs(value, base, 'utf-8', mimetype)
+            value = feedparser._sanitizeHTML(value, 'utf-8', mimetype)
+            if not isinstance(value, unicode):
+                value = value.decode('utf-8', 'ignore')
+
+        return FeedParserDict(
+            type=mimetype, language=lang.replace('_', '-') if lang else lang,
+            base=base, value=value,
+        )
+
+    def entry(self, elem, base=None, lang=None):
+        """
+        Converts an item (RSS) or entry (Atom) element into a feedparser
+        style entry, where base and lang are the scope of the element.
+        """
+        entry = FeedParserDict()
+
+        about = elem.get('{%s}about' % RDF)
+        if about:
+            entry['id'] = about
+
+        for child in elem:
+            if not isinstance(child.tag, basestring):
+                continue # Skip comments and processing instructions
+
+            name = localname(child)
+            ns   = namespace(child)
+            cbase, clang = scope(child, base, lang)
+
+            if name == 'title':
+                detail = self.detail(child, u'text/plain', cbase, clang)
+                entry['title'] = detail.value
+                entry['title_detail'] = detail
+
+            elif name == 'link':
+                self.parse_link(entry, child, cbase)
+
+            elif name == 'enclosure':
+                attrs = self.attributes(child)
+                if 'url' in attrs:
+                    attrs['href'] = attrs.pop('url')
+                attrs['rel'] = u'enclosure'
+                entry.setdefault('links', []).append(FeedParserDict(attrs))
+
+            elif name in ('guid', 'id'):
+                self.parse_guid(entry, child, cbase)
+
+            elif name in ('pubDate', 'published', 'issued'):
+                entry['published'] = text(child)
+
+            elif name in ('date', 'updated', 'modified'):
+                entry.setdefault('updated', text(child))
+
+            elif name in ('description', 'summary'):
+                default = u'text/html' if name == 'description' else u'text/plain'
+                if 'summary' in entry:
+                    self.parse_content(entry, child, u'text/plain', cbase, clang)
+                else:
+                    detail = self.detail(child, default, cbase, clang)
+                    entry['summary'] = detail.value
+                    entry['summary_detail'] = detail
+
+            elif name == 'encoded' and ns == CONTENT:
+                self.parse_content(entry, child, u'text/html', cbase, clang)
+
+            elif name == 'content' and ns in (ATOM10, ATOM03):
+                self.parse_content(entry, child, u'text/plain', cbase, clang)
+
+            elif name == 'category':
+                self.parse_category(entry, child)
+
+            elif name in ('author', 'creator'):
+                self.parse_author(entry, child, cbase)
+
+        for key in ('published', 'updated'):
+            if entry.get(key):
+                entry[key + '_parsed'] = feedparser._parse_date(entry[key])
+
+        return entry
+
+    def attributes(self, elem):
+        """
+        Returns the attributes of an element with lowercase names (and
+        lowercase rel and type values) as feedparser normalizes them.
+        """
+        attrs = {}
+        for key, val in elem.attrib.iteritems():
+            if key.startswith('{'):
+                continue
+            key = key.lower()
+            attrs[key] = val.lower() if key in ('rel', 'type') else val
+        return attrs
+
+    def parse_link(self, entry, elem, base):
+        """
+        Adds a link element to the links of the entry. The link of the entry
+        is the last alternate html link or the text of an RSS link.
+        """
+        attrs = self.attributes(elem)
+        attrs.setdefault('rel', u'alternate')
+        attrs.setdefault(
+            'type', u'application/atom+xml' if attrs['rel'] == u'self' else u'text/html'
+        )
+
+        if 'href' in attrs:
+            attrs['href'] = urljoin(base, attrs['href'])
+            if attrs['rel'] == u'alternate' and content_type(attrs['type']) in HTML_TYPES:
+                entry['link'] = attrs['href']
+        else:
+            value = text(elem)
+            value = urljoin(base, value) if value else u""
+            entry['link'] = link_text(value)
+            if value:
+                attrs['href'] = entry['link']
+
+        entry.setdefault('links', []).append(FeedParserDict(attrs))
+
+    def parse_guid(self, entry, elem, base):
+        """
+        Sets the id of the entry, which is also its link if the guid is a
+        permalink and the entry has no link element before it.
+        """
+        attrs = dict((key.lower(), val) for key, val in elem.attrib.iteritems())
+        permalink = attrs.get('ispermalink', 'true') == 'true'
+
+        value = text(elem) or u""
+        if permalink and value:
+            value = urljoin(base, value)
+
+        entry['id'] = value
+        entry['guidislink'] = permalink and 'link' not in entry
+        if permalink:
+            entry.setdefault('link', value)
+
+    def parse_content(self, entry, elem, default, base, lang):
+        """
+        Adds a content element to the content of the entry, which is also
+        the summary of entries without one (if it is text or html).
+        """
+        detail = self.detail(elem, default, base, lang)
+        if elem.get('src'):
+            detail['src'] = elem.get('src')
+        entry.setdefault('content', []).append(detail)
+
+        if detail.type in HTML_TYPES or detail.type == u'text/plain':
+            entry.setdefault('summary', detail.value)
+
+    def parse_category(self, entry, elem):
+        """
+        Adds the term of a category element (or its text) to the tags.
+        """
+        tags  = entry.setdefault('tags', [])
+        value = text(elem)
+
+        tag = FeedParserDict(
+            term=elem.get('term'), label=elem.get('label'),
+            scheme=elem.get('scheme', elem.get('domain')),
+        )
+        if (tag.term or tag.scheme or tag.label) and tag not in tags:
+            tags.append(tag)
+
+        if value:
+            if tags and not tags[-1]['term']:
+                tags[-1]['term'] = value
+            else:
+                tag = FeedParserDict(term=value, scheme=None, label=None)
+                if tag not in tags:
+                    tags.append(tag)
+
+    def parse_author(self, entry, elem, base):
+        """
+        Adds an author to the authors of the entry. Atom authors have name,
+        email and uri elements; other authors are text that may contain an
+        email address. The author of the entry is "name (email)".
+        """
+        detail = FeedParserDict()
+        entry.setdefault('authors', []).append(detail)
+
+        for child in elem:
+            if not isinstance(child.tag, basestring):
+                continue
+
+            key = AUTHOR_FIELDS.get(localname(child))
+            if key is not None:
+                value = text(child) or u""
+                if key == 'href' and value:
+                    value = urljoin(scope(child, base, None)[0], value)
+                entry.setdefault('author_detail', FeedParserDict())[key] = value
+                detail[key] = value
+
+        entry['author'] = text(elem) or u""
+        if detail:
+            name, email = detail.get('name'), detail.get('email')
+            if name and email:
+                entry['author'] = u"{} ({})".format(name, email)
+            elif name or email:
+                entry['author'] = name or email
+            return
+
+        name, email = author_email(entry['author'])
+        if name or email:
+            detail = entry.setdefault('author_detail', detail)
+        if name:
+            detail['name'] = name
+        if email:
+            detail['email'] = email
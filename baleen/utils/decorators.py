@@ -17,7 +17,8 @@ Decorators and function utilities for Baleen.
 ## Imports
 ##########################################################################
 
-import signal
+import threading
+
 from functools import wraps
 from baleen.utils.timez import Timer
 from baleen.exceptions import BaleenError, TimeoutError
@@ -70,21 +71,38 @@ def timeout(seconds):
     """
     Raises a TimeoutError if a function does not terminate within
     specified seconds.
-    """
-    def _timeout_error(signal, frame):
-        raise TimeoutError("Operation did not finish within \
-        {} seconds".format(seconds))
 
+    The function is executed in a daemon thread that the caller waits on,
+    so unlike a signal alarm, this works from any thread and any number of
+    timeouts can be pending at once. However, the function itself cannot be
+    interrupted and will run to completion in the background; for network
+    I/O prefer the cooperative baleen.utils.timez.Deadline instead.
+    """
     def timeout_decorator(func):
 
         @wraps(func)
         def timeout_wrapper(*args, **kwargs):
-            signal.signal(signal.SIGALRM, _timeout_error)
-            signal.alarm(seconds)
-            try:
-                return func(*args, **kwargs)
-            finally:
-                signal.alarm(0)
+            outcome = {}
+
+            def target():
+                try:
+                    outcome['result'] = func(*args, **kwargs)
+                except Exception as e:
+                    outcome['error'] = e
+
+            thread = threading.Thread(target=target, name=func.__name__)
+            thread.daemon = True
+            thread.start()
+            thread.join(seconds)
+
+            if thread.is_alive():
+                raise TimeoutError(
+                    "Operation did not finish within {} seconds".format(seconds)
+                )
+
+            if 'error' in outcome:
+                raise outcome['error']
+            return outcome['result']
 
         return timeout_wrapper
 
@@ -100,6 +118,8 @@ def reraise(klass=BaleenError, message=None, trap=Exception):
     exception type specified by class. Also embeds the original exception as
     a property of the new exception: `error.original`. Finally you can
     specify another message to raise, otherwise the error string is used.
+
+    Exceptions that are already of the reraise class are not wrapped again.
     """
 
     def reraise_decorator(func):
@@ -111,6 +131,8 @@ def reraise(klass=BaleenError, message=None, trap=Exception):
             """
             try:
                 return func(*args, **kwargs)
+            except klass:
+                raise
             except trap as e:
                 error = klass(message or e.message)
                 error.original = e
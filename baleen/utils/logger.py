@@ -63,6 +63,7 @@ configuration = {
         'mongolog': {
             'level': 'INFO',
             'class': 'baleen.utils.mongolog.MongoHandler',
+            'buffered': settings.mongolog.buffered,
         }
     },
 
@@ -11,86 +11,120 @@
 
 """
 Handlers and formatters for logging to Mongo
+
+By default the MongoHandler inserts every record as it is emitted, which
+costs a round trip to Mongo for every log message. In buffered mode records
+are instead put on a bounded queue and inserted in batches by a background
+thread, once the batch is full or the flush interval has passed. Emitting a
+record never blocks: if the queue is full (e.g. because Mongo is slow or
+down) the record is appended to a spill file of JSON lines if one is
+configured, and dropped otherwise. The buffer is flushed when the handler
+is closed, e.g. by logging.shutdown when the interpreter exits.
 """
 
 ##########################################################################
 ## Imports
 ##########################################################################
 
+import os
+import time
+import Queue
 import getpass
 import logging
+import threading
 import logging.config
 from baleen.utils.timez import *
 from baleen.config import settings
 
+from bson import json_util
 from datetime import datetime
 from socket import gethostname
 from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 
+##########################################################################
+## Module Constants
+##########################################################################
+
+# Attributes of every LogRecord, which are not stored unless formatted
+RECORD_ATTRIBUTES = frozenset((
+    'name', 'msg', 'args', 'levelname', 'levelno', 'pathname', 'filename',
+    'module', 'exc_info', 'exc_text', 'lineno', 'funcName', 'created',
+    'msecs', 'relativeCreated', 'thread', 'threadName', 'processName',
+    'process',
+))
+
+# Sentinels put on the queue of a buffered handler
+FLUSH = object()    # Write the records buffered so far
+STOP  = object()    # Write the records buffered so far and stop
+
 ##########################################################################
 ## Mongo Formatter/Handler
 ##########################################################################
 
 class MongoFormatter(logging.Formatter):
+    """
+    Formats a LogRecord into the document that is stored in Mongo, e.g.
+
+        {
+            'logger': 'baleen.ingest',
+            'level': {'number': 20, 'name': 'INFO'},
+            'message': 'baleen.ingest INFO [...] -- ingested 12 feeds',
+            'asctime': '...',
+            'timestamp': datetime(...),
+            'error': {'info': None, 'text': None},
+            'user': 'baleen',
+            'host': 'example.com',
+        }
+
+    along with any extra attributes passed to the logger. Formatting happens
+    on every record (on the logging thread), so only the stored fields are
+    built and the user and host are looked up once rather than per record.
+    """
 
     def __init__(self, fmt='%(name)s %(levelname)s [%(asctime)s] -- %(message)s', datefmt=COMMON_DATETIME):
         super(MongoFormatter, self).__init__(fmt, datefmt)
+        self.user = getpass.getuser()
+        self.host = gethostname()
 
     def format(self, record):
         """
         Formats LogRecord into a Python dictionary
         """
+        ## Get the log message as intended via super (sets asctime)
+        message = super(MongoFormatter, self).format(record)
 
-        ## Get the dictionary ready for Mongo
-        data    = record.__dict__.copy()
-
-        ## Get the log message as intended via super
-        message   = super(MongoFormatter, self).format(record)
-        timestamp = datetime.fromtimestamp(data.pop('created'))
-        location  = {
-            'module': data.pop('module'),
-            'file': data.pop('pathname'),
-            'filename': data.pop('filename'),
-            'lineno': data.pop('lineno'),
-            'method': data.pop('funcName')
-        }
-        error     = {
-            'info': data.pop('exc_info'),
-            'text': data.pop('exc_text'),
-        }
-        process   = {
-            'process': data.pop('process'),
-            'processName': data.pop('processName'),
-            'thread': data.pop('thread'),
-            'threadName': data.pop('threadName'),
-        }
-        logger    = data.pop('name')
-        level     = {
-            'number': data.pop('levelno'),
-            'name': data.pop('levelname'),
+        ## The exception itself can't be stored, only its type and traceback
+        exc_info = record.exc_info
+        data = {
+            'logger': record.name,
+            'message': message,
+            'timestamp': datetime.fromtimestamp(record.created),
+            'level': {
+                'number': record.levelno,
+                'name': record.levelname,
+            },
+            'error': {
+                'info': exc_info[0].__name__ if exc_info and exc_info[0] else None,
+                'text': record.exc_text,
+            },
+            'user': self.user,
+            'host': self.host,
         }
-        info      = tuple(unicode(arg) for arg in data.pop('args'))
 
-        for key in ('relativeCreated', 'msecs', 'msg'):
-            del data[key]
-
-        data.update({
-            'logger': logger,
-            # 'process': process,
-            'message': message,
-            'timestamp': timestamp,
-            'level': level,
-            # 'location': location,
-            'error': error,
-            'user': getpass.getuser(),
-            'host': gethostname(),
-            # 'info': info,
-        })
+        ## Store the asctime and any extra attributes passed to the logger
+        for key, val in record.__dict__.iteritems():
+            if key not in RECORD_ATTRIBUTES and key not in data:
+                data[key] = val
 
         return data
 
 class MongoHandler(logging.Handler):
+    """
+    Inserts log records into a Mongo collection, either as they are emitted
+    or, if buffered is True, in batches from a background thread (see the
+    mongolog settings for the size of the batches and of the buffer).
+    """
 
     def __init__(self, level=logging.NOTSET, **kwargs):
         super(MongoHandler, self).__init__(level)
@@ -101,11 +135,26 @@ class MongoHandler(logging.Handler):
         self.fail_silently   = kwargs.get('fail_silently', False)
         self.formatter       = kwargs.get('formatter', MongoFormatter())
 
+        self.buffered        = kwargs.get('buffered', False)
+        self.capacity        = kwargs.get('capacity', settings.mongolog.capacity)
+        self.interval        = kwargs.get('interval', settings.mongolog.interval)
+        self.maxsize         = kwargs.get('maxsize', settings.mongolog.maxsize)
+        self.spill           = kwargs.get('spill', settings.mongolog.spill)
+
         self.connection      = None
         self.database        = None
         self.collection      = None
+        self.queue           = None
+        self.flusher         = None
+        self.pid             = None
+        self.dropped         = 0     # Records lost because the buffer was full
+        self.spilled         = 0     # Records written to the spill file instead
+        self.spill_lock      = threading.Lock()
         self.connect()
 
+        if self.buffered:
+            self.start()
+
     def connect(self):
         """
         Connect to the Mongo database.
@@ -121,24 +170,145 @@ class MongoHandler(logging.Handler):
         self.database   = self.connection[self.database_name]
         self.collection = self.database[self.collection_name]
 
+    def start(self):
+        """
+        Starts the background thread that writes the buffered records. The
+        thread does not survive a fork, so it is started again (with a new
+        connection and an empty buffer) by the first record of a child.
+        """
+        if self.pid is not None:
+            self.connect()
+
+        self.pid     = os.getpid()
+        self.queue   = Queue.Queue(self.maxsize)
+        self.flusher = threading.Thread(target=self.run, name="mongolog")
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def run(self):
+        """
+        The run loop of the background thread, which writes batches of
+        buffered records until it is stopped.
+        """
+        stopped = False
+        while not stopped:
+            batch, stopped = self.collect()
+            if batch:
+                self.write(batch)
+
+    def collect(self):
+        """
+        Blocks until a batch of records is buffered or the flush interval has
+        passed since the first record of the batch, then returns the batch
+        and whether the thread was asked to stop.
+        """
+        batch, deadline = [], None
+        while len(batch) < self.capacity:
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Queue.Empty:
+                break
+
+            # Sentinels are done as soon as the batch before them is written.
+            if item is FLUSH or item is STOP:
+                self.queue.task_done()
+                return batch, item is STOP
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.time() + self.interval
+
+        return batch, False
+
+    def write(self, batch):
+        """
+        Inserts a batch of formatted records, spilling (or dropping) them if
+        the insert fails so that logging does not raise on the flush thread.
+        """
+        try:
+            if self.collection is None:
+                raise PyMongoError("not connected to the log database")
+            self.collection.insert_many(batch, ordered=False)
+        except Exception:
+            self.overflow(batch)
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def overflow(self, records):
+        """
+        Appends records that could not be buffered or written to the spill
+        file as JSON lines, or drops them if there is no spill file.
+        """
+        if self.spill:
+            try:
+                with self.spill_lock:
+                    with open(self.spill, 'a') as f:
+                        for record in records:
+                            f.write(json_util.dumps(record) + "\n")
+                    self.spilled += len(records)
+                return
+            except Exception:
+                pass
+
+        with self.spill_lock:
+            self.dropped += len(records)
+
+    def flush(self):
+        """
+        Blocks until the records buffered so far have been written.
+        """
+        if self.flusher is not None and self.flusher.is_alive():
+            self.queue.put(FLUSH)
+            self.queue.join()
+
     def close(self):
         """
-        Close the connection to the Mongo database.
+        Writes the buffered records, stops the background thread and closes
+        the connection to the Mongo database.
         """
+        if self.flusher is not None:
+            if self.flusher.is_alive() and self.pid == os.getpid():
+                self.queue.put(STOP)
+                self.flusher.join()
+            self.flusher = None
+
         if self.connection is not None:
             self.connection = None
 
+        super(MongoHandler, self).close()
+
     def emit(self, record):
         """
-        Insert log record into Mongo database
+        Insert log record into Mongo database (or buffer it to be inserted).
         """
         if self.collection is not None:
             try:
-                self.collection.insert(self.format(record))
+                if self.buffered and self.flusher is not None:
+                    if self.pid != os.getpid():
+                        self.start()
+                    self.enqueue(self.format(record))
+                else:
+                    self.collection.insert(self.format(record))
             except Exception:
                 if not self.fail_silently:
                     self.handleError(record)
 
+    def enqueue(self, data):
+        """
+        Buffers a formatted record without blocking, overflowing if full.
+        """
+        try:
+            self.queue.put_nowait(data)
+        except Queue.Full:
+            self.overflow([data])
+
 if __name__ == '__main__':
     logger = logging.getLogger('demo')
     logger.setLevel(logging.INFO)
@@ -20,7 +20,9 @@ Utility functions for Baleenc
 import re
 import time
 
-from dateutil.tz import tzlocal, tzutc
+from baleen.exceptions import TimeoutError
+from dateutil import parser as dtparser
+from dateutil.tz import tzlocal, tzutc, tzoffset
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
@@ -126,3 +128,198 @@ class Timer(object):
 
     def __str__(self):
         return humanizedelta(seconds=self.elapsed)
+
+
+##########################################################################
+## Deadlines
+##########################################################################
+
+class Deadline(object):
+    """
+    A time budget for an operation that is checked cooperatively rather than
+    enforced with signals, so that it works in any thread, I/O task or
+    process. Blocking calls should be bounded by the remaining time and the
+    deadline checked between them. Usage:
+        >>> deadline = Deadline(180)
+        >>> for chunk in response.iter_content(4096):
+        ...     deadline.check()
+
+    If seconds is None, the deadline never expires.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.started = time.time()
+
+    @property
+    def remaining(self):
+        """
+        The number of seconds left in the budget (None if unbounded).
+        """
+        if self.seconds is None:
+            return None
+        return max(0.0, self.started + self.seconds - time.time())
+
+    @property
+    def expired(self):
+        return self.remaining == 0.0
+
+    def check(self):
+        """
+        Raises a TimeoutError if the deadline has expired.
+        """
+        if self.expired:
+            raise TimeoutError(
+                "Operation did not finish within {} seconds".format(self.seconds)
+            )
+
+    def timeout(self, seconds=None):
+        """
+        Returns a timeout for a blocking call that is bounded by both the
+        seconds specified and the time remaining before the deadline.
+        Raises a TimeoutError if the deadline has already expired.
+        """
+        self.check()
+        remaining = self.remaining
+
+        if seconds is None:
+            return remaining
+        if remaining is None:
+            return seconds
+        return min(seconds, remaining)
+
+
+##########################################################################
+## Date Parsing
+##########################################################################
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+# The named zones of RFC 822 (hours from UTC); other names are left to dateutil.
+ZONES = {
+    'UT': 0, 'UTC': 0, 'GMT': 0, 'Z': 0,
+    'EST': -5, 'EDT': -4, 'CST': -6, 'CDT': -5,
+    'MST': -7, 'MDT': -6, 'PST': -8, 'PDT': -7,
+}
+
+RFC822_RE = re.compile(
+    r'^\s*(?:[A-Za-z]{3},?\s+)?(\d{1,2})\s+([A-Za-z]{3})[a-z]*\s+(\d{2,4})\s+'
+    r'(\d{1,2}):(\d{2})(?::(\d{2}))?\s*(?:([+-]\d{4})|([A-Za-z]{1,3}))\s*$'
+)
+
+ISO8601_RE = re.compile(
+    r'^\s*(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?'
+    r'\s*(?:(Z)|([+-])(\d{2}):?(\d{2}))\s*$'
+)
+
+
+def parse_rfc822(value):
+    """
+    Strictly parses RFC 822 dates, e.g. "Wed, 02 Mar 2016 22:00:06 GMT",
+    with a numeric offset or one of the named zones of RFC 822 (e.g. EST).
+    Returns None if the value is not in this format.
+    """
+    match = RFC822_RE.match(value)
+    if match is None:
+        return None
+
+    day, month, year, hour, minute, second, offset, zone = match.groups()
+    month = MONTHS.get(month.lower())
+    if month is None:
+        return None
+
+    if zone:
+        zone = ZONES.get(zone.upper())
+        if zone is None:
+            return None
+
+    year = int(year)
+    if year < 100:
+        year += 2000 if year < 50 else 1900
+
+    if zone == 0:
+        tz = tzutc()
+    elif zone is not None:
+        tz = tzoffset(None, zone * 3600)
+    else:
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        tz = tzoffset(None, minutes * 60 * (-1 if offset[0] == '-' else 1))
+
+    return datetime(
+        year, month, int(day), int(hour), int(minute), int(second or 0), tzinfo=tz
+    )
+
+
+def parse_iso8601(value):
+    """
+    Strictly parses ISO 8601 datetimes with a timezone, e.g. the format of
+    Atom feeds: "2016-03-02T22:00:06Z" or "2016-03-02T17:00:06.12-05:00".
+    Returns None if the value is not in this format.
+    """
+    match = ISO8601_RE.match(value)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, utc, sign, oh, om = match.groups()
+    if utc:
+        tz = tzutc()
+    else:
+        minutes = int(oh) * 60 + int(om)
+        tz = tzoffset(None, minutes * 60 * (-1 if sign == '-' else 1))
+
+    micro = int((fraction or '0')[:6].ljust(6, '0'))
+    return datetime(
+        int(year), int(month), int(day), int(hour), int(minute),
+        int(second or 0), micro, tzinfo=tz
+    )
+
+
+class DateParser(object):
+    """
+    Parses dates by trying precompiled strict formats before falling back
+    to the (much slower) dateutil parser. Since most feeds use the same
+    format for every entry, the format that last worked is remembered by
+    key (e.g. the feed) and tried first. Usage:
+
+        >>> parser = DateParser()
+        >>> parser.parse("Wed, 02 Mar 2016 22:00:06 GMT", key=feed.link)
+
+    Raises a ValueError (as dateutil does) if the date can't be parsed.
+    """
+
+    FORMATS = (parse_rfc822, parse_iso8601)
+
+    def __init__(self, formats=None):
+        self.formats = formats or self.FORMATS
+        self.cache   = {}   # Maps keys to the index of their last format
+
+    def parse(self, value, key=None):
+        cached = self.cache.get(key)
+        if cached is not None:
+            result = self.formats[cached](value)
+            if result is not None:
+                return result
+
+        for idx, parser in enumerate(self.formats):
+            if idx == cached:
+                continue
+
+            result = parser(value)
+            if result is not None:
+                self.cache[key] = idx
+                return result
+
+        return dtparser.parse(value)
+
+
+_dateparser = DateParser()
+
+
+def parse_datetime(value, key=None):
+    """
+    Parses a date string using the shared date parser and format cache.
+    """
+    return _dateparser.parse(value, key)
@@ -0,0 +1,263 @@
+# baleen.utils.workers
+# Worker threads and pipelines for concurrent ingestion.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 09:12:31 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: workers.py [] benjamin@bengfort.com $
+
+"""
+Worker threads and pipelines for concurrent ingestion.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import threading
+
+from Queue import Queue
+
+
+##########################################################################
+## Module Constants
+##########################################################################
+
+STOP = object()     # Sentinel put on the queue to shut down a worker
+
+
+##########################################################################
+## Worker Pool
+##########################################################################
+
+class WorkerPool(object):
+    """
+    Applies a handler to every item put on a bounded queue using a fixed
+    number of daemon threads. Usage:
+
+        >>> with WorkerPool(handler, workers=8) as pool:
+        ...     for item in items:
+        ...         pool.put(item)
+
+    The queue is bounded (by default to twice the number of workers) so that
+    the producer blocks rather than loading an entire collection into memory.
+    Handlers are expected to do their own error handling; if an exception
+    escapes a handler, the pool stops processing, drains the queue, and the
+    exception is raised in the producer on the next put or on join.
+    """
+
+    def __init__(self, handler, workers=4, maxsize=None, name="worker"):
+        self.handler = handler
+        self.workers = workers
+        self.name    = name
+        self.queue   = Queue(maxsize or workers * 2)
+        self.threads = []
+        self.error   = None
+
+    def start(self):
+        """
+        Starts the worker threads (does nothing if already started).
+        """
+        if self.threads: return self
+
+        for idx in xrange(self.workers):
+            thread = threading.Thread(
+                target=self.work, name="{}-{}".format(self.name, idx+1)
+            )
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        return self
+
+    def work(self):
+        """
+        The run loop of every worker thread.
+        """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is STOP:
+                    return
+
+                # Once a worker has failed, simply drain the queue.
+                if self.error is not None:
+                    continue
+
+                self.handler(item)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def put(self, item):
+        """
+        Puts an item on the queue, blocking if the queue is full. Raises the
+        exception of a failed worker so the producer can stop early.
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def join(self):
+        """
+        Signals the workers to stop once the queue is empty and waits for
+        them to complete. Raises the exception of a failed worker, if any.
+        """
+        for thread in self.threads:
+            self.queue.put(STOP)
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+        if self.error is not None:
+            raise self.error
+
+    def map(self, items):
+        """
+        Processes every item in the iterable, blocking until complete.
+        """
+        with self:
+            for item in items:
+                self.put(item)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, value, tb):
+        try:
+            self.join()
+        except Exception:
+            # Do not mask an exception raised by the producer.
+            if typ is None:
+                raise
+
+
+##########################################################################
+## Pipelines
+##########################################################################
+
+class Stage(WorkerPool):
+    """
+    A named worker pool that is one stage of a pipeline. The handler of a
+    stage returns an iterable of items (or None) that are put on the queue
+    of the next stage; since every queue is bounded, a slow stage applies
+    backpressure to the stages before it rather than buffering without
+    limit. Each stage tracks the number of items it has processed so that
+    the queue depth and throughput of every stage can be reported.
+    """
+
+    def __init__(self, name, handler, workers=1, maxsize=None):
+        super(Stage, self).__init__(self.execute, workers, maxsize, name)
+        self.process   = handler
+        self.output    = None   # The next stage in the pipeline
+        self.processed = 0      # Number of items handled by the stage
+        self.started   = None   # Timestamp the stage was started
+        self.finished  = None   # Timestamp the stage was joined
+        self.lock      = threading.Lock()
+
+    def start(self):
+        if self.started is None:
+            self.started = time.time()
+        return super(Stage, self).start()
+
+    def join(self):
+        try:
+            super(Stage, self).join()
+        finally:
+            self.finished = time.time()
+
+    def execute(self, item):
+        """
+        Handles an item and passes the results on to the next stage.
+        """
+        results = self.process(item)
+        if results is not None:
+            for result in results:
+                if self.output is not None:
+                    self.output.put(result)
+
+        with self.lock:
+            self.processed += 1
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def stats(self):
+        """
+        Returns the current queue depth and throughput of the stage.
+        """
+        elapsed = self.elapsed
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'depth': self.queue.qsize(),
+            'maxsize': self.queue.maxsize,
+            'processed': self.processed,
+            'throughput': self.processed / elapsed if elapsed else 0.0,
+        }
+
+
+class Pipeline(object):
+    """
+    Connects stages so that the output of each stage is the input of the
+    next. Items put on the pipeline are handled by the first stage. Usage:
+
+        >>> with Pipeline(Stage("fetch", fetch, 8), Stage("save", save)) as p:
+        ...     for url in urls:
+        ...         p.put(url)
+
+    Exiting the context joins the stages in order, so that every stage has
+    finished all of its work before the next stage is told to stop.
+    """
+
+    def __init__(self, *stages):
+        self.stages = stages
+        for stage, output in zip(stages, stages[1:]):
+            stage.output = output
+
+    def put(self, item):
+        self.stages[0].put(item)
+
+    def start(self):
+        # Start the stages in reverse so no stage puts to a stopped stage.
+        for stage in reversed(self.stages):
+            stage.start()
+        return self
+
+    def join(self):
+        """
+        Joins every stage in order, raising the first error encountered.
+        """
+        error = None
+        for stage in self.stages:
+            try:
+                stage.join()
+            except Exception as e:
+                error = error or e
+
+        if error is not None:
+            raise error
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, value, tb):
+        try:
+            self.join()
+        except Exception:
+            # Do not mask an exception raised by the producer.
+            if typ is None:
+                raise
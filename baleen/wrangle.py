@@ -21,13 +21,17 @@ module provides.
 ## Imports
 ##########################################################################
 
-import requests
+import mongoengine as me
 
-from copy import deepcopy
-from dateutil import parser as dtparser
+from bson import DBRef, ObjectId
+from datetime import datetime
+from dateutil.tz import tzutc
+from pymongo.errors import BulkWriteError
 
+from baleen import http
 from baleen.config import settings
-from baleen.models import Post
+from baleen.models import Feed, Post, FetchTask, content_size
+from baleen.utils.timez import parse_datetime
 from baleen.utils.decorators import reraise
 from baleen.exceptions import WranglingError, FetchError
 
@@ -40,6 +44,45 @@ FEEDPARSER_REMOVABLE_FIELDS = (
     'updated', 'updated_parsed',  'created', 'created_parsed',
 )
 
+# Fields of the entry that are converted into other fields of the post.
+WRANGLED_FIELDS = ('published', 'tags', 'link', 'content')
+
+DUPLICATE_KEY_ERRORS = (11000, 11001, 12582)
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def entry_url(entry):
+    """
+    Returns the url that the post wrangled from the entry is stored with.
+    """
+    return entry.get('link') or entry.get('href') or entry.get('id')
+
+
+def wrangling_error(exception):
+    """
+    Wraps an exception as a WranglingError, as the reraise decorator does.
+    """
+    error = WranglingError(exception.message)
+    error.original = exception
+    return error
+
+
+def record_posts(posts):
+    """
+    Adds newly saved posts to the statistics of their feeds, with a single
+    update per feed. Posts of feeds that aren't models are not recorded.
+    """
+    feeds = {}
+    for post in posts:
+        if isinstance(post.feed, Feed):
+            feeds.setdefault(post.feed.id, (post.feed, []))[1].append(post)
+
+    for feed, saved in feeds.values():
+        feed.record_posts(saved)
+
+
 ##########################################################################
 ## Post Wrangling Object
 ##########################################################################
@@ -56,10 +99,86 @@ class PostWrangler(object):
     @classmethod
     def factory(klass, entries, feed=None):
         """
-        Yields a post wrangler for each entry in the entries.
+        Yields a post wrangler for each entry in the entries. The entries are
+        not copied since wrangling does not modify them.
         """
         for entry in entries:
-            yield klass(deepcopy(entry), feed=feed)
+            yield klass(entry, feed=feed)
+
+    @classmethod
+    def known(klass, entries):
+        """
+        Returns the set of urls of the entries that are already stored as
+        posts, looked up with a single query on the unique url index so that
+        known entries can be skipped before they are wrangled.
+        """
+        urls = list(set(filter(None, (entry_url(entry) for entry in entries))))
+        if not urls:
+            return set()
+        return set(Post.objects(url__in=urls).scalar('url'))
+
+    @classmethod
+    @reraise(klass=WranglingError)
+    def bulk_save(klass, wranglers):
+        """
+        Saves the wrangled posts of the wranglers to the database with a
+        single unordered bulk insert rather than a round trip per post, so
+        that one duplicate does not stop the rest of the posts from being
+        inserted. The pre_save and post_save signals are sent for each post.
+
+        Returns a list of errors in the same order as the wranglers, where
+        the error is None if the post was saved, or a WranglingError for the
+        post (e.g. if it was invalid or a duplicate) otherwise. Raises a
+        WranglingError if the bulk insert could not be performed at all.
+        """
+        errors    = [None] * len(wranglers)
+        documents = []
+
+        for idx, wrangler in enumerate(wranglers):
+            try:
+                if not wrangler.is_wrangled():
+                    raise ValueError("Entry not yet wrangled, cannot save.")
+
+                me.signals.pre_save.send(Post, document=wrangler.post)
+                wrangler.post.validate()
+
+                son = wrangler.post.to_mongo()
+                son.setdefault('_id', ObjectId())
+                documents.append((idx, wrangler.post, son))
+            except Exception as e:
+                errors[idx] = wrangling_error(e)
+
+        if not documents:
+            return errors
+
+        # Write errors are reported by the index into the inserted documents.
+        failed = {}
+        try:
+            Post._get_collection().insert_many(
+                [son for idx, post, son in documents], ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                failed[error['index']] = error
+
+        saved = []
+        for jdx, (idx, post, son) in enumerate(documents):
+            if jdx in failed:
+                error = failed[jdx]
+                if error.get('code') in DUPLICATE_KEY_ERRORS:
+                    errors[idx] = wrangling_error(me.NotUniqueError(error['errmsg']))
+                else:
+                    errors[idx] = wrangling_error(me.OperationError(error['errmsg']))
+                continue
+
+            # Subsequent saves (e.g. fetch) update rather than insert the post.
+            post.id = son['_id']
+            post._clear_changed_fields()
+            me.signals.post_save.send(Post, document=post, created=True)
+            saved.append(post)
+
+        record_posts(saved)
+        return errors
 
     def __init__(self, entry, feed=None):
         """
@@ -103,35 +222,37 @@ class PostWrangler(object):
 
         See the models.Post for more information on the data structure.
 
-        NOTE: This method is destructive, the raw entry will be converted.
+        NOTE: The wrangler's entry is replaced by the post, but the entry
+        itself is not modified.
         """
         ## Don't rewrangle an already wrangled post
         if self.is_wrangled():
             return self.post
 
-        ## Saves typing self.post everywhere
-        post = self.post.copy()
-
-        ## Remove unwanted fields
-        for field in FEEDPARSER_REMOVABLE_FIELDS:
-            if field in post: del post[field]
+        ## Build the fields of the post straight from the (read-only) entry
+        ## rather than copying it; the entry is never modified, so entries
+        ## can be shared between wranglers without a deep copy.
+        entry = self.post
+        post  = dict(
+            (key, val) for key, val in entry.iteritems()
+            if key not in FEEDPARSER_REMOVABLE_FIELDS and key not in WRANGLED_FIELDS
+        )
 
         ## Handle the pubdate and published strings
-        post['pubdate'] = dtparser.parse(post.pop('published')) if 'published' in post else None
+        post['pubdate'] = self.pubdate()
 
         ## Handle the tags in the entry
-        post['tags'] = [tag['term'] for tag in self.post.tags] if 'tags' in post else []
+        post['tags'] = [tag['term'] for tag in entry['tags']] if 'tags' in entry else []
 
         ## Rename the link field to url
-        post['url'] = self.post.link or post.get('href', None) or self.post.id
-        if 'link' in post: del post['link']
+        post['url'] = entry.get('link') or entry.get('href') or entry['id']
 
         ## Handle the content
-        if 'content' not in post:
-            post['content'] = post.get('summary')
+        if 'content' not in entry:
+            post['content'] = entry.get('summary')
         else:
             selected = None
-            for idx, item in enumerate(post['content']):
+            for idx, item in enumerate(entry['content']):
                 if idx == 0:
                     # Take the first item
                     selected = item
@@ -149,14 +270,109 @@ class PostWrangler(object):
         self.post = Post(feed=self.feed, **post)
         if save:
             self.post.save()
+            record_posts([self.post])
+
+        return self.post
+
+    def pubdate(self):
+        """
+        Returns the publication date of the entry (None if not published).
+        The date already parsed by feedparser (in UTC) is used if it exists,
+        otherwise the published string is parsed, trying the date format
+        that last worked for the feed first.
+        """
+        entry = self.post
+        if 'published' not in entry:
+            return None
 
+        parsed = entry.get('published_parsed')
+        if parsed:
+            return datetime(*parsed[:6], tzinfo=tzutc())
+
+        return parse_datetime(entry['published'], key=getattr(self.feed, 'link', None))
+
+    @reraise(klass=WranglingError)
+    def save(self):
+        """
+        Saves the wrangled post to the database, for posts that were wrangled
+        without saving (e.g. so that the database write can happen later).
+
+        Raises an exception if not wrangled yet.
+        """
+        if not self.is_wrangled():
+            raise ValueError("Entry not yet wrangled, cannot save.")
+
+        self.post.save()
+        record_posts([self.post])
         return self.post
 
     @reraise(klass=FetchError)
-    def fetch(self, save=True):
+    def enqueue(self):
+        """
+        Queues the saved post to have its webpage fetched later by the fetch
+        workers rather than now. Returns False if it was already queued.
+
+        Raises an exception if not wrangled or not saved yet.
+        """
+        if not self.is_wrangled() or self.post.id is None:
+            raise ValueError("Post not yet saved, cannot enqueue.")
+
+        try:
+            FetchTask(post=self.post).save()
+        except me.NotUniqueError:
+            return False
+        return True
+
+    @reraise(klass=FetchError)
+    def download(self):
+        """
+        Performs the HTTP request for the webpage of the post, returning the
+        response without modifying the post so that the download can happen
+        separately from the fetch (e.g. on the I/O threads of an ingestor).
+
+        Only webpages of the accepted mimetypes are downloaded and downloads
+        are aborted once they are larger than the max_bytes fetch setting,
+        so that links to videos, archives or endless pages can't exhaust the
+        memory of the worker or exceed the size limit of a document.
+
+        Raises an exception if not wrangled yet.
+        Raises exceptions if there is a problem with the request.
+        """
+        if not self.is_wrangled():
+            raise ValueError("Entry not yet wrangled, cannot fetch.")
+
+        response = http.get(
+            self.post.url, max_bytes=settings.fetch.max_bytes,
+            accept=settings.fetch.mimetypes,
+        )
+        response.raise_for_status()
+        return response
+
+    def failed(self, exception, permanent=False):
+        """
+        Records a failed fetch of the webpage on the saved post, counting the
+        failure and keeping its error. If the failure is permanent (e.g. a
+        404), the post is not fetched again by catch-up passes.
+        """
+        if not self.is_wrangled() or self.post.id is None:
+            return
+
+        error = unicode(exception)[:1024]
+        Post.objects(id=self.post.id).update_one(
+            inc__fetch_failures=1, set__fetch_error=error,
+            set__fetch_failed=permanent,
+        )
+
+        self.post.fetch_failures = (self.post.fetch_failures or 0) + 1
+        self.post.fetch_error    = error
+        self.post.fetch_failed   = permanent
+
+    @reraise(klass=FetchError)
+    def fetch(self, save=True, response=None):
         """
         Fetches the entire webpage for the post. If save, adds the page to
-        the content of the post and saves it back to the database.
+        the content of the post and saves it back to the database. If the
+        response has already been downloaded, it can be passed in directly.
 
         Raises an exception if not wrangled yet.
         Raises exceptions if there is a problem with the fetch.
@@ -164,13 +380,21 @@ class PostWrangler(object):
         if not self.is_wrangled():
             raise ValueError("Entry not yet wrangled, cannot fetch.")
 
-        response = requests.get(self.post.url, timeout=settings.timeout)
-        response.raise_for_status()
+        if response is None:
+            response = self.download()
 
+        size = content_size(self.post.content)
         if response.text:
             self.post.content = response.text
+        self.post.fetched = datetime.now()
 
         if save:
             self.post.save()
 
+            # Don't dereference the feed of the post just to update its size.
+            feed  = self.post._data.get('feed')
+            delta = content_size(self.post.content) - size
+            if delta and isinstance(feed, (Feed, DBRef)):
+                Feed.objects(id=feed.id).update_one(inc__content_bytes=delta)
+
         return self.post
@@ -19,11 +19,15 @@ Flask application definition in Baleen.
 
 import baleen
 
+from bson import ObjectId
+from bson.errors import InvalidId
+from dateutil import parser as dtparser
+
 from baleen.config import settings
 from baleen.models import Feed, Post, Job, Log
 from baleen.utils.timez import WEB_UTC_DATETIME
 
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, url_for
 from flask.ext.mongoengine import MongoEngine
 from flask_humanize import Humanize
 
@@ -50,6 +54,36 @@ db = MongoEngine(app)
 # add the humanize extension
 humanize = Humanize(app)
 
+##########################################################################
+## Helper Functions
+##########################################################################
+
+# Levels that the log records can be filtered by
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Query arguments of the logs view that are kept when paging
+LOG_FILTERS = ('per_page', 'level', 'logger', 'since', 'until')
+
+
+def parse_cursor(value):
+    """
+    Parses the id of a log record in the query string, or returns None.
+    """
+    try:
+        return ObjectId(value) if value else None
+    except (InvalidId, TypeError):
+        return None
+
+
+def parse_date(value):
+    """
+    Parses a date (and time) in the query string, or returns None.
+    """
+    try:
+        return dtparser.parse(value) if value else None
+    except (ValueError, OverflowError):
+        return None
+
 ##########################################################################
 ## Routes
 ##########################################################################
@@ -125,32 +159,41 @@ def status():
 @app.route("/logs/")
 def logs():
     """
-    Displays log records from the Mongo Database.
-    This is paginated and allows flexible per-page counts (max 200 record).
+    Displays log records from the Mongo Database, newest first.
+    This is paginated by the ids of the records on either side of the page
+    (so deep pages are as fast as the first), allows flexible per-page
+    counts (max 200 records) and filters by level, logger and time range.
     """
-    # Get pagination information for request
-    page = int(request.args.get('page', 1))
+    # Get pagination and filter information for request
     per_page = min(int(request.args.get('per_page', 50)), 200)
-
-    # Compute the pagination variables
-    n_logs   = Log.objects.count()
-    n_pages  = (n_logs + per_page // 2) // per_page
-    nextp    = page + 1 if page + 1 <= n_pages else None
-    prevp    = page - 1 if page > 1 else None
+    filters  = {
+        'level': request.args.get('level') or None,
+        'logger': request.args.get('logger') or None,
+        'since': parse_date(request.args.get('since')),
+        'until': parse_date(request.args.get('until')),
+    }
 
     # Perform query
-    offset   = (page - 1) * per_page
-    logs     = Log.objects.order_by('-id').skip(offset).limit(per_page)
+    logs, newer, older = Log.page(
+        before=parse_cursor(request.args.get('before')),
+        after=parse_cursor(request.args.get('after')),
+        per_page=per_page, **filters
+    )
+
+    # Link to the adjacent pages with the same filters
+    params = {
+        key: request.args[key] for key in LOG_FILTERS if request.args.get(key)
+    }
 
     return render_template(
         'logs.html',
-        page = page,
-        num_pages = n_pages,
         per_page  = per_page,
         logs = logs,
-        num_logs = n_logs,
-        next = nextp,
-        prev = prevp,
+        num_logs = Log.estimated_count(),
+        levels = LOG_LEVELS,
+        filters = params,
+        newer = url_for('logs', after=newer, **params) if newer else None,
+        older = url_for('logs', before=older, **params) if older else None,
     )
 
 
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# benchmark the cost of formatting log records for mongo.
+
+import sys
+import time
+import socket
+import getpass
+import logging
+import argparse
+
+from datetime import datetime
+from baleen.utils.mongolog import MongoFormatter
+
+
+class LegacyMongoFormatter(logging.Formatter):
+    """
+    The formatter before it was made lean: copies the record, builds dicts
+    that are discarded, and looks up the user and host on every record.
+    """
+
+    def format(self, record):
+        data      = record.__dict__.copy()
+        message   = super(LegacyMongoFormatter, self).format(record)
+        timestamp = datetime.fromtimestamp(data.pop('created'))
+        location  = {
+            'module': data.pop('module'),
+            'file': data.pop('pathname'),
+            'filename': data.pop('filename'),
+            'lineno': data.pop('lineno'),
+            'method': data.pop('funcName')
+        }
+        error     = {
+            'info': data.pop('exc_info'),
+            'text': data.pop('exc_text'),
+        }
+        process   = {
+            'process': data.pop('process'),
+            'processName': data.pop('processName'),
+            'thread': data.pop('thread'),
+            'threadName': data.pop('threadName'),
+        }
+        logger    = data.pop('name')
+        level     = {
+            'number': data.pop('levelno'),
+            'name': data.pop('levelname'),
+        }
+        info      = tuple(unicode(arg) for arg in data.pop('args'))
+
+        for key in ('relativeCreated', 'msecs', 'msg'):
+            del data[key]
+
+        data.update({
+            'logger': logger,
+            'message': message,
+            'timestamp': timestamp,
+            'level': level,
+            'error': error,
+            'user': getpass.getuser(),
+            'host': socket.gethostname(),
+        })
+
+        return data
+
+
+def make_records(count, errors):
+    """
+    Returns log records like those of the ingestor, where every record is
+    an error with a traceback if errors is True.
+    """
+    records = []
+    for idx in xrange(count):
+        exc_info = None
+        if errors:
+            try:
+                raise ValueError("could not wrangle entry {}".format(idx))
+            except ValueError:
+                exc_info = sys.exc_info()
+
+        records.append(logging.LogRecord(
+            'baleen.ingest', logging.ERROR, __file__, idx,
+            u"Post Error for feed %s on entry %d", ("http://example.com/feed/", idx),
+            exc_info, func='post_error',
+        ))
+        records[-1].user = 'baleen'
+    return records
+
+
+def bench(formatter, records, rounds):
+    """
+    Returns the mean number of microseconds to format a record. The cached
+    traceback text is cleared so every round formats it again.
+    """
+    start = time.time()
+    for idx in xrange(rounds):
+        for record in records:
+            record.exc_text = None
+            formatter.format(record)
+    return (time.time() - start) * 1000000.0 / (rounds * len(records))
+
+
+def main(args):
+    records = make_records(args.records, args.errors)
+
+    print("{} {}records formatted {} times".format(
+        len(records), "error " if args.errors else "", args.rounds
+    ))
+    print("legacy: {:0.2f} us/record".format(
+        bench(LegacyMongoFormatter(), records, args.rounds)
+    ))
+    print("lean:   {:0.2f} us/record".format(
+        bench(MongoFormatter(), records, args.rounds)
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="benchmark the formatting of log records for mongo"
+    )
+
+    parser.add_argument(
+        "-r", "--rounds", default=20, type=int,
+        help="number of times to format every record",
+    )
+
+    parser.add_argument(
+        "-n", "--records", default=1000, type=int,
+        help="number of log records to format",
+    )
+
+    parser.add_argument(
+        "-e", "--errors", action="store_true", default=False,
+        help="log every record with an exception and its traceback",
+    )
+
+    args = parser.parse_args()
+    main(args)
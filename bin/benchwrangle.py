@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# benchmark the cost of copying entries when wrangling posts.
+
+import sys
+import time
+import pickle
+import argparse
+import feedparser
+
+from copy import deepcopy
+from dateutil import parser as dtparser
+from baleen.models import Post
+from baleen.wrangle import PostWrangler
+from baleen.wrangle import FEEDPARSER_REMOVABLE_FIELDS, WRANGLED_FIELDS
+
+
+FIXTURE = "tests/fixtures/feedparser_result.pickle"
+
+
+def load_entries(paths):
+    """
+    Loads the entries of pickled feedparser results or of raw feed files.
+    """
+    entries = []
+    for path in paths:
+        if path.endswith(".pickle"):
+            with open(path, 'rb') as f:
+                entries.extend(pickle.load(f).entries)
+        else:
+            entries.extend(feedparser.parse(path).entries)
+    return entries
+
+
+def deepsize(obj, seen):
+    """
+    Returns the size in bytes of the object and everything it references,
+    excluding the objects whose ids are already in seen.
+    """
+    if id(obj) in seen:
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(deepsize(k, seen) + deepsize(v, seen) for k, v in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deepsize(item, seen) for item in obj)
+
+    return size
+
+
+def legacy_copies(entry):
+    """
+    Returns the copies the wrangler used to make of an entry: a deep copy
+    (in PostWrangler.factory), then a shallow copy of the deep copy (in
+    PostWrangler.wrangle) that the post fields were popped from.
+    """
+    copy = deepcopy(entry)
+    return [copy, copy.copy()]
+
+
+def current_copies(entry):
+    """
+    Returns the dict of the fields kept from an entry, which is the only
+    container the copy-free wrangler builds before creating the post.
+    """
+    return [dict(
+        (key, val) for key, val in entry.iteritems()
+        if key not in FEEDPARSER_REMOVABLE_FIELDS and key not in WRANGLED_FIELDS
+    )]
+
+
+def allocated_bytes(copies, entry):
+    """
+    Returns the number of bytes allocated by the copies of an entry made by
+    one of the wrangling paths. Objects shared with the original entry (e.g.
+    strings) are not counted, so both paths are measured the same way.
+    """
+    seen = set()
+    deepsize(entry, seen)
+    return sum(deepsize(obj, seen) for obj in copies(entry))
+
+
+def legacy(entry):
+    """
+    The wrangling path before it was made copy-free, reproduced line by line
+    from the old PostWrangler.factory and PostWrangler.wrangle.
+    """
+    entry = deepcopy(entry)
+    post  = entry.copy()
+
+    for field in FEEDPARSER_REMOVABLE_FIELDS:
+        if field in post: del post[field]
+
+    post['pubdate'] = dtparser.parse(post.pop('published')) if 'published' in post else None
+    post['tags'] = [tag['term'] for tag in entry.tags] if 'tags' in post else []
+
+    post['url'] = entry.link or post.get('href', None) or entry.id
+    if 'link' in post: del post['link']
+
+    if 'content' not in post:
+        post['content'] = post.get('summary')
+    else:
+        selected = None
+        for idx, item in enumerate(post['content']):
+            if idx == 0:
+                selected = item
+            elif item['type'] == 'text/html':
+                selected = item
+
+        post['language'] = selected.get('language')
+        post['mimetype'] = selected.get('type')
+        post['content']  = selected.get('value')
+
+    return Post(feed=None, **post)
+
+
+def current(entry):
+    return PostWrangler(entry).wrangle(save=False)
+
+
+def bench(func, entries, rounds):
+    """
+    Returns the mean number of milliseconds to wrangle an entry.
+    """
+    start = time.time()
+    for idx in xrange(rounds):
+        for entry in entries:
+            func(entry)
+    return (time.time() - start) * 1000.0 / (rounds * len(entries))
+
+
+def main(args):
+    entries = load_entries(args.feeds)
+    if not entries:
+        print("no entries found in {}".format(", ".join(args.feeds)))
+        return
+
+    def mean(func):
+        return sum(func(entry) for entry in entries) / float(len(entries))
+
+    size = mean(lambda entry: deepsize(entry, set()))
+    print("{} entries with a mean size of {:0.1f} KB".format(len(entries), size / 1024))
+
+    for name, func, copies in (
+            ("legacy  (deepcopy + copy)", legacy, legacy_copies),
+            ("current (kept fields)    ", current, current_copies),
+        ):
+        print("{}: {:0.3f} ms/entry, {:0.1f} KB copied/entry".format(
+            name, bench(func, entries, args.rounds),
+            mean(lambda entry: allocated_bytes(copies, entry)) / 1024
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="benchmark copy-free wrangling of feed entries into posts"
+    )
+
+    parser.add_argument(
+        "-r", "--rounds", default=20, type=int,
+        help="number of times to wrangle every entry",
+    )
+
+    parser.add_argument(
+        "feeds", nargs="*", default=[FIXTURE],
+        help="pickled feedparser results or feed files (xml) to wrangle",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,170 @@
+# tests.test_cache
+# Test the on-disk cache of downloaded feeds.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 18:02:35 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_cache.py [] benjamin@bengfort.com $
+
+"""
+Test the on-disk cache of downloaded feeds.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from baleen.cache import HTTPCache
+from baleen.feed import FeedSync
+from baleen.models import Feed
+
+from .test_feed import MockResponse, RSS_CONTENT, STR_FEED, OPML_FEED
+
+
+##########################################################################
+## HTTP Cache Tests
+##########################################################################
+
+class HTTPCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path  = tempfile.mkdtemp()
+        self.cache = HTTPCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_set_get(self):
+        """
+        Test that responses with validators are stored compressed
+        """
+        response = MockResponse(RSS_CONTENT * 10, headers={
+            'ETag': '"abc"', 'Content-Type': 'application/rss+xml', 'Server': 'x',
+        })
+
+        self.assertTrue(self.cache.set(STR_FEED, response))
+        self.assertLess(os.path.getsize(self.cache.key(STR_FEED)), len(response.content))
+
+        cached = self.cache.get(STR_FEED)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.content, RSS_CONTENT * 10)
+        self.assertEqual(cached.url, STR_FEED)
+        self.assertEqual(cached.headers['etag'], '"abc"')
+        self.assertEqual(cached.headers['content-type'], 'application/rss+xml')
+        self.assertNotIn('server', cached.headers)
+
+    def test_no_validators(self):
+        """
+        Test that responses without validators are not stored
+        """
+        self.assertFalse(self.cache.set(STR_FEED, MockResponse(RSS_CONTENT)))
+        self.assertIsNone(self.cache.get(STR_FEED))
+        self.assertEqual(self.cache.headers(STR_FEED), {})
+
+    def test_no_validators_removes_stale(self):
+        """
+        Test that a response without validators removes the cached entry
+        """
+        self.assertTrue(self.cache.set(STR_FEED, MockResponse(RSS_CONTENT, headers={'ETag': '"abc"'})))
+        self.assertFalse(self.cache.set(STR_FEED, MockResponse(RSS_CONTENT * 2)))
+        self.assertIsNone(self.cache.get(STR_FEED))
+        self.assertEqual(self.cache.headers(STR_FEED), {})
+
+    def test_headers(self):
+        """
+        Test the conditional request headers of cached responses
+        """
+        cases = (
+            ({'ETag': '"abc"', 'Last-Modified': 'Wed, 02 Mar 2016 22:00:06 GMT'},
+             {'If-None-Match': '"abc"'}),
+            ({'Last-Modified': 'Wed, 02 Mar 2016 22:00:06 GMT'},
+             {'If-Modified-Since': 'Wed, 02 Mar 2016 22:00:06 GMT'}),
+        )
+
+        for headers, expected in cases:
+            self.cache.set(STR_FEED, MockResponse(RSS_CONTENT, headers=headers))
+            self.assertEqual(self.cache.headers(STR_FEED), expected)
+
+    def test_update(self):
+        """
+        Test that a 304 is replaced with the cached response
+        """
+        fresh = MockResponse(RSS_CONTENT, headers={'ETag': '"abc"'})
+        self.assertIs(self.cache.update(STR_FEED, fresh), fresh)
+
+        cached = self.cache.update(STR_FEED, MockResponse("", 304))
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.content, RSS_CONTENT)
+
+        # Uncached 304s and errors are returned unchanged
+        self.cache.delete(STR_FEED)
+        for status in (304, 500):
+            response = MockResponse("", status)
+            self.assertIs(self.cache.update(STR_FEED, response), response)
+
+    def test_corrupt(self):
+        """
+        Test that corrupt entries are treated as not cached
+        """
+        with open(self.cache.key(STR_FEED), 'wb') as f:
+            f.write('{"url": "http://example.com/", "headers": {}}\nnot zlib')
+
+        self.assertIsNone(self.cache.get(STR_FEED))
+
+
+##########################################################################
+## Feed Sync Cache Tests
+##########################################################################
+
+class FeedSyncCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        patcher   = mock.patch('baleen.cache.settings.http.cache', self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_cached_feeds(self, mock_get):
+        """
+        Test that url and OPML feeds reuse the cached body on a 304
+        """
+        for feed in (STR_FEED, OPML_FEED):
+            url = FeedSync(feed).url
+            mock_get.return_value = MockResponse(RSS_CONTENT, url=url, headers={'ETag': '"abc"'})
+            self.assertEqual(len(FeedSync(feed).entries()), 2)
+            self.assertEqual(mock_get.call_args[1]['headers'], {})
+
+            mock_get.return_value = MockResponse("", 304, url=url)
+            self.assertEqual(len(FeedSync(feed).entries()), 2)
+            self.assertEqual(mock_get.call_args[1]['headers'], {'If-None-Match': '"abc"'})
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_models_not_cached(self, mock_get):
+        """
+        Test that models use their own validators rather than the cache
+        """
+        feed  = Feed(link=STR_FEED, category="test")
+        fsync = FeedSync(feed)
+        self.assertIsNone(fsync.cache)
+
+        mock_get.return_value = MockResponse(RSS_CONTENT, headers={'ETag': '"abc"'})
+        fsync.fetch()
+        self.assertEqual(os.listdir(self.path), [])
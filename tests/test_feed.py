@@ -31,7 +31,8 @@ except ImportError:
 from baleen.feed import *
 from baleen.models import *
 from urlparse import urlparse
-from baleen.exceptions import FeedTypeError
+from requests.structures import CaseInsensitiveDict
+from baleen.exceptions import FeedTypeError, SynchronizationError
 
 ##########################################################################
 ## Fixtures
@@ -55,6 +56,38 @@ MONGO_FEED   = Feed(
     category = u'books',
 )
 
+RSS_CONTENT  = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<rss version="2.0"><channel><title>Example Feed</title>'
+    '<link>http://example.com/</link>'
+    '<item><title>First Post</title><link>http://example.com/1/</link>'
+    '<description>The first post</description></item>'
+    '<item><title>Second Post</title><link>http://example.com/2/</link>'
+    '<description>The second post</description></item>'
+    '</channel></rss>'
+)
+
+
+class MockResponse(object):
+
+    def __init__(self, content, status_code=200, url=STR_FEED, headers=None):
+        self.content     = content
+        self.status_code = status_code
+        self.url         = url
+        self.headers     = CaseInsensitiveDict(headers or {})
+        self.raw         = None
+
+    def iter_content(self, chunk_size=1):
+        for idx in xrange(0, len(self.content), chunk_size):
+            yield self.content[idx:idx+chunk_size]
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception("HTTP {}".format(self.status_code))
+
 ##########################################################################
 ## Feed Synchronization Tests
 ##########################################################################
@@ -72,6 +105,9 @@ class FeedSyncTests(unittest.TestCase):
         for feed in Feed.objects(): feed.delete()
         for post in Post.objects(): post.delete()
 
+        # Forget the body synchronized by a previous test
+        MONGO_FEED.digest = None
+
     def tearDown(self):
         """
         Drop the mongomock connection
@@ -133,8 +169,9 @@ class FeedSyncTests(unittest.TestCase):
             fsync = FeedSync(feed)
             self.assertEqual(fsync.url, url)
 
+    @mock.patch('baleen.feed.FeedSync.fetch')
     @mock.patch('baleen.feed.feedparser.parse')
-    def test_feedparser_wrapping(self, mock_feedparser):
+    def test_feedparser_wrapping(self, mock_feedparser, mock_fetch):
         """
         Test the feedparser access by mocking feedparser calls
         """
@@ -150,39 +187,51 @@ class FeedSyncTests(unittest.TestCase):
         )
 
         for feed, url in cases:
+            mock_fetch.return_value = MockResponse(RSS_CONTENT, url=url)
+
             fsync  = FeedSync(feed)
             result = fsync.parse()
-            mock_feedparser.assert_called_with(url)
+            mock_feedparser.assert_called_with(
+                RSS_CONTENT, response_headers={'content-location': url}
+            )
 
-    @mock.patch('baleen.feed.feedparser.parse')
-    def test_feedparser_wrapping(self, mock_feedparser):
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_conditional_fetch(self, mock_get):
         """
-        Test etag and modified blocking on feedparser for Feed objects
+        Test etag and modified blocking on fetch for Feed objects
         """
-
-        # Ensure that the mocking worked out for us
-        assert mock_feedparser is feedparser.parse
+        mock_get.return_value = MockResponse("", status_code=304)
 
         feed = Feed(link = u'https://mubi.com/notebook/posts.atom')
         feed.etag = 'abcdefg'
 
         # Test Case 1: etag but no modified
         result = FeedSync(feed).parse()
-        mock_feedparser.assert_called_with(feed.link, etag=feed.etag)
+        mock_get.assert_called_with(
+            feed.link, headers={'If-None-Match': feed.etag},
+            timeout=mock.ANY, stream=True,
+        )
 
         # Test Case 2: modified but no etag
         feed.etag = None
         feed.modified = "Fri, 11 Jun 2012 23:00:34 GMT"
         result = FeedSync(feed).parse()
-        mock_feedparser.assert_called_with(feed.link, modified=feed.modified)
+        mock_get.assert_called_with(
+            feed.link, headers={'If-Modified-Since': feed.modified},
+            timeout=mock.ANY, stream=True,
+        )
 
         # Test Case 3: modified and etag
         feed.etag = 'hijklmnop'
         result = FeedSync(feed).parse()
-        mock_feedparser.assert_called_with(feed.link, etag=feed.etag)
+        mock_get.assert_called_with(
+            feed.link, headers={'If-None-Match': feed.etag},
+            timeout=mock.ANY, stream=True,
+        )
 
+    @mock.patch('baleen.feed.FeedSync.fetch')
     @mock.patch('baleen.feed.feedparser.parse')
-    def test_feed_sync(self, mock_feedparser):
+    def test_feed_sync(self, mock_feedparser, mock_fetch):
         """
         Test that sync updates the Feed object
         """
@@ -192,6 +241,7 @@ class FeedSyncTests(unittest.TestCase):
         # Give the mock feedparser a result!
         with open(RESULT, 'rb') as f:
             mock_feedparser.return_value = pickle.load(f)
+        mock_fetch.return_value = MockResponse(RSS_CONTENT, url=MONGO_FEED.link)
 
         fsync  = FeedSync(MONGO_FEED)
         result = fsync.sync()
@@ -207,8 +257,14 @@ class FeedSyncTests(unittest.TestCase):
         self.assertEqual(feed.link, MONGO_FEED.link)
         self.assertIsNotNone(feed.fetched)
 
+        # Ensure that the next poll has been scheduled.
+        self.assertIsNotNone(feed.polled)
+        self.assertIsNotNone(feed.interval)
+        self.assertGreater(feed.next_poll, feed.polled)
+
+    @mock.patch('baleen.feed.FeedSync.fetch')
     @mock.patch('baleen.feed.feedparser.parse')
-    def test_feed_sync_mongodb(self, mock_feedparser):
+    def test_feed_sync_mongodb(self, mock_feedparser, mock_fetch):
         """
         Test the sync MongoDB interaction
         """
@@ -218,6 +274,7 @@ class FeedSyncTests(unittest.TestCase):
         # Give the mock feedparser a result!
         with open(RESULT, 'rb') as f:
             mock_feedparser.return_value = pickle.load(f)
+        mock_fetch.return_value = MockResponse(RSS_CONTENT, url=MONGO_FEED.link)
 
         fsync  = FeedSync(MONGO_FEED)
 
@@ -229,8 +286,9 @@ class FeedSyncTests(unittest.TestCase):
         result = fsync.sync()
         self.assertEqual(Feed.objects.count(), 1)
 
+    @mock.patch('baleen.feed.FeedSync.fetch')
     @mock.patch('baleen.feed.feedparser.parse')
-    def test_feed_sync_non_model(self, mock_feedparser):
+    def test_feed_sync_non_model(self, mock_feedparser, mock_fetch):
         """
         Test the sync with a non-model feed.
         """
@@ -240,9 +298,117 @@ class FeedSyncTests(unittest.TestCase):
         # Give the mock feedparser a result!
         with open(RESULT, 'rb') as f:
             mock_feedparser.return_value = pickle.load(f)
+        mock_fetch.return_value = MockResponse(RSS_CONTENT, url=OPML_FEED['xmlUrl'])
 
         fsync  = FeedSync(OPML_FEED)
 
         # Test sync without save
         result = fsync.sync()
         self.assertEqual(Feed.objects.count(), 0)
+
+    def test_conditional_headers(self):
+        """
+        Test that only models send etag and modified headers
+        """
+        self.assertEqual(FeedSync(STR_FEED).headers(), {})
+        self.assertEqual(FeedSync(OPML_FEED).headers(), {})
+
+        feed = Feed(link = u'https://mubi.com/notebook/posts.atom')
+        self.assertEqual(FeedSync(feed).headers(), {})
+
+        feed.modified = "Fri, 11 Jun 2012 23:00:34 GMT"
+        self.assertEqual(
+            FeedSync(feed).headers(), {'If-Modified-Since': feed.modified}
+        )
+
+        feed.etag = 'abcdefg'
+        self.assertEqual(FeedSync(feed).headers(), {'If-None-Match': 'abcdefg'})
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_fetch(self, mock_get):
+        """
+        Test that fetch downloads the feed with conditional headers
+        """
+        mock_get.return_value = MockResponse(RSS_CONTENT)
+
+        feed = Feed(link = u'https://mubi.com/notebook/posts.atom', etag='abc')
+        response = FeedSync(feed).fetch()
+
+        self.assertIs(response, mock_get.return_value)
+        mock_get.assert_called_once_with(
+            feed.link, headers={'If-None-Match': 'abc'},
+            timeout=(10, 60), stream=True,
+        )
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_fetch_error(self, mock_get):
+        """
+        Test that HTTP errors during fetch raise SynchronizationError
+        """
+        mock_get.return_value = MockResponse("", status_code=500)
+
+        with self.assertRaises(SynchronizationError):
+            FeedSync(STR_FEED).fetch()
+
+        # Not Modified is not an error
+        mock_get.return_value = MockResponse("", status_code=304)
+        self.assertEqual(FeedSync(STR_FEED).fetch().status_code, 304)
+
+    def test_parse_response(self):
+        """
+        Test parsing a fetched response rather than downloading
+        """
+        response = MockResponse(RSS_CONTENT, headers={
+            'ETag': 'W/"abcdef"',
+            'Last-Modified': 'Wed, 02 Mar 2016 22:00:06 GMT',
+            'Content-Type': 'application/rss+xml; charset=utf-8',
+            'Content-Encoding': 'gzip',
+        })
+
+        result = FeedSync(STR_FEED).parse(response)
+        self.assertEqual(result.status, 200)
+        self.assertEqual(result.href, STR_FEED)
+        self.assertEqual(result.etag, u'W/"abcdef"')
+        self.assertEqual(result.modified, 'Wed, 02 Mar 2016 22:00:06 GMT')
+        self.assertEqual(result.feed.title, u'Example Feed')
+        self.assertEqual(len(result.entries), 2)
+        self.assertEqual(result.entries[0].link, u'http://example.com/1/')
+
+    def test_parse_not_modified(self):
+        """
+        Test parsing a Not Modified response returns no entries
+        """
+        response = MockResponse("", status_code=304)
+        fsync    = FeedSync(MONGO_FEED)
+
+        self.assertEqual(fsync.entries(save=False, response=response), [])
+        self.assertIsNotNone(MONGO_FEED.fetched)
+
+    @mock.patch('baleen.feed.feedparser.parse', wraps=feedparser.parse)
+    def test_parse_unchanged(self, mock_parse):
+        """
+        Test that an unchanged body is not parsed again
+        """
+        feed  = Feed(link="http://example.com/rss/", category="test")
+        fsync = FeedSync(feed)
+        self.assertEqual(len(fsync.entries(response=MockResponse(RSS_CONTENT))), 2)
+        self.assertFalse(fsync.unchanged)
+        self.assertIsNotNone(feed.digest)
+        self.assertEqual(feed.failures, 0)
+
+        fsync = FeedSync(feed)
+        self.assertEqual(fsync.entries(response=MockResponse(RSS_CONTENT)), [])
+        self.assertTrue(fsync.unchanged)
+        self.assertEqual(feed.failures, 1)
+        self.assertEqual(mock_parse.call_count, 1)
+
+        fsync   = FeedSync(feed)
+        changed = RSS_CONTENT.replace("First", "Third")
+        self.assertEqual(len(fsync.entries(response=MockResponse(changed))), 2)
+        self.assertFalse(fsync.unchanged)
+        self.assertEqual(feed.failures, 0)
+
+        # The stream of an unchanged body is empty
+        fsync = FeedSync(feed)
+        self.assertEqual(list(fsync.stream(response=MockResponse(changed))), [])
+        self.assertTrue(fsync.unchanged)
@@ -0,0 +1,371 @@
+# tests.test_fetch
+# Test the concurrent fetching of the webpages of posts.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 19:08:14 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_fetch.py [] benjamin@bengfort.com $
+
+"""
+Test the concurrent fetching of the webpages of posts.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import requests
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from datetime import datetime, timedelta
+
+from .test_models import MongoTestMixin
+from .test_feed import MockResponse
+
+from baleen.fetch import *
+from baleen.ingest import Ingestor
+from baleen.config import settings
+from baleen.wrangle import PostWrangler
+from baleen.models import Post, FetchTask
+from baleen.exceptions import FetchError, TimeoutError
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def fetch_error(original):
+    error = FetchError(str(original))
+    error.original = original
+    return error
+
+
+def http_error(status):
+    return fetch_error(requests.HTTPError(response=MockResponse("", status)))
+
+
+def mock_post(*errors):
+    """
+    Returns a mock post wrangler whose fetch raises the errors in order
+    and then succeeds.
+    """
+    post = mock.MagicMock()
+    post.fetch.side_effect = list(errors) + [post]
+    return post
+
+
+##########################################################################
+## Post Fetcher Tests
+##########################################################################
+
+class PostFetcherTests(unittest.TestCase):
+
+    def test_retryable(self):
+        """
+        Test that only transient errors are retried
+        """
+        cases = (
+            (fetch_error(requests.Timeout()), True),
+            (fetch_error(requests.ConnectionError()), True),
+            (fetch_error(TimeoutError()), True),
+            (http_error(503), True),
+            (http_error(429), True),
+            (http_error(404), False),
+            (fetch_error(ValueError()), False),
+        )
+
+        for error, expected in cases:
+            self.assertEqual(retryable(error), expected)
+
+    def test_fetch(self):
+        """
+        Test that every post is fetched by the workers
+        """
+        # Mocks don't count calls from concurrent threads reliably.
+        fetched  = []
+        posts    = [mock_post() for idx in xrange(20)]
+
+        with PostFetcher(workers=4, callback=fetched.append) as fetcher:
+            for post in posts:
+                fetcher.put(post)
+
+        for post in posts:
+            post.fetch.assert_called_once_with()
+        self.assertEqual(len(fetched), 20)
+        self.assertEqual(fetcher.counts['fetched'], 20)
+
+    def test_retry(self):
+        """
+        Test that transient errors are retried after a delay
+        """
+        callback = mock.MagicMock()
+        errback  = mock.MagicMock()
+
+        flaky  = mock_post(http_error(503), fetch_error(requests.Timeout()))
+        broken = mock_post(*[http_error(503)] * 3)
+        gone   = mock_post(http_error(404))
+
+        fetcher = PostFetcher(workers=2, retries=2, delay=0.01, callback=callback, errback=errback)
+        with fetcher:
+            for post in (flaky, broken, gone):
+                fetcher.put(post)
+
+        self.assertEqual(flaky.fetch.call_count, 3)
+        self.assertEqual(broken.fetch.call_count, 3)
+        self.assertEqual(gone.fetch.call_count, 1)
+
+        callback.assert_called_once_with(flaky)
+        self.assertEqual([call[0][0] for call in errback.call_args_list].count(broken), 1)
+        self.assertEqual([call[0][0] for call in errback.call_args_list].count(gone), 1)
+
+        self.assertEqual(fetcher.counts['fetched'], 1)
+        self.assertEqual(fetcher.counts['errors'], 2)
+        self.assertEqual(fetcher.counts['retried'], 4)
+
+        # Only the final failure of a post is recorded on it
+        flaky.failed.assert_not_called()
+        self.assertFalse(broken.failed.call_args[1]['permanent'])
+        self.assertTrue(gone.failed.call_args[1]['permanent'])
+
+    def test_restart(self):
+        """
+        Test that a fetcher can be joined without starting, and restarted
+        """
+        fetcher = PostFetcher(workers=2)
+        fetcher.join()
+
+        for idx in xrange(2):
+            with fetcher:
+                fetcher.put(mock_post())
+        self.assertEqual(fetcher.counts['fetched'], 2)
+
+    def test_unexpected_error(self):
+        """
+        Test that unexpected errors are raised on join
+        """
+        fetcher = PostFetcher(workers=2)
+        fetcher.put(mock_post(ValueError("bug")))
+
+        with self.assertRaises(ValueError):
+            fetcher.join()
+
+
+##########################################################################
+## Catch-up Tests
+##########################################################################
+
+class CatchupTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(CatchupTests, self).setUp()
+        self.created = datetime(2016, 3, 1, 12, 0, 0)
+        for idx in xrange(5):
+            Post(
+                url="http://example.com/{}/".format(idx), content="summary {}".format(idx),
+                fetched=datetime.now() if idx % 2 else None,
+                created=self.created + timedelta(days=idx),
+            ).save()
+
+    def test_unfetched(self):
+        """
+        Test that only posts without a fetched webpage are caught up
+        """
+        urls = [post.url for post in unfetched(batch=2)]
+        self.assertEqual(urls, [
+            "http://example.com/0/", "http://example.com/2/", "http://example.com/4/",
+        ])
+        self.assertEqual(len(list(unfetched(limit=2))), 2)
+        self.assertEqual(len(list(unfetched(limit=2, batch=1))), 2)
+
+        since = self.created + timedelta(days=1)
+        urls  = [post.url for post in unfetched(since=since)]
+        self.assertEqual(urls, ["http://example.com/2/", "http://example.com/4/"])
+
+    def test_unfetched_same_created(self):
+        """
+        Test that batches don't skip posts created at the same time
+        """
+        for idx in xrange(5, 10):
+            Post(
+                url="http://example.com/{}/".format(idx), content="summary {}".format(idx),
+                created=self.created,
+            ).save()
+
+        self.assertEqual(len(list(unfetched(batch=2))), 8)
+
+    def test_unfetched_skips_failed_and_legacy(self):
+        """
+        Test that permanently failed and legacy posts are not caught up
+        """
+        post = Post.objects.get(url="http://example.com/0/")
+        PostWrangler(post).failed(ValueError("gone"), permanent=True)
+
+        post = Post.objects.get(url="http://example.com/2/")
+        PostWrangler(post).failed(ValueError("timed out"), permanent=False)
+
+        # A post stored before fetches were recorded
+        Post._get_collection().update_one(
+            {'url': "http://example.com/4/"}, {'$unset': {'fetch_failed': 1}}
+        )
+
+        urls = [post.url for post in unfetched()]
+        self.assertEqual(urls, ["http://example.com/2/"])
+
+    @mock.patch('baleen.wrangle.http.get')
+    def test_catchup(self, mock_get):
+        """
+        Test that the catch-up pass fetches the unfetched posts
+        """
+        mock_get.return_value = MockResponse("")
+        mock_get.return_value.text = u"<html>page</html>"
+
+        counts = catchup(workers=2)
+        self.assertEqual(counts['fetched'], 3)
+        self.assertEqual(Post.objects(fetched=None).count(), 0)
+        self.assertEqual(Post.objects(content=u"<html>page</html>").count(), 3)
+
+    @mock.patch('baleen.wrangle.http.get')
+    def test_catchup_records_failures(self, mock_get):
+        """
+        Test that permanent failures are recorded and not caught up again
+        """
+        mock_get.return_value = MockResponse("", 404)
+
+        counts = catchup(workers=2)
+        self.assertEqual(counts['errors'], 3)
+        self.assertEqual(Post.objects(fetch_failed=True, fetch_failures=1).count(), 3)
+        self.assertIn("404", Post.objects(fetch_failed=True).first().fetch_error)
+
+        mock_get.reset_mock()
+        self.assertEqual(catchup(workers=2)['errors'], 0)
+        mock_get.assert_not_called()
+
+
+##########################################################################
+## Fetch Queue Tests
+##########################################################################
+
+class FetchQueueTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(FetchQueueTests, self).setUp()
+        for task in FetchTask.objects(): task.delete()
+
+        self.posts = []
+        for idx in xrange(3):
+            post = Post(url="http://example.com/{}/".format(idx), content="summary {}".format(idx))
+            post.save()
+            self.posts.append(post)
+
+    def test_enqueue(self):
+        """
+        Test that saved posts are queued once
+        """
+        wrangler = PostWrangler(self.posts[0])
+        self.assertTrue(wrangler.enqueue())
+        self.assertFalse(wrangler.enqueue())
+        self.assertEqual(FetchTask.objects.count(), 1)
+
+        with self.assertRaises(FetchError):
+            PostWrangler(Post(url="http://example.com/new/")).enqueue()
+
+    def test_acquire(self):
+        """
+        Test that leased tasks are not due until the lease expires
+        """
+        for post in self.posts:
+            PostWrangler(post).enqueue()
+
+        worker = FetchWorker(lease=60, name="test")
+        now    = datetime.utcnow() + timedelta(seconds=1)
+        leased = [worker.acquire(now) for idx in xrange(4)]
+
+        self.assertIsNone(leased[-1])
+        self.assertEqual(set(task.post.id for task in leased[:3]), set(post.id for post in self.posts))
+        for task in leased[:3]:
+            self.assertEqual(task.worker, "test")
+            self.assertEqual(task.due, now + timedelta(seconds=60))
+
+        # Expired leases are leased again
+        self.assertIsNotNone(worker.acquire(now + timedelta(seconds=61)))
+
+    @mock.patch.object(settings.fetch, 'retries', 2)
+    @mock.patch.object(settings.fetch, 'delay', 10)
+    def test_fail(self):
+        """
+        Test that failed tasks are retried with exponential backoff
+        """
+        PostWrangler(self.posts[0]).enqueue()
+        worker = FetchWorker(name="test")
+        task   = FetchTask.objects.first()
+        now    = datetime.utcnow()
+
+        worker.fail(task, http_error(503), now)
+        self.assertEqual((task.attempts, task.failed), (1, False))
+        self.assertEqual(task.due, now + timedelta(seconds=10))
+
+        worker.fail(task, http_error(503), now)
+        self.assertEqual((task.attempts, task.failed), (2, False))
+        self.assertEqual(task.due, now + timedelta(seconds=20))
+
+        worker.fail(task, http_error(503), now)
+        self.assertEqual((task.attempts, task.failed), (3, True))
+        self.assertIsNone(worker.acquire(now + timedelta(days=1)))
+
+        # Errors that are not transient are not retried
+        PostWrangler(self.posts[1]).enqueue()
+        task = FetchTask.objects(post=self.posts[1]).first()
+        worker.fail(task, http_error(404), now)
+        self.assertTrue(FetchTask.objects.get(id=task.id).failed)
+
+        # Failed tasks are recorded on their posts
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).fetch_failed, False)
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).fetch_failures, 1)
+        self.assertEqual(Post.objects.get(id=self.posts[1].id).fetch_failed, True)
+
+    @mock.patch('baleen.wrangle.http.get')
+    def test_drain(self, mock_get):
+        """
+        Test that the worker fetches every queued post
+        """
+        def get(url, **kwargs):
+            if url.endswith("/2/"):
+                return MockResponse("", 404, url=url)
+            response = MockResponse("", url=url)
+            response.text = u"<html>page</html>"
+            return response
+
+        mock_get.side_effect = get
+        for post in self.posts:
+            PostWrangler(post).enqueue()
+
+        counts = FetchWorker(workers=2).drain()
+        self.assertEqual(counts['fetched'], 2)
+        self.assertEqual(counts['failed'], 1)
+        self.assertEqual(Post.objects(fetched=None).count(), 1)
+        self.assertEqual(FetchTask.objects.count(), 1)
+        self.assertTrue(FetchTask.objects.first().failed)
+
+    def test_deferred_ingestor(self):
+        """
+        Test that a deferred ingestor queues posts rather than fetching them
+        """
+        ingestor = Ingestor(deferred=True)
+        ingestor._logger  = mock.MagicMock()
+        ingestor._fetcher = mock.MagicMock()
+
+        with mock.patch.object(settings, 'fetch_html', True):
+            for post in self.posts:
+                ingestor.fetch_post(PostWrangler(post))
+
+        ingestor.fetcher.put.assert_not_called()
+        self.assertEqual(ingestor.counts['queued'], 3)
+        self.assertEqual(FetchTask.objects.count(), 3)
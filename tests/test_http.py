@@ -0,0 +1,474 @@
+# tests.test_http
+# Test the HTTP download utilities.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 11:48:52 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_http.py [] benjamin@bengfort.com $
+
+"""
+Test the HTTP download utilities.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import socket
+import unittest
+import threading
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from requests.adapters import HTTPAdapter
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from baleen import http
+from baleen.config import settings
+from baleen.exceptions import TimeoutError, ContentError
+from baleen.utils.timez import Deadline
+
+from .test_feed import MockResponse
+
+
+##########################################################################
+## Local HTTP Server
+##########################################################################
+
+class LocalHandler(BaseHTTPRequestHandler):
+    """
+    Serves a small feed, a redirect to the feed, and an endless video (with
+    or without a content length).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/feed")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.path in ("/video", "/endless"):
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            if self.path == "/video":
+                self.send_header("Content-Length", str(2 ** 30))
+            self.end_headers()
+            try:
+                while True:
+                    self.wfile.write("x" * http.CHUNK_SIZE)
+            except socket.error:
+                return
+
+        body = "<rss></rss>"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def finish(self):
+        # The client hangs up on the endless video.
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class LocalServerMixin(object):
+    """
+    Runs a local HTTP server on a free port for the duration of each test.
+    """
+
+    def setUp(self):
+        self.server = LocalServer(("127.0.0.1", 0), LocalHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, path):
+        return "http://127.0.0.1:{}{}".format(self.server.server_port, path)
+
+    def run_bounded(self, func, timeout=10):
+        """
+        Runs the function on a thread, failing if it doesn't finish in time
+        (rather than hanging the test suite).
+        """
+        errors = []
+
+        def target():
+            try:
+                func()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+
+        self.assertFalse(thread.is_alive(), "blocked waiting for a connection")
+        if errors:
+            raise errors[0]
+
+
+##########################################################################
+## HTTP Tests
+##########################################################################
+
+class HTTPTests(unittest.TestCase):
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get(self, mock_get):
+        """
+        Test that get downloads the content of a streaming response
+        """
+        mock_get.return_value = MockResponse("x" * 100000)
+
+        response = http.get('http://example.com/', headers={'a': 'b'})
+        self.assertEqual(response.content, "x" * 100000)
+        mock_get.assert_called_once_with(
+            'http://example.com/', headers={'a': 'b'},
+            timeout=(10, 60), stream=True,
+        )
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_bounded_timeouts(self, mock_get):
+        """
+        Test that the timeouts are bounded by the deadline
+        """
+        mock_get.return_value = MockResponse("")
+
+        http.get('http://example.com/', deadline=Deadline(5))
+        connect, read = mock_get.call_args[1]['timeout']
+        self.assertLessEqual(connect, 5)
+        self.assertLessEqual(read, 5)
+
+        http.get('http://example.com/', connect=1, read=2)
+        self.assertEqual(mock_get.call_args[1]['timeout'], (1, 2))
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_deadline(self, mock_get):
+        """
+        Test that a slow download is stopped by the deadline
+        """
+        class SlowResponse(MockResponse):
+
+            def iter_content(self, chunk_size=1):
+                while True:
+                    time.sleep(0.01)
+                    yield "x"
+
+        mock_get.return_value = SlowResponse("")
+
+        with self.assertRaises(TimeoutError):
+            http.get('http://example.com/', deadline=Deadline(0.1))
+
+    def test_session_shared(self):
+        """
+        Test that a single pooled session is shared per process
+        """
+        session = http.session()
+        self.assertIs(http.session(), session)
+
+        with mock.patch('baleen.http.os.getpid', return_value=-1):
+            self.assertIsNot(http.session(), session)
+
+    def test_session_pools(self):
+        """
+        Test that the session keeps a non-blocking pool per host
+        """
+        session = http.create_session()
+        self.assertIn('Baleen', session.headers['User-Agent'])
+
+        for prefix in ('http://', 'https://'):
+            adapter = session.get_adapter(prefix + 'example.com/')
+            self.assertEqual(adapter._pool_maxsize, 4)
+            self.assertEqual(adapter._pool_block, False)
+            self.assertEqual(adapter._pool_connections, 256)
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_retry_after(self, mock_get):
+        """
+        Test that throttled requests are retried after the Retry-After
+        """
+        mock_get.side_effect = [
+            MockResponse("", 429, headers={'Retry-After': '0'}),
+            MockResponse("ok"),
+        ]
+
+        response = http.get('http://throttled.example.com/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, "ok")
+        self.assertEqual(mock_get.call_count, 2)
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_retry_after_deadline(self, mock_get):
+        """
+        Test that requests are not retried past the deadline
+        """
+        mock_get.return_value = MockResponse(
+            "", 429, headers={'Retry-After': '120'}
+        )
+
+        url = 'http://slowdown.example.com/'
+        response = http.get(url, deadline=Deadline(5))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(mock_get.call_count, 1)
+
+        # The host is held back for all other requests
+        self.assertGreater(http.hosts()[url].until, time.time() + 100)
+        with self.assertRaises(TimeoutError):
+            http.get(url, deadline=Deadline(0.1))
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_max_bytes(self, mock_get):
+        """
+        Test that downloads larger than max bytes are aborted
+        """
+        mock_get.return_value = MockResponse("x" * 100000)
+        with self.assertRaises(ContentError):
+            http.get('http://example.com/huge', max_bytes=50000)
+
+        # The declared length is checked before the body is downloaded
+        response = MockResponse("x" * 100, headers={'Content-Length': '100000'})
+        response.iter_content = mock.MagicMock()
+        mock_get.return_value = response
+        with self.assertRaises(ContentError):
+            http.get('http://example.com/huge', max_bytes=50000)
+        response.iter_content.assert_not_called()
+
+        mock_get.return_value = MockResponse("x" * 50000)
+        response = http.get('http://example.com/small', max_bytes=50000)
+        self.assertEqual(len(response.content), 50000)
+
+    def test_charset(self):
+        """
+        Test that only an explicit charset of the content type is returned
+        """
+        for ctype, expected in (
+            ('application/rss+xml; charset=ISO-8859-1', 'iso-8859-1'),
+            ('text/xml;charset="utf-8"', 'utf-8'),
+            ('text/xml', None),
+            ('', None),
+        ):
+            response = MockResponse("", headers={'Content-Type': ctype})
+            self.assertEqual(http.charset(response), expected)
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_accept(self, mock_get):
+        """
+        Test that only accepted content types are downloaded
+        """
+        accept = ('text/html',)
+        cases  = (
+            ({'Content-Type': 'text/html; charset=utf-8'}, 200, True),
+            ({'Content-Type': 'TEXT/HTML'}, 200, True),
+            ({}, 200, True),
+            ({'Content-Type': 'application/pdf'}, 200, False),
+            ({'Content-Type': 'video/mp4'}, 200, False),
+            ({'Content-Type': 'application/json'}, 404, True),
+        )
+
+        for headers, status, accepted in cases:
+            mock_get.return_value = MockResponse("body", status, headers=headers)
+            if accepted:
+                self.assertEqual(http.get('http://example.com/', accept=accept).content, "body")
+            else:
+                with self.assertRaises(ContentError):
+                    http.get('http://example.com/', accept=accept)
+
+
+##########################################################################
+## Politeness Tests
+##########################################################################
+
+class PolitenessTests(unittest.TestCase):
+
+    def test_hostname(self):
+        """
+        Test the grouping of urls by host
+        """
+        self.assertEqual(http.hostname("http://Example.COM:80/a/"), "example.com")
+        self.assertEqual(http.hostname(None), "")
+
+    def test_interleave(self):
+        """
+        Test that urls are interleaved by host in order
+        """
+        urls = [
+            "http://a.com/1", "http://a.com/2", "http://a.com/3",
+            "http://b.com/1", "http://c.com/1", "http://b.com/2",
+        ]
+
+        self.assertEqual(list(http.interleave(urls)), [
+            "http://a.com/1", "http://b.com/1", "http://c.com/1",
+            "http://a.com/2", "http://b.com/2", "http://a.com/3",
+        ])
+
+    def test_retry_after(self):
+        """
+        Test parsing the Retry-After header as seconds or a date
+        """
+        self.assertEqual(http.retry_after(MockResponse("")), None)
+        self.assertEqual(http.retry_after(MockResponse(""), 60), 60)
+
+        response = MockResponse("", 429, headers={'Retry-After': '120'})
+        self.assertEqual(http.retry_after(response), 120)
+
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(http.retry_after(response), 0)
+
+        response.headers['Retry-After'] = 'soon'
+        self.assertEqual(http.retry_after(response, 5), 5)
+
+    def test_host_bucket(self):
+        """
+        Test that a host allows a burst and then limits the rate
+        """
+        host = http.Host("example.com", rate=20, burst=2, inflight=10)
+        start = time.time()
+        for idx in xrange(4):
+            host.acquire()
+            host.release()
+
+        # Two requests are made in a burst, the next two wait ~0.05s each
+        self.assertGreater(time.time() - start, 0.08)
+        self.assertEqual(host.inflight, 0)
+
+    def test_host_inflight(self):
+        """
+        Test that a host limits the number of requests in flight
+        """
+        host = http.Host("example.com", rate=1000, burst=10, inflight=1)
+        host.acquire()
+
+        with self.assertRaises(TimeoutError):
+            host.acquire(Deadline(0.05))
+
+        host.release()
+        with host.limit(Deadline(0.05)):
+            self.assertEqual(host.inflight, 1)
+        self.assertEqual(host.inflight, 0)
+
+    def test_host_backoff(self):
+        """
+        Test that backoff holds back the host no longer than the maximum
+        """
+        host = http.Host("example.com")
+        host.backoff(10 ** 9)
+        self.assertLessEqual(
+            host.until, time.time() + settings.http.max_retry_after
+        )
+
+        with self.assertRaises(TimeoutError):
+            host.acquire(Deadline(0.05))
+
+    def test_host_backoff_fail_fast(self):
+        """
+        Test that a host held back past the deadline fails without waiting
+        """
+        host = http.Host("example.com")
+        host.backoff(60)
+
+        start = time.time()
+        with self.assertRaises(TimeoutError):
+            host.acquire(Deadline(5))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(host.inflight, 0)
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_get_default_deadline_bounds_host(self, mock_get):
+        """
+        Test that the default deadline also bounds the wait for the host
+        """
+        url = 'http://heldback.example.com/'
+        http.hosts()[url].backoff(60)
+
+        start = time.time()
+        with mock.patch.object(settings, 'timeout', 5):
+            with self.assertRaises(TimeoutError):
+                http.get(url)
+        self.assertLess(time.time() - start, 1)
+        mock_get.assert_not_called()
+
+
+##########################################################################
+## Connection Pool Tests
+##########################################################################
+
+class ConnectionPoolTests(LocalServerMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(ConnectionPoolTests, self).setUp()
+        with mock.patch.object(settings.http, 'pool_maxsize', 1):
+            self.session = http.create_session()
+
+        patcher = mock.patch('baleen.http.session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.session.close)
+
+    def test_busy_pool(self):
+        """
+        Test that requests to a host don't wait for its busy pooled connections
+        """
+        held = self.session.get(self.url("/video"), stream=True)
+        try:
+            def fetch():
+                for path in ("/feed", "/redirect", "/feed"):
+                    response = http.get(self.url(path))
+                    self.assertEqual(response.content, "<rss></rss>")
+
+            self.run_bounded(fetch)
+        finally:
+            held.close()
+
+    def test_aborts_release_connection(self):
+        """
+        Test that aborted downloads release their connection to the pool
+        """
+        # A blocking pool hangs as soon as a connection is leaked.
+        for prefix in ('http://', 'https://'):
+            self.session.mount(prefix, HTTPAdapter(pool_maxsize=1, pool_block=True))
+
+        def fetch():
+            for idx in xrange(3):
+                with self.assertRaises(ContentError):
+                    http.get(self.url("/video"), accept={"text/html"})
+                with self.assertRaises(ContentError):
+                    http.get(self.url("/video"), max_bytes=1024)
+                with self.assertRaises(ContentError):
+                    http.get(self.url("/endless"), max_bytes=http.CHUNK_SIZE * 4)
+
+            # The unread video is never read as the body of the next response
+            response = http.get(self.url("/feed"))
+            self.assertEqual(response.content, "<rss></rss>")
+
+        self.run_bounded(fetch)
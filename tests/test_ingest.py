@@ -17,9 +17,16 @@ Test the ingestor mechanism in an integration fashion.
 ## Imports
 ##########################################################################
 
+import os
+import time
+import pickle
 import unittest
+import feedparser
+
+from datetime import datetime, timedelta
 
 from .test_models import MongoTestMixin
+from .test_feed import MockResponse, RSS_CONTENT
 
 try:
     from unittest import mock
@@ -29,14 +36,28 @@ except ImportError:
 import baleen.models as db
 
 from baleen.ingest import stype
+from baleen.ingest import feed_shard
 from baleen.ingest import Ingestor
 from baleen.ingest import MongoIngestor
 from baleen.ingest import OPMLIngestor
+from baleen.ingest import PipelineIngestor
+from baleen.ingest import engine, PipelineMongoIngestor
+from baleen.config import settings
+from baleen.feed import FeedSync
+from baleen.wrangle import PostWrangler
+from pymongo.errors import BulkWriteError
 from baleen.utils.decorators import reraise
 from baleen.exceptions import *
 from baleen.utils.logger import IngestLogger
 
 
+##########################################################################
+## Fixtures
+##########################################################################
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+RESULT   = os.path.join(FIXTURES, "feedparser_result.pickle")
+
 ##########################################################################
 ## Helper Functions
 ##########################################################################
@@ -155,3 +176,448 @@ class IngestorTests(MongoTestMixin, unittest.TestCase):
 
         self.assertIsNotNone(ingestor.jobid)
         self.assertIsNotNone(ingestor.timer)
+
+    def test_schedule_interleaves_hosts(self):
+        """
+        Test that feeds from the same host are not scheduled back to back
+        """
+        ingestor = Ingestor(feeds=[
+            "http://a.com/rss", "http://a.com/atom", "http://b.com/rss",
+        ])
+
+        urls = [fsync.url for idx, fsync in ingestor.schedule()]
+        self.assertEqual(urls, [
+            "http://a.com/rss", "http://b.com/rss", "http://a.com/atom",
+        ])
+
+    def test_skip_known_posts(self):
+        """
+        Test that posts that are already stored are skipped, not wrangled
+        """
+        with open(RESULT, 'rb') as f:
+            result = pickle.load(f)
+
+        feed = db.Feed(link="http://example.com/feed/", category="test")
+        feed.save()
+
+        fsync = FeedSync(feed)
+        fsync.entries = mock.MagicMock(return_value=result.entries)
+
+        ingestor = Ingestor(fetch_html=False)
+        ingestor._logger = mock.MagicMock()
+        ingestor.process_post = mock.MagicMock(side_effect=lambda post: post.wrangle())
+
+        ingestor.process_feed(fsync)
+        self.assertEqual(ingestor.counts['posts'], 10)
+        self.assertEqual(ingestor.counts['skipped'], 0)
+
+        ingestor.process_post.reset_mock()
+        ingestor.process_feed(fsync)
+        self.assertEqual(ingestor.counts['posts'], 10)
+        self.assertEqual(ingestor.counts['skipped'], 10)
+        self.assertEqual(ingestor.counts['errors'], 0)
+        ingestor.process_post.assert_not_called()
+
+    def test_known_flags(self):
+        """
+        Test that known entries are flagged with a single lookup per chunk
+        """
+        with open(RESULT, 'rb') as f:
+            entries = pickle.load(f).entries
+
+        feed = db.Feed(link="http://example.com/feed/", category="test")
+        feed.save()
+        for post in PostWrangler.factory(entries[:4], feed):
+            post.wrangle(save=True)
+
+        ingestor = Ingestor()
+        with mock.patch.object(PostWrangler, 'known', wraps=PostWrangler.known) as lookup:
+            flags = ingestor.known(entries)
+
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(flags, [True] * 4 + [False] * 6)
+        self.assertEqual(ingestor.counts['skipped'], 4)
+
+    def test_unchanged_feeds(self):
+        """
+        Test that feeds with an unchanged body are counted, not processed
+        """
+        feed = db.Feed(link="http://example.com/feed/", category="test")
+        feed.save()
+
+        ingestor = Ingestor(fetch_html=False)
+        ingestor._logger = mock.MagicMock()
+        ingestor.process_post = mock.MagicMock()
+
+        response = MockResponse(RSS_CONTENT, url=feed.link)
+        for idx in xrange(3):
+            ingestor.process_sync((idx, FeedSync(feed)), response)
+
+        self.assertEqual(ingestor.counts['feeds'], 3)
+        self.assertEqual(ingestor.counts['unchanged'], 2)
+        self.assertEqual(ingestor.process_post.call_count, 2)
+
+    @mock.patch.object(settings, 'fetch_html', False)
+    def test_batch_process(self):
+        """
+        Test that posts are saved in bulk batches with per-post errors
+        """
+        with open(RESULT, 'rb') as f:
+            entries = pickle.load(f).entries
+
+        feed = db.Feed(link="http://example.com/feed/", category="test")
+        feed.save()
+
+        fsync = FeedSync(feed)
+        fsync.entries = mock.MagicMock(return_value=entries)
+
+        ingestor = Ingestor(batch=4)
+        ingestor._logger = mock.MagicMock()
+        ingestor.wranglers = lambda fsync, entries: PostWrangler.factory(entries, feed)
+
+        with mock.patch.object(PostWrangler, 'bulk_save', wraps=PostWrangler.bulk_save) as bulk:
+            ingestor.process_feed(fsync)
+            self.assertEqual(bulk.call_count, 3)
+
+        self.assertEqual(ingestor.counts['posts'], 10)
+        self.assertEqual(db.Post.objects.count(), 10)
+
+        # The first two posts of every batch are rejected as duplicates
+        with mock.patch('baleen.wrangle.Post._get_collection') as collection:
+            collection.return_value.insert_many.side_effect = BulkWriteError({
+                'writeErrors': [
+                    {'index': idx, 'code': 11000, 'errmsg': 'E11000 duplicate key'}
+                    for idx in xrange(2)
+                ]
+            })
+            ingestor.process_feed(fsync)
+
+        self.assertEqual(ingestor.counts['posts'], 14)
+        self.assertEqual(ingestor.counts['errors'], 6)
+        self.assertEqual(ingestor.errors['WranglingError (NotUniqueError)'], 6)
+
+    @mock.patch('baleen.ingest.Ingestor.process_feed')
+    def test_concurrent_process(self, mock_process_feed):
+        """
+        Test that concurrent feed processing keeps the counts correct
+        """
+        feeds = ["http://example.com/{}/feed/".format(idx) for idx in xrange(50)]
+
+        def process_feed(fsync, response=None):
+            if fsync.feed.startswith("http://example.com/1"):
+                raise SynchronizationError("could not sync feed")
+
+        mock_process_feed.side_effect = process_feed
+
+        ingestor = Ingestor(feeds, workers=8)
+        ingestor._logger = mock.MagicMock()
+        ingestor.process()
+
+        self.assertEqual(ingestor.counts['feeds'], 39)
+        self.assertEqual(ingestor.counts['feed_error'], 11)
+        self.assertEqual(ingestor.errors['SynchronizationError'], 11)
+
+    @mock.patch('baleen.ingest.PostFetcher')
+    @mock.patch('baleen.ingest.Ingestor.process_feed')
+    def test_concurrent_fetcher(self, mock_process_feed, mock_fetcher):
+        """
+        Test that concurrent workers share a single fetcher
+        """
+        feeds = ["http://example.com/{}/feed/".format(idx) for idx in xrange(50)]
+
+        def create(**kwargs):
+            time.sleep(0.01)
+            return mock.MagicMock()
+
+        mock_fetcher.side_effect = create
+        ingestor = Ingestor(feeds, workers=8)
+        ingestor._logger = mock.MagicMock()
+        mock_process_feed.side_effect = lambda fsync, response=None: ingestor.fetcher.put(fsync)
+        ingestor.process()
+
+        # Mocks don't count calls from concurrent threads reliably.
+        self.assertEqual(len(mock_fetcher.call_args_list), 1)
+        self.assertEqual(len(ingestor.fetcher.put.call_args_list), 50)
+
+    @mock.patch('baleen.ingest.Ingestor.process_feed')
+    def test_concurrent_process_failure(self, mock_process_feed):
+        """
+        Test that unhandled worker exceptions fail the ingestion
+        """
+        feeds = ["http://example.com/{}/feed/".format(idx) for idx in xrange(50)]
+        mock_process_feed.side_effect = ValueError("something unexpected")
+
+        ingestor = Ingestor(feeds, workers=8)
+        ingestor._logger = mock.MagicMock()
+        with self.assertRaises(ValueError):
+            ingestor.process()
+
+
+##########################################################################
+## Test Pipeline Ingestor
+##########################################################################
+
+class PipelineIngestorTests(MongoTestMixin, unittest.TestCase):
+
+    @mock.patch.object(settings, 'fetch_html', False)
+    @mock.patch('baleen.ingest.FeedSync.entries')
+    @mock.patch('baleen.ingest.FeedSync.fetch')
+    def test_pipeline_process(self, mock_fetch, mock_entries):
+        """
+        Test that feeds and posts are counted through the pipeline stages
+        """
+        with open(RESULT, 'rb') as f:
+            entries = pickle.load(f).entries
+
+        def fetch():
+            if mock_fetch.call_count == 2:
+                raise SynchronizationError("could not fetch feed")
+            return mock.sentinel.response
+
+        mock_fetch.side_effect = fetch
+        mock_entries.return_value = entries
+
+        feeds = [
+            db.Feed(link="http://example.com/{}/feed/".format(idx), category="test")
+            for idx in xrange(3)
+        ]
+        for feed in feeds: feed.save()
+
+        ingestor = PipelineIngestor(feeds, fetch=1, persist=1)
+        ingestor._logger = mock.MagicMock()
+        ingestor.process()
+
+        # Two feeds are synchronized with the same 10 entries (duplicates),
+        # which are either skipped as known or fail to save, depending on
+        # whether the first feed's posts were persisted when it was parsed.
+        skipped = ingestor.counts['skipped']
+        self.assertEqual(ingestor.counts['feeds'], 2)
+        self.assertEqual(ingestor.counts['feed_error'], 1)
+        self.assertEqual(ingestor.counts['posts'], 10)
+        self.assertEqual(ingestor.counts['errors'] + skipped, 10)
+        self.assertEqual(db.Post.objects.count(), 10)
+
+        mock_entries.assert_called_with(response=mock.sentinel.response)
+
+        stats = dict((stage['name'], stage) for stage in ingestor.pipeline.stats())
+        self.assertEqual(stats['fetch']['processed'], 3)
+        self.assertEqual(stats['parse']['processed'], 2)
+        self.assertEqual(stats['wrangle']['processed'], 20 - skipped)
+        self.assertEqual(stats['persist']['processed'], 20 - skipped)
+
+        ingestor.report()
+        self.assertTrue(ingestor.logger.info.called)
+
+    @mock.patch.object(settings, 'fetch_html', False)
+    @mock.patch('baleen.ingest.FeedSync.entries')
+    @mock.patch('baleen.ingest.FeedSync.fetch')
+    def test_pipeline_batch(self, mock_fetch, mock_entries):
+        """
+        Test that the persist stage saves posts in bulk batches
+        """
+        with open(RESULT, 'rb') as f:
+            mock_entries.return_value = pickle.load(f).entries
+
+        feed = db.Feed(link="http://example.com/feed/", category="test")
+        feed.save()
+
+        ingestor = PipelineIngestor([feed], batch=4, persist=2)
+        ingestor._logger = mock.MagicMock()
+
+        with mock.patch.object(PostWrangler, 'bulk_save', wraps=PostWrangler.bulk_save) as bulk:
+            ingestor.process()
+
+        # The persist workers save concurrently, so don't rely on call_count.
+        self.assertEqual(
+            sorted(len(call[0][0]) for call in bulk.call_args_list), [2, 4, 4]
+        )
+        self.assertEqual(ingestor.counts['posts'], 10)
+        self.assertEqual(db.Post.objects.count(), 10)
+        self.assertEqual(ingestor.pending, [])
+
+
+##########################################################################
+## Test Sharded Mongo Ingestor
+##########################################################################
+
+class EngineTests(unittest.TestCase):
+
+    def test_engine(self):
+        """
+        Test selecting the ingestor class by engine name
+        """
+        self.assertIs(engine('threaded'), MongoIngestor)
+        self.assertIs(engine('pipeline'), PipelineMongoIngestor)
+
+        with mock.patch.object(settings, 'engine', 'pipeline'):
+            self.assertIs(engine(), PipelineMongoIngestor)
+
+        with self.assertRaises(ValueError):
+            engine('async')
+
+
+class ShardedIngestorTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(ShardedIngestorTests, self).setUp()
+        for job in db.Job.objects(): job.delete()
+
+        self.feeds = [
+            db.Feed(link="http://example.com/{}/feed/".format(idx), category="test")
+            for idx in xrange(30)
+        ]
+        for feed in self.feeds: feed.save()
+
+    def get_shard(self, shard, shards=3):
+        ingestor = MongoIngestor(shard=shard, shards=shards)
+        ingestor._logger = mock.MagicMock()
+        ingestor.process = mock.MagicMock()
+        return ingestor
+
+    def test_feed_shards(self):
+        """
+        Test that shards partition the active feeds
+        """
+        shards = [
+            set(feed.id for feed in self.get_shard(idx).feeds())
+            for idx in xrange(3)
+        ]
+
+        self.assertEqual(sum(len(shard) for shard in shards), 30)
+        self.assertEqual(set.union(*shards), set(feed.id for feed in self.feeds))
+        for idx, shard in enumerate(shards):
+            for feed in shard:
+                self.assertEqual(feed_shard(db.Feed(id=feed), 3), idx)
+
+        # Unsharded ingestors get all the feeds
+        ingestor = MongoIngestor()
+        self.assertEqual(len(list(ingestor.feeds())), 30)
+
+    def test_merged_job(self):
+        """
+        Test that the counts of every shard are merged into one job
+        """
+        jobid = "54c0a5b2-7b74-11e6-9b4d-0242ac110002"
+        for idx in xrange(3):
+            ingestor = self.get_shard(idx)
+
+            def process(ingestor=ingestor):
+                ingestor.counts['feeds'] += 10
+                ingestor.counts['posts'] += idx
+                ingestor.errors['SynchronizationError'] += 1
+
+            ingestor.process.side_effect = process
+            ingestor.ingest(jobid=jobid)
+
+            self.assertEqual(db.Job.objects.count(), 1)
+            job = db.Job.objects.first()
+            self.assertEqual(str(job.jobid), jobid)
+            self.assertEqual(job.shards, 3)
+            self.assertEqual(len(job.completed), idx + 1)
+
+            if idx < 2:
+                self.assertIsNone(job.finished)
+
+        self.assertIsNotNone(job.finished)
+        self.assertFalse(job.failed)
+        self.assertEqual(job.reason, u"OK")
+        self.assertEqual(job.counts['feeds'], 30)
+        self.assertEqual(job.counts['posts'], 3)
+        self.assertEqual(job.errors['SynchronizationError'], 3)
+        self.assertEqual(job.totals['feeds'], 30)
+
+    def test_merged_pipeline_stages(self):
+        """
+        Test that the pipeline stages of every shard are merged into the job
+        """
+        jobid = "54c0a5b2-7b74-11e6-9b4d-0242ac110002"
+        for idx in xrange(2):
+            ingestor = PipelineMongoIngestor(shard=idx, shards=2)
+            ingestor._logger = mock.MagicMock()
+            ingestor.process = mock.MagicMock()
+            ingestor.report = mock.MagicMock()
+            ingestor.pipeline = mock.MagicMock()
+            ingestor.pipeline.stats.return_value = [
+                {'name': 'fetch', 'processed': 10 + idx},
+                {'name': 'persist', 'processed': 20 + idx},
+            ]
+            ingestor.ingest(jobid=jobid)
+
+        job = db.Job.objects.get()
+        self.assertEqual(job.reason, u"OK")
+        self.assertEqual(job.stages, [
+            {'name': 'fetch', 'processed': 10, 'shard': 0},
+            {'name': 'persist', 'processed': 20, 'shard': 0},
+            {'name': 'fetch', 'processed': 11, 'shard': 1},
+            {'name': 'persist', 'processed': 21, 'shard': 1},
+        ])
+
+    def test_failed_shard(self):
+        """
+        Test that a failed shard marks the merged job as failed
+        """
+        jobid = "54c0a5b2-7b74-11e6-9b4d-0242ac110002"
+        for idx in xrange(2):
+            ingestor = self.get_shard(idx, shards=2)
+            if idx == 0:
+                ingestor.process.side_effect = Exception("Things went wrong!")
+                with self.assertRaises(Exception):
+                    ingestor.ingest(jobid=jobid)
+            else:
+                ingestor.ingest(jobid=jobid)
+
+        job = db.Job.objects.get()
+        self.assertTrue(job.failed)
+        self.assertEqual(job.reason, u"Things went wrong!")
+        self.assertIsNotNone(job.finished)
+
+
+##########################################################################
+## Test Adaptive Polling
+##########################################################################
+
+class PollingIngestorTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(PollingIngestorTests, self).setUp()
+        now = datetime.utcnow()
+
+        self.due = db.Feed(link="http://example.com/due/", category="test")
+        self.new = db.Feed(link="http://example.com/new/", category="test")
+        self.wait = db.Feed(link="http://example.com/wait/", category="test")
+
+        self.due.next_poll  = now - timedelta(minutes=5)
+        self.wait.next_poll = now + timedelta(minutes=5)
+        for feed in (self.due, self.new, self.wait): feed.save()
+
+    def test_due_feeds(self):
+        """
+        Test that only due feeds are ingested with the due option
+        """
+        links = lambda ingestor: set(feed.link for feed in ingestor.feeds())
+
+        self.assertEqual(len(links(MongoIngestor())), 3)
+        self.assertEqual(
+            links(MongoIngestor(due=True)),
+            {"http://example.com/due/", "http://example.com/new/"},
+        )
+
+    def test_sync_error_backoff(self):
+        """
+        Test that a feed that fails to synchronize is backed off
+        """
+        ingestor = MongoIngestor()
+        ingestor._logger = mock.MagicMock()
+        ingestor.counts
+
+        fsync = FeedSync(self.due)
+        ingestor.sync_error(0, fsync, SynchronizationError("bad feed"))
+
+        feed = db.Feed.objects.get(id=self.due.id)
+        self.assertEqual(feed.failures, 1)
+        self.assertEqual(feed.sync_errors, 1)
+        self.assertGreater(feed.next_poll, datetime.utcnow())
+
+        # A successful synchronization ends the streak of errors
+        fsync.update(feedparser.FeedParserDict(feed={}, entries=[]))
+        self.assertEqual(db.Feed.objects.get(id=self.due.id).sync_errors, 0)
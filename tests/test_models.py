@@ -17,10 +17,23 @@ Testing for the mongoengine models (basic stuff).
 ## Imports
 ##########################################################################
 
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
 import unittest
 import mongoengine as me
 
+from bson import json_util
+from bson.binary import Binary
+from datetime import datetime
+from dateutil.tz import tzutc
+from pymongo.errors import OperationFailure
+
 from mongomock import MongoClient as MockMongoClient
+from mongomock.collection import Collection as MockCollection
 
 try:
     from unittest import mock
@@ -28,12 +41,32 @@ except ImportError:
     import mock
 
 from baleen.models import *
+from baleen.config import settings
 
 
 ##########################################################################
 ## Mongo Test Mixin
 ##########################################################################
 
+mock_update = MockCollection.update
+
+def update_max(self, spec, document, *args, **kwargs):
+    """
+    Applies the $max operators of an update (which mongomock lacks) as a
+    $set of the fields whose current value is less than the given value.
+    """
+    if '$max' in document:
+        document = dict(document)
+        current  = self.find_one(spec) or {}
+        updates  = dict(document.get('$set', {}))
+        for key, value in document.pop('$max').iteritems():
+            if current.get(key) is None or current[key] < value:
+                updates[key] = value
+        if updates:
+            document['$set'] = updates
+    return mock_update(self, spec, document, *args, **kwargs)
+
+
 class MongoTestMixin(object):
 
     def setUp(self):
@@ -43,6 +76,10 @@ class MongoTestMixin(object):
         self.conn = connect(host='mongomock://localhost')
         assert isinstance(self.conn, MockMongoClient)
 
+        patcher = mock.patch.object(MockCollection, 'update', update_max)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         # Clear out the database
         for feed in Feed.objects(): feed.delete()
         for post in Post.objects(): post.delete()
@@ -129,6 +166,75 @@ class FeedModelTests(MongoTestMixin, unittest.TestCase):
         self.assertEqual(str(feed), feed.title)
 
 
+    def test_record_posts(self):
+        """
+        Test that posts are recorded atomically in the feed statistics
+        """
+        feed = Feed(category="news", link="https://example.com/feed.atom")
+        feed.save()
+
+        posts = [
+            Post(feed=feed, url="http://example.com/1.html", content=u"caf\xe9",
+                 pubdate=datetime(2016, 3, 2, 22, 0, 6, tzinfo=tzutc())),
+            Post(feed=feed, url="http://example.com/2.html", content=u"socks",
+                 pubdate=datetime(2016, 3, 1, 12, 0, 0, tzinfo=tzutc())),
+        ]
+        feed.record_posts(posts)
+        feed.record_posts(posts[1:])
+
+        # Undated posts are counted but don't change the latest post
+        feed.record_posts([Post(feed=feed, url="http://example.com/3.html", content=u"")])
+
+        # The in-memory counters are not saved over the database counters
+        feed.title = "A News Feed"
+        feed.save()
+        feed = Feed.objects.get(id=feed.id)
+
+        self.assertEqual(feed.post_count, 4)
+        self.assertEqual(feed.content_bytes, 15)
+        self.assertEqual(feed.last_post, datetime(2016, 3, 2, 22, 0, 6))
+
+    def test_record_posts_single_update(self):
+        """
+        Test that posts are recorded with a single update using $max
+        """
+        feed = Feed(category="news", link="https://example.com/feed.atom")
+        feed.save()
+
+        post = Post(feed=feed, url="http://example.com/1.html", content=u"socks",
+                    pubdate=datetime(2016, 3, 1, 12, 0, 0))
+
+        with mock.patch.object(MockCollection, 'update', autospec=True) as update:
+            feed.record_posts([post])
+
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(update.call_args[0][2], {
+            '$inc': {'post_count': 1, 'content_bytes': 5},
+            '$max': {'last_post': datetime(2016, 3, 1, 12, 0, 0)},
+        })
+
+    def test_recount(self):
+        """
+        Test that the statistics of a feed can be recounted from its posts
+        """
+        feed = Feed(category="news", link="https://example.com/feed.atom")
+        feed.save()
+
+        for idx in range(3):
+            Post(
+                feed=feed, url="http://example.com/{}.html".format(idx),
+                content=u"post {}".format(idx), pubdate=datetime(2016, 3, idx+1),
+            ).save()
+
+        Post(feed=feed, url="http://example.com/undated.html", content=u"").save()
+
+        self.assertEqual(feed.post_count, 0)
+        feed.recount()
+        self.assertEqual(feed.post_count, 4)
+        self.assertEqual(feed.post_count, feed.count_posts())
+        self.assertEqual(feed.content_bytes, 18)
+        self.assertEqual(feed.last_post, datetime(2016, 3, 3))
+
 ##########################################################################
 ## Post Model Tests
 ##########################################################################
@@ -182,3 +288,356 @@ class PostModelTests(MongoTestMixin, unittest.TestCase):
         post.save()
 
         self.assertEqual(str(post), post.title)
+
+
+##########################################################################
+## Compressed Content Tests
+##########################################################################
+
+class CompressedContentTests(MongoTestMixin, unittest.TestCase):
+
+    CONTENT = u"<html><body>{}</body></html>".format(u"<p>Caf\xe9 socks</p>" * 100)
+
+    def raw(self, post):
+        return Post._get_collection().find_one({'_id': post.id})['content']
+
+    @mock.patch.object(settings.database, 'compression', 'zlib')
+    def test_compressed_content(self):
+        """
+        Test that content is stored compressed and decompressed on access
+        """
+        post = Post(content=self.CONTENT, url="http://example.com/socks.html")
+        post.save()
+
+        stored = self.raw(post)
+        self.assertIsInstance(stored, Binary)
+        self.assertLess(len(stored), len(self.CONTENT))
+
+        post = Post.objects.get(id=post.id)
+        self.assertIsInstance(post._data['content'], Binary)
+        self.assertEqual(post.content, self.CONTENT)
+        self.assertNotIn('content', post._get_changed_fields())
+
+        # The signature is the hash of the text, not of the compressed value
+        sha = hashlib.sha256(self.CONTENT.encode('utf-8')).hexdigest()
+        self.assertEqual(post.signature, sha)
+        self.assertEqual(json.loads(post.to_json())['content'], self.CONTENT)
+
+    @mock.patch.object(settings.database, 'compression', None)
+    def test_mixed_content(self):
+        """
+        Test that compressed and uncompressed content can be read and written
+        """
+        with mock.patch.object(settings.database, 'compression', 'zlib'):
+            compressed = Post(content=self.CONTENT, url="http://example.com/a.html")
+            compressed.save()
+
+        plain = Post(content=u"socks", url="http://example.com/b.html")
+        plain.save()
+        self.assertEqual(self.raw(plain), u"socks")
+
+        for post in Post.objects.order_by('url'):
+            self.assertIsInstance(post.content, unicode)
+
+        # Updating a compressed post without compression stores it as text
+        post = Post.objects.get(url="http://example.com/a.html")
+        post.title = "Socks"
+        post.content = post.content + u"!"
+        post.save()
+        self.assertEqual(self.raw(post), self.CONTENT + u"!")
+
+    def test_compress(self):
+        """
+        Test the compression helpers
+        """
+        self.assertEqual(decompress(compress(self.CONTENT)), self.CONTENT)
+        self.assertEqual(compress(u"a").subtype, COMPRESSION_SUBTYPES['zlib'])
+
+        with self.assertRaises(ValueError):
+            compress(u"a", "lzma")
+        with self.assertRaises(ValueError):
+            decompress(Binary("a", 0x81))
+
+
+##########################################################################
+## Index Tests
+##########################################################################
+
+class IndexTests(unittest.TestCase):
+
+    def test_declared_indexes(self):
+        """
+        Test that indexes are declared for the hot queries
+        """
+        expected = {
+            Feed: [[('category', 1)], [('active', 1), ('next_poll', 1)]],
+            Post: [[('feed', 1), ('pubdate', -1)], [('pubdate', -1)], [('created', 1)]],
+            Job:  [[('jobid', 1)], [('started', -1)]],
+        }
+
+        for model, indexes in expected.items():
+            specs = model._meta['index_specs']
+            keys  = [spec['fields'] for spec in specs]
+            for index in indexes:
+                self.assertIn(index, keys)
+
+            # All declared indexes are built in the background
+            self.assertTrue(model._meta['index_background'])
+
+    def test_ensure_indexes(self):
+        """
+        Test that the indexes of every model are ensured
+        """
+        models = [mock.MagicMock(), mock.MagicMock()]
+        ensure_indexes(models)
+        for model in models:
+            model.ensure_indexes.assert_called_once_with()
+
+        # The retention of the logs is applied before their indexes are built
+        calls = mock.MagicMock()
+        with mock.patch.object(Log, 'ensure_retention', calls.ensure_retention):
+            with mock.patch.object(Log, 'ensure_indexes', calls.ensure_indexes):
+                ensure_indexes([Log])
+        self.assertEqual(calls.mock_calls, [
+            mock.call.ensure_retention(), mock.call.ensure_indexes(),
+        ])
+
+    def test_index_stats(self):
+        """
+        Test the index stats with and without usage information
+        """
+        since = datetime(2016, 3, 2, 22, 0, 6)
+        collection = mock.MagicMock()
+        collection.name = 'posts'
+        collection.index_information.return_value = {
+            '_id_': {'key': [('_id', 1)]},
+            'feed_1_pubdate_-1': {'key': [('feed', 1), ('pubdate', -1)]},
+        }
+        collection.aggregate.return_value = [
+            {'name': 'feed_1_pubdate_-1', 'accesses': {'ops': 42, 'since': since}},
+        ]
+        collection.database.command.return_value = {
+            'indexSizes': {'_id_': 1024, 'feed_1_pubdate_-1': 2048},
+        }
+
+        model = mock.MagicMock()
+        model._get_collection.return_value = collection
+
+        stats = index_stats(model)
+        self.assertEqual([stat['name'] for stat in stats], ['_id_', 'feed_1_pubdate_-1'])
+        self.assertEqual(stats[1]['ops'], 42)
+        self.assertEqual(stats[1]['since'], since)
+        self.assertEqual(stats[1]['size'], 2048)
+        self.assertIsNone(stats[0]['ops'])
+
+        # Servers before MongoDB 3.2 can't report the usage
+        collection.aggregate.side_effect = OperationFailure("unrecognized pipeline stage")
+        collection.database.command.side_effect = OperationFailure("no such command")
+        for stat in index_stats(model):
+            self.assertIsNone(stat['ops'])
+            self.assertIsNone(stat['size'])
+
+
+##########################################################################
+## Log Retention Tests
+##########################################################################
+
+class LogRetentionTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(LogRetentionTests, self).setUp()
+        for log in Log.objects(): log.delete()
+
+        self.collection = mock.MagicMock()
+        self.collection.name = 'logs'
+        self.collection.options.return_value = {}
+        self.collection.index_information.return_value = {}
+
+    def ensure_retention(self, **kwargs):
+        with mock.patch.object(Log, '_get_collection', return_value=self.collection):
+            with mock.patch.multiple(settings.mongolog, retention=None, archive=None, capped=None):
+                Log.ensure_retention(**kwargs)
+
+    def test_ttl_index(self):
+        """
+        Test that logs that are not archived expire with a TTL index
+        """
+        self.ensure_retention(retention=30)
+        self.collection.create_index.assert_called_once_with(
+            [('timestamp', -1)], background=True, expireAfterSeconds=30*86400,
+        )
+
+        # An existing TTL index is modified rather than rebuilt
+        self.collection.reset_mock()
+        self.collection.index_information.return_value = {
+            'timestamp_-1': {'key': [('timestamp', -1)], 'expireAfterSeconds': 86400},
+        }
+        self.ensure_retention(retention=7)
+        self.collection.database.command.assert_called_once_with(
+            'collMod', 'logs', index={
+                'keyPattern': {'timestamp': -1}, 'expireAfterSeconds': 7*86400,
+            },
+        )
+        self.assertFalse(self.collection.create_index.called)
+
+    def test_archived_index(self):
+        """
+        Test that logs that are archived do not expire with a TTL index
+        """
+        self.collection.index_information.return_value = {
+            'timestamp_-1': {'key': [('timestamp', -1)], 'expireAfterSeconds': 86400},
+        }
+        self.ensure_retention(retention=30, archive="/tmp/logs")
+        self.collection.drop_index.assert_called_once_with('timestamp_-1')
+        self.collection.create_index.assert_called_once_with(
+            [('timestamp', -1)], background=True,
+        )
+
+        # The index is left alone once it matches
+        self.collection.reset_mock()
+        self.collection.index_information.return_value = {
+            'timestamp_-1': {'key': [('timestamp', -1)]},
+        }
+        self.ensure_retention(retention=30, archive="/tmp/logs")
+        self.assertFalse(self.collection.drop_index.called)
+        self.assertFalse(self.collection.create_index.called)
+
+    def test_capped(self):
+        """
+        Test that the logs can be kept in a capped collection instead
+        """
+        self.ensure_retention(retention=30, capped=1048576)
+        self.collection.database.command.assert_called_once_with(
+            'convertToCapped', 'logs', size=1048576,
+        )
+
+        # The dropped indexes are rebuilt, and the timestamp index has no TTL
+        indexes = self.collection.create_index.call_args_list
+        self.assertIn(mock.call([('timestamp', -1)], background=True), indexes)
+        self.assertIn(mock.call([('level.name', 1), ('_id', -1)], background=True), indexes)
+
+        self.collection.reset_mock()
+        self.collection.options.return_value = {'capped': True}
+        self.collection.index_information.return_value = {
+            'timestamp_-1': {'key': [('timestamp', -1)]},
+        }
+        self.ensure_retention(capped=1048576)
+        self.assertFalse(self.collection.database.command.called)
+        self.assertFalse(self.collection.create_index.called)
+
+    def test_prune(self):
+        """
+        Test that old logs are archived by day and removed
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        now = datetime(2016, 3, 10, 12, 0, 0)
+        for day, count in ((1, 2), (2, 3), (9, 1)):
+            for idx in range(count):
+                Log(message=u"log {} of day {}".format(idx, day), timestamp=datetime(2016, 3, day, idx)).save()
+
+        with mock.patch.multiple(settings.mongolog, retention=None, archive=None):
+            self.assertEqual(Log.prune(now=now), 0)
+            self.assertEqual(Log.prune(retention=7, archive=tmp, now=now), 5)
+            self.assertEqual(Log.prune(retention=7, archive=tmp, now=now), 0)
+
+        self.assertEqual(Log.objects.count(), 1)
+        self.assertEqual(sorted(os.listdir(tmp)), [
+            'logs-2016-03-01.json.gz', 'logs-2016-03-02.json.gz',
+        ])
+
+        with gzip.open(os.path.join(tmp, 'logs-2016-03-02.json.gz')) as f:
+            logs = [json_util.loads(line) for line in f]
+        self.assertEqual(
+            [log['message'] for log in logs],
+            [u"log {} of day 2".format(idx) for idx in range(3)],
+        )
+
+
+##########################################################################
+## Log Pagination Tests
+##########################################################################
+
+class LogPageTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(LogPageTests, self).setUp()
+        for log in Log.objects(): log.delete()
+
+        # Logs are saved oldest first, so their ids are in time order
+        self.logs = []
+        for idx in range(10):
+            level = 'ERROR' if idx % 3 == 0 else 'INFO'
+            log = Log(
+                message=u"log {}".format(idx), level={'name': level},
+                logger='baleen.ingest' if idx % 2 else 'baleen',
+                timestamp=datetime(2016, 3, idx+1),
+            )
+            log.save()
+            self.logs.append(log)
+
+    def messages(self, logs):
+        return [int(log.message.split()[-1]) for log in logs]
+
+    def test_page_through(self):
+        """
+        Test paging through the logs with before and after cursors
+        """
+        logs, newer, older = Log.page(per_page=4)
+        self.assertEqual(self.messages(logs), [9, 8, 7, 6])
+        self.assertIsNone(newer)
+
+        logs, newer, older = Log.page(before=older, per_page=4)
+        self.assertEqual(self.messages(logs), [5, 4, 3, 2])
+        self.assertIsNotNone(newer)
+
+        logs, newer, last = Log.page(before=older, per_page=4)
+        self.assertEqual(self.messages(logs), [1, 0])
+        self.assertIsNone(last)
+
+        # Page back towards the newest logs
+        logs, newer, older = Log.page(after=newer, per_page=4)
+        self.assertEqual(self.messages(logs), [5, 4, 3, 2])
+
+        logs, newer, older = Log.page(after=newer, per_page=4)
+        self.assertEqual(self.messages(logs), [9, 8, 7, 6])
+        self.assertIsNone(newer)
+        self.assertIsNotNone(older)
+
+    def test_page_filters(self):
+        """
+        Test filtering the pages of logs by level, logger and time
+        """
+        logs, newer, older = Log.page(level='ERROR', per_page=3)
+        self.assertEqual(self.messages(logs), [9, 6, 3])
+
+        logs, newer, older = Log.page(level='ERROR', before=older, per_page=3)
+        self.assertEqual(self.messages(logs), [0])
+        self.assertIsNone(older)
+
+        logs, newer, older = Log.page(logger='baleen.ingest')
+        self.assertEqual(self.messages(logs), [9, 7, 5, 3, 1])
+
+        logs, newer, older = Log.page(
+            since=datetime(2016, 3, 3), until=datetime(2016, 3, 6)
+        )
+        self.assertEqual(self.messages(logs), [4, 3, 2])
+
+    def test_estimated_count(self):
+        """
+        Test the estimated count of the logs
+        """
+        self.assertEqual(Log.estimated_count(), 10)
+
+    def test_level_index(self):
+        """
+        Test that the level index is ensured with the declared indexes
+        """
+        collection = mock.MagicMock()
+        with mock.patch.object(Log, '_get_collection', return_value=collection):
+            Log.ensure_indexes()
+
+        collection.create_index.assert_any_call(
+            [('level.name', 1), ('_id', -1)], background=True
+        )
@@ -0,0 +1,148 @@
+# tests.test_polling
+# Test the adaptive polling intervals of feeds.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 14:52:40 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_polling.py [] benjamin@bengfort.com $
+
+"""
+Test the adaptive polling intervals of feeds.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import unittest
+
+from baleen import polling
+from baleen.models import Feed
+from baleen.config import settings
+from datetime import datetime, timedelta
+
+##########################################################################
+## Fixtures
+##########################################################################
+
+NOW = datetime(2016, 3, 1, 12, 0, 0)
+
+
+def entry(hours_ago):
+    """
+    Returns an entry published the given number of hours before NOW.
+    """
+    return {
+        'published_parsed': (NOW - timedelta(hours=hours_ago)).utctimetuple()
+    }
+
+
+##########################################################################
+## Polling Tests
+##########################################################################
+
+class PollingTests(unittest.TestCase):
+
+    def test_published(self):
+        """
+        Test the publication timestamp of entries
+        """
+        self.assertEqual(polling.published(entry(0)), polling.epoch(NOW))
+        self.assertEqual(
+            polling.published({'updated_parsed': NOW.utctimetuple()}),
+            polling.epoch(NOW),
+        )
+        self.assertIsNone(polling.published({'title': 'no date'}))
+
+    def test_arrival_rate_span(self):
+        """
+        Test estimating the arrival rate from the span of the entries
+        """
+        entries = [entry(hours) for hours in (0, 2, 4, 6, 8)]
+        self.assertEqual(polling.arrival_rate(entries, now=NOW), 0.5)
+        self.assertIsNone(polling.arrival_rate(entries[:1], now=NOW))
+        self.assertIsNone(polling.arrival_rate([{}, {}], now=NOW))
+
+    def test_arrival_rate_since(self):
+        """
+        Test the arrival rate of entries since the last poll
+        """
+        entries = [entry(hours) for hours in (0, 1, 3, 5, 24)]
+        since = NOW - timedelta(hours=4)
+        self.assertEqual(polling.arrival_rate(entries, since, NOW), 0.75)
+        self.assertEqual(polling.arrival_rate([], since, NOW), 0.0)
+        self.assertIsNone(polling.arrival_rate(entries, NOW, NOW))
+
+    def test_schedule_bounds(self):
+        """
+        Test that the interval is bounded by the minimum and maximum
+        """
+        feed = Feed(rate=None)
+        polling.schedule(feed, NOW)
+        self.assertEqual(feed.interval, settings.polling.default)
+        self.assertEqual(feed.next_poll, NOW + timedelta(seconds=feed.interval))
+
+        feed.rate = 1000.0
+        polling.schedule(feed, NOW)
+        self.assertEqual(feed.interval, settings.polling.minimum)
+
+        feed.rate = 0.0
+        polling.schedule(feed, NOW)
+        self.assertEqual(feed.interval, settings.polling.maximum)
+
+        feed.rate = 0.5
+        polling.schedule(feed, NOW)
+        self.assertEqual(feed.interval, 7200)
+
+    def test_observe(self):
+        """
+        Test that observing polls smooths the arrival rate
+        """
+        feed = Feed()
+        result = {'status': 200, 'entries': [entry(h) for h in (0, 2, 4)]}
+
+        polling.observe(feed, result, NOW)
+        self.assertEqual(feed.rate, 0.5)
+        self.assertEqual(feed.polled, NOW)
+        self.assertEqual(feed.interval, 7200)
+
+        later  = NOW + timedelta(hours=1)
+        result = {'status': 200, 'entries': [entry(h) for h in (-0.5, 0, 2)]}
+
+        polling.observe(feed, result, later)
+        alpha = settings.polling.smoothing
+        self.assertAlmostEqual(feed.rate, alpha * 1.0 + (1 - alpha) * 0.5)
+        self.assertEqual(feed.failures, 0)
+
+    def test_observe_not_modified(self):
+        """
+        Test that not modified polls back off the interval
+        """
+        feed = Feed(rate=1.0, polled=NOW - timedelta(hours=1))
+        polling.observe(feed, {'status': 304, 'entries': []}, NOW)
+
+        alpha = settings.polling.smoothing
+        self.assertAlmostEqual(feed.rate, 1 - alpha)
+        self.assertEqual(feed.failures, 1)
+        self.assertEqual(
+            feed.interval,
+            int(settings.polling.backoff * 3600 / (1 - alpha))
+        )
+
+    def test_backoff(self):
+        """
+        Test that errors back off the interval up to the maximum
+        """
+        feed = Feed(rate=1.0)
+        intervals = []
+        for idx in xrange(100):
+            polling.backoff(feed, NOW)
+            intervals.append(feed.interval)
+
+        self.assertEqual(feed.failures, 100)
+        self.assertEqual(intervals[0], 7200)
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], settings.polling.maximum)
@@ -0,0 +1,287 @@
+# tests.test_stream
+# Test the incremental parsing of feeds.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 17:05:48 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_stream.py [] benjamin@bengfort.com $
+
+"""
+Test the incremental parsing of feeds.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import unittest
+import calendar
+import feedparser
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from .test_models import MongoTestMixin
+from .test_feed import MockResponse
+
+from baleen.feed import FeedSync
+from baleen.models import Feed, Post
+from baleen.stream import FeedStream, ENTRY_FIELDS
+from baleen.wrangle import PostWrangler
+from baleen.exceptions import SynchronizationError
+
+
+##########################################################################
+## Fixtures
+##########################################################################
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+RSS_PATH  = os.path.join(FIXTURES, "feed.rss")
+ATOM_PATH = os.path.join(FIXTURES, "feed.atom")
+BASE_URL  = "http://example.com/feeds/"
+
+RSS = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/"'
+    ' xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    '<channel><title>Example Feed</title><link>http://example.com/</link>'
+    '<item><title>Third Post</title><link>http://example.com/3/</link>'
+    '<guid>http://example.com/?p=3</guid><dc:creator>Ben</dc:creator>'
+    '<pubDate>Wed, 02 Mar 2016 22:00:06 +0000</pubDate>'
+    '<category>Data</category><category>Python</category>'
+    '<description>The third post</description>'
+    '<content:encoded><![CDATA[<p>The <b>third</b> post</p>]]></content:encoded>'
+    '</item>'
+    '<item><title>Second Post</title><link>http://example.com/2/</link>'
+    '<pubDate>Tue, 01 Mar 2016 12:00:00 -0500</pubDate>'
+    '<description>The second post</description></item>'
+    '<item><title>First Post</title><link>http://example.com/1/</link>'
+    '<description>The first post</description></item>'
+    '</channel></rss>'
+)
+
+ATOM = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<feed xmlns="http://www.w3.org/2005/Atom"><title>Example Atom</title>'
+    '<link rel="self" href="http://example.com/atom/"/>'
+    '<link href="http://example.com/"/>'
+    '<entry><title>Atom Post</title>'
+    '<link rel="alternate" href="http://example.com/atom/1/"/>'
+    '<id>urn:uuid:1225c695</id><updated>2016-03-02T22:00:06Z</updated>'
+    '<author><name>Ben</name></author><category term="atom"/>'
+    '<summary>An atom post</summary>'
+    '<content type="xhtml"><div xmlns="http://www.w3.org/1999/xhtml">'
+    '<p>An atom post</p></div></content>'
+    '</entry></feed>'
+)
+
+
+##########################################################################
+## Feed Stream Tests
+##########################################################################
+
+class FeedStreamTests(unittest.TestCase):
+
+    def assertMatchesFeedparser(self, content, base=None, encoding=None):
+        """
+        Asserts the streamed entries have the same fields as feedparser's,
+        when both are parsed relative to the same base url and with the
+        same charset (as given by the content type of a response).
+        """
+        ctype = 'application/xml'
+        if encoding:
+            ctype += '; charset={}'.format(encoding)
+
+        stream   = FeedStream(content, base=base, encoding=encoding)
+        entries  = list(stream)
+        expected = feedparser.parse(content, response_headers={
+            'content-location': base or '', 'content-type': ctype,
+        })
+
+        self.assertEqual(stream.version, expected.version)
+        self.assertEqual(stream.feed.title, expected.feed.title)
+        self.assertEqual(stream.feed.link, expected.feed.link)
+        self.assertEqual(len(entries), len(expected.entries))
+
+        for entry, other in zip(entries, expected.entries):
+            self.assertLessEqual(set(entry), set(ENTRY_FIELDS))
+            for key in ENTRY_FIELDS:
+                self.assertEqual(entry.get(key), other.get(key), key)
+
+        return entries
+
+    def test_rss(self):
+        """
+        Test streaming the entries of an RSS feed
+        """
+        entries = self.assertMatchesFeedparser(RSS)
+        self.assertEqual(entries[0].content[0].value, '<p>The <b>third</b> post</p>')
+
+    def test_atom(self):
+        """
+        Test streaming the entries of an Atom feed
+        """
+        entries = self.assertMatchesFeedparser(ATOM)
+        self.assertIn('<p>An atom post</p>', entries[0].content[0].value)
+
+    def test_rss_fixture(self):
+        """
+        Test streaming an RSS feed with relative urls and unsafe markup
+        """
+        with open(RSS_PATH, 'rb') as f:
+            entries = self.assertMatchesFeedparser(f.read(), BASE_URL)
+
+        self.assertEqual(entries[0].link, "http://example.com/blog/posts/3/?a=1&b=2")
+        self.assertFalse(entries[0].guidislink)
+        self.assertNotIn("script", entries[0].content[0].value)
+        self.assertNotIn("onclick", entries[0].summary)
+        self.assertIn('src="http://example.com/blog/images/3.png"', entries[0].content[0].value)
+        self.assertEqual(entries[0].author_detail.email, "ben@example.com")
+
+        self.assertEqual(entries[1].link, "http://other.example.com/mirror/posts/2/")
+        self.assertTrue(entries[1].guidislink)
+
+    def test_atom_fixture(self):
+        """
+        Test streaming an Atom feed with relative urls and unsafe markup
+        """
+        with open(ATOM_PATH, 'rb') as f:
+            entries = self.assertMatchesFeedparser(f.read(), BASE_URL)
+
+        self.assertEqual(entries[0].link, "http://example.com/atom/posts/1/")
+        self.assertEqual(entries[0].author_detail.href, "http://example.com/about/")
+        self.assertEqual(entries[0].content[0].language, "fr")
+        self.assertNotIn("onclick", entries[0].content[0].value)
+        self.assertNotIn("iframe", entries[1].content[0].value)
+        self.assertEqual(entries[1].link, "http://mirror.example.com/posts/2/")
+
+    def test_charset_entities_dates(self):
+        """
+        Test streaming with the response charset, html entities and named zones
+        """
+        content = (
+            '<rss version="2.0"><channel><title>Caf\xe9</title>'
+            '<link>http://example.com/</link>'
+            '<item><title>Caf\xe9 A&nbsp;B &copy; &amp; &bogus;</title>'
+            '<link>http://example.com/1/</link>'
+            '<pubDate>Wed, 02 Mar 2016 22:00:06 EST</pubDate>'
+            '<description><![CDATA[<p>A&nbsp;B</p>]]></description>'
+            '</item></channel></rss>'
+        )
+
+        entries = self.assertMatchesFeedparser(content, encoding='iso-8859-1')
+        self.assertEqual(entries[0].title, u'Caf\xe9 A\xa0B \xa9 & &bogus;')
+        self.assertEqual(entries[0].summary, u'<p>A&nbsp;B</p>')
+        self.assertEqual(
+            calendar.timegm(entries[0].published_parsed),
+            calendar.timegm((2016, 3, 3, 3, 0, 6, 0, 0, 0)),
+        )
+
+        # Unknown encodings fall back to the encoding of the document
+        stream = FeedStream(RSS, encoding='no-such-charset')
+        self.assertEqual(len(list(stream)), 3)
+
+    def test_wrangle_streamed(self):
+        """
+        Test that streamed entries are wrangled like feedparser entries
+        """
+        for content in (RSS, ATOM):
+            streamed = [PostWrangler(e).wrangle(save=False) for e in FeedStream(content)]
+            expected = [
+                PostWrangler(e).wrangle(save=False)
+                for e in feedparser.parse(content).entries
+            ]
+
+            for post, other in zip(streamed, expected):
+                for key in ('title', 'url', 'pubdate', 'tags', 'mimetype'):
+                    self.assertEqual(getattr(post, key, None), getattr(other, key, None), key)
+
+    def test_incremental(self):
+        """
+        Test that entries are yielded before the document is parsed
+        """
+        stream = iter(FeedStream(RSS + '<rss><channel><item>'))
+        self.assertEqual(next(stream).title, "Third Post")
+
+
+##########################################################################
+## Feed Sync Stream Tests
+##########################################################################
+
+class FeedSyncStreamTests(MongoTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(FeedSyncStreamTests, self).setUp()
+        self.feed = Feed(link="http://example.com/rss/", category="test")
+        self.feed.save()
+
+    def test_stream_skips_known(self):
+        """
+        Test that the stream skips known entries rather than stopping
+        """
+        known = mock.MagicMock(side_effect=lambda entries: [
+            entry.link == "http://example.com/2/" for entry in entries
+        ])
+        fsync = FeedSync(self.feed)
+        response = MockResponse(RSS, url=self.feed.link, headers={'ETag': '"abc"'})
+
+        entries = list(fsync.stream(response=response, known=known))
+        self.assertEqual([entry.title for entry in entries], ["Third Post", "First Post"])
+        self.assertEqual(known.call_count, 1)
+
+        feed = Feed.objects.get(id=self.feed.id)
+        self.assertEqual(feed.title, "Example Feed")
+        self.assertEqual(feed.version, "rss20")
+        self.assertEqual(feed.etag, '"abc"')
+        self.assertIsNotNone(feed.next_poll)
+
+    @mock.patch('baleen.feed.KNOWN_CHUNK', 2)
+    @mock.patch('baleen.feed.polling.observe')
+    def test_stream_chunks(self, mock_observe):
+        """
+        Test that known entries are looked up in chunks and dates are kept
+        """
+        known = mock.MagicMock(side_effect=lambda entries: [False] * len(entries))
+        fsync = FeedSync(self.feed)
+        response = MockResponse(RSS, url=self.feed.link)
+
+        self.assertEqual(len(list(fsync.stream(response=response, known=known))), 3)
+        self.assertEqual([len(call[0][0]) for call in known.call_args_list], [2, 1])
+
+        response = MockResponse(ATOM, url=self.feed.link)
+        self.assertEqual(len(list(fsync.stream(response=response))), 1)
+
+        result = mock_observe.call_args[0][1]
+        self.assertIsNone(result.entries[0]['published_parsed'])
+        self.assertEqual(
+            calendar.timegm(result.entries[0]['updated_parsed']),
+            calendar.timegm((2016, 3, 2, 22, 0, 6, 0, 0, 0)),
+        )
+
+    def test_stream_not_modified(self):
+        """
+        Test that a not modified feed streams no entries
+        """
+        fsync = FeedSync(self.feed)
+        response = MockResponse("", 304, url=self.feed.link)
+        self.assertEqual(list(fsync.stream(response=response)), [])
+        self.assertEqual(Feed.objects.get(id=self.feed.id).failures, 1)
+
+    def test_stream_error(self):
+        """
+        Test that errors while streaming are synchronization errors
+        """
+        fsync = FeedSync(self.feed)
+        response = MockResponse(RSS, url=self.feed.link)
+
+        def known(entry):
+            raise ValueError("database is down")
+
+        with self.assertRaises(SynchronizationError):
+            list(fsync.stream(response=response, known=known))
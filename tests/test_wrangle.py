@@ -21,6 +21,9 @@ import os
 import pickle
 import unittest
 
+from copy import deepcopy
+from dateutil import parser as dtparser
+
 from .test_models import MongoTestMixin
 
 try:
@@ -29,8 +32,11 @@ except ImportError:
     import mock
 
 from baleen.wrangle import *
+from baleen.config import settings
 from baleen.exceptions import *
-from baleen.models import Feed, Post
+from baleen.models import Feed, Post, content_size, post_date
+from pymongo.errors import BulkWriteError
+from mongoengine import NotUniqueError, OperationError
 
 ##########################################################################
 ## Fixtures
@@ -84,6 +90,41 @@ class PostWranglerTests(MongoTestMixin, unittest.TestCase):
         for wrangle in PostWrangler.factory(self.entries, feed=self.feed):
             self.assertIsInstance(wrangle, PostWrangler)
 
+    def test_wrangle_copy_free(self):
+        """
+        Test that wrangling does not copy or modify the entries
+        """
+        expected = deepcopy(self.entries)
+        wranglers = list(PostWrangler.factory(self.entries, feed=self.feed))
+
+        for entry, wrangle in zip(self.entries, wranglers):
+            self.assertIs(wrangle.post, entry)
+            post = wrangle.wrangle(save=False)
+            self.assertEqual(post.url, entry.link)
+            self.assertNotIn('link', post)
+            self.assertNotIn('published', post)
+
+        self.assertEqual(self.entries, expected)
+
+    @mock.patch('baleen.wrangle.parse_datetime')
+    def test_pubdate(self, mock_parse):
+        """
+        Test that the date parsed by feedparser is reused if available
+        """
+        entry = self.entries[0]
+        wrangle = PostWrangler(entry, feed=self.feed)
+        self.assertEqual(wrangle.pubdate(), dtparser.parse(entry.published))
+        mock_parse.assert_not_called()
+
+        entry = dict(self.entries[0], published_parsed=None)
+        wrangle = PostWrangler(entry, feed=self.feed)
+        self.assertEqual(wrangle.pubdate(), mock_parse.return_value)
+        mock_parse.assert_called_once_with(entry['published'], key=self.feed.link)
+
+        entry = dict(self.entries[0])
+        del entry['published']
+        self.assertIsNone(PostWrangler(entry, feed=self.feed).pubdate())
+
     def test_wrangle_integration(self):
         """
         Test wrangling of all entries in the result.
@@ -101,6 +142,99 @@ class PostWranglerTests(MongoTestMixin, unittest.TestCase):
                 wrangle.wrangle()
             self.assertEqual(Post.objects.count(), 10)
 
+    def test_known_entries(self):
+        """
+        Test the batched lookup of entries that are already stored
+        """
+        self.assertEqual(PostWrangler.known(self.entries), set())
+        self.assertEqual(PostWrangler.known([]), set())
+
+        for wrangle in PostWrangler.factory(self.entries[:3], feed=self.feed):
+            wrangle.wrangle()
+
+        known = PostWrangler.known(self.entries)
+        self.assertEqual(known, set(entry.link for entry in self.entries[:3]))
+        self.assertEqual(known, set(entry_url(entry) for entry in self.entries[:3]))
+
+    def test_bulk_save(self):
+        """
+        Test saving wrangled posts with a single bulk insert
+        """
+        wranglers = list(PostWrangler.factory(self.entries, feed=self.feed))
+        for wrangle in wranglers[:-1]: wrangle.wrangle(save=False)
+
+        errors = PostWrangler.bulk_save(wranglers)
+        self.assertEqual(Post.objects.count(), 9)
+        self.assertEqual(errors[:-1], [None] * 9)
+        self.assertIsInstance(errors[-1], WranglingError)
+
+        # Saved posts are updated rather than inserted on subsequent saves.
+        post = wranglers[0].post
+        self.assertIsNotNone(post.id)
+        self.assertIsNotNone(post.signature)
+        post.content = "Luke, I am your father!"
+        post.save()
+        self.assertEqual(Post.objects.count(), 9)
+        self.assertEqual(Post.objects.get(id=post.id).content, post.content)
+
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
+    def test_feed_statistics(self, mock_requests):
+        """
+        Test that saved and fetched posts update the statistics of the feed
+        """
+        wranglers = list(PostWrangler.factory(self.entries, feed=self.feed))
+        for wrangle in wranglers[:-1]: wrangle.wrangle(save=False)
+        PostWrangler.bulk_save(wranglers)
+
+        posts = [wrangle.post for wrangle in wranglers[:-1]]
+        feed  = Feed.objects.get(id=self.feed.id)
+        self.assertEqual(feed.post_count, 9)
+        self.assertEqual(feed.content_bytes, sum(content_size(p.content) for p in posts))
+        self.assertEqual(feed.last_post, max(post_date(p) for p in posts))
+
+        # The last entry is saved on its own
+        wranglers[-1].wrangle()
+        feed = Feed.objects.get(id=self.feed.id)
+        self.assertEqual(feed.post_count, 10)
+
+        # Fetching replaces the content, which changes the bytes stored
+        size = feed.content_bytes
+        post = wranglers[0].post
+        post.url = 'http://example.com/vader/'
+        delta = content_size(u"Luke, I am your father!") - content_size(post.content)
+        wranglers[0].fetch()
+        feed = Feed.objects.get(id=self.feed.id)
+        self.assertEqual(feed.content_bytes, size + delta)
+        self.assertEqual(feed.post_count, 10)
+
+    @mock.patch('baleen.wrangle.Post._get_collection')
+    def test_bulk_save_duplicates(self, mock_collection):
+        """
+        Test that bulk write errors are reported per post
+        """
+        mock_collection.return_value.insert_many.side_effect = BulkWriteError({
+            'writeErrors': [
+                {'index': 1, 'code': 11000, 'errmsg': 'E11000 duplicate key'},
+                {'index': 2, 'code': 2, 'errmsg': 'bad value'},
+            ],
+        })
+
+        wranglers = list(PostWrangler.factory(self.entries[:4], feed=self.feed))
+        for wrangle in wranglers: wrangle.wrangle(save=False)
+
+        errors = PostWrangler.bulk_save(wranglers)
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1].original, NotUniqueError)
+        self.assertIsInstance(errors[2].original, OperationError)
+        self.assertIsNone(errors[3])
+
+        self.assertIsNotNone(wranglers[0].post.id)
+        self.assertIsNone(wranglers[1].post.id)
+
+        args, kwargs = mock_collection.return_value.insert_many.call_args
+        self.assertEqual(len(args[0]), 4)
+        self.assertEqual(kwargs, {'ordered': False})
+
     def test_is_wrangled(self):
         """
         Test the wrangling detection
@@ -147,23 +281,23 @@ class PostWranglerTests(MongoTestMixin, unittest.TestCase):
         post = nofeed.wrangle()
         self.assertIsNone(post.feed)
 
-    @mock.patch('baleen.wrangle.requests.get', side_effect=mocked_requests_get)
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
     def test_fetch_not_wrangled(self, mock_requests):
         """
         Assert that fetch requires wrangling
         """
-        assert mock_requests is requests.get
+        assert mock_requests is http.get
 
         wrangle = PostWrangler(self.entries[0], feed=self.feed)
         with self.assertRaises(FetchError):
             wrangle.fetch()
 
-    @mock.patch('baleen.wrangle.requests.get', side_effect=mocked_requests_get)
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
     def test_fetch_overwrites_content(self, mock_requests):
         """
         Test that the fetch overwrites content.
         """
-        assert mock_requests is requests.get
+        assert mock_requests is http.get
 
         wrangle = PostWrangler(self.entries[0], feed=self.feed)
         wrangle.wrangle()
@@ -175,13 +309,14 @@ class PostWranglerTests(MongoTestMixin, unittest.TestCase):
         self.assertNotEqual(post.created, post.updated)
 
         self.assertEqual(post.content, "Luke, I am your father!")
+        self.assertIsNotNone(Post.objects.first().fetched)
 
-    @mock.patch('baleen.wrangle.requests.get', side_effect=mocked_requests_get)
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
     def test_fetch_no_save(self, mock_requests):
         """
         Test that the fetch does not save on demand.
         """
-        assert mock_requests is requests.get
+        assert mock_requests is http.get
 
         wrangle = PostWrangler(self.entries[0], feed=self.feed)
         wrangle.wrangle()
@@ -194,13 +329,14 @@ class PostWranglerTests(MongoTestMixin, unittest.TestCase):
         post = Post.objects.first()
         self.assertDateTimeEqual(post.created, post.updated)
         self.assertNotEqual(post.content, "Luke, I am your father!")
+        self.assertIsNone(post.fetched)
 
-    @mock.patch('baleen.wrangle.requests.get', side_effect=mocked_requests_get)
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
     def test_fetch_raises_404(self, mock_requests):
         """
         Test that fetch raises exception on HTTP error
         """
-        assert mock_requests is requests.get
+        assert mock_requests is http.get
 
         wrangle = PostWrangler(self.entries[0], feed=self.feed)
         wrangle.wrangle()
@@ -209,4 +345,65 @@ class PostWranglerTests(MongoTestMixin, unittest.TestCase):
         with self.assertRaises(FetchError):
             wrangle.post.url = 'http://example.com/obiwan/'
             wrangle.fetch()
+
+    @mock.patch('baleen.http.requests.Session.get')
+    def test_fetch_limits(self, mock_get):
+        """
+        Test that fetch does not download unaccepted or oversized pages
+        """
+        from .test_feed import MockResponse
+
+        wrangle = PostWrangler(self.entries[0], feed=self.feed)
+        wrangle.wrangle()
+        content = wrangle.post.content
+
+        cases = (
+            MockResponse("x" * 1000, headers={'Content-Type': 'video/mp4'}),
+            MockResponse("x" * (settings.fetch.max_bytes + 1), headers={'Content-Type': 'text/html'}),
+        )
+
+        for response in cases:
+            mock_get.return_value = response
+            with self.assertRaises(FetchError) as cm:
+                wrangle.fetch()
+            self.assertIsInstance(cm.exception.original, ContentError)
+
+        self.assertEqual(Post.objects.first().content, content)
         
+
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
+    def test_download(self, mock_requests):
+        """
+        Test that download returns the response without modifying the post
+        """
+        wrangle = PostWrangler(self.entries[0], feed=self.feed)
+        with self.assertRaises(FetchError):
+            wrangle.download()
+
+        wrangle.wrangle()
+        wrangle.post.url = 'http://example.com/vader/'
+        response = wrangle.download()
+
+        self.assertEqual(response.text, "Luke, I am your father!")
+        self.assertNotEqual(wrangle.post.content, "Luke, I am your father!")
+
+        with self.assertRaises(FetchError) as cm:
+            wrangle.post.url = 'http://example.com/obiwan/'
+            wrangle.download()
+
+        # Errors are not wrapped twice by the reraise decorators
+        self.assertNotIsInstance(cm.exception.original, FetchError)
+
+    @mock.patch('baleen.wrangle.http.get', side_effect=mocked_requests_get)
+    def test_fetch_response(self, mock_requests):
+        """
+        Test that fetch uses a response that has already been downloaded
+        """
+        wrangle = PostWrangler(self.entries[0], feed=self.feed)
+        wrangle.wrangle()
+
+        response = mocked_requests_get('http://example.com/vader/')
+        post = wrangle.fetch(response=response)
+
+        mock_requests.assert_not_called()
+        self.assertEqual(post.content, "Luke, I am your father!")
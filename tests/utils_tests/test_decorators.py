@@ -19,6 +19,7 @@ Testing the decorators utility package.
 
 import time
 import unittest
+import threading
 
 from baleen.utils.decorators import *
 from baleen.utils.timez import Timer
@@ -147,3 +148,51 @@ class DecoratorsTests(unittest.TestCase):
         e = cm.exception
         self.assertEqual(str(e), "this should be the exception raised")
         self.assertFalse(hasattr(e, "original"))
+
+    def test_timeout(self):
+        """
+        Test the timeout decorator
+        """
+
+        @timeout(0.1)
+        def echo(value):
+            return value
+
+        @timeout(0.1)
+        def sleepy():
+            time.sleep(1)
+
+        @timeout(0.1)
+        def broken():
+            raise ValueError("this should be the exception raised")
+
+        self.assertEqual(echo(42), 42)
+
+        with self.assertRaises(TimeoutError):
+            sleepy()
+
+        with self.assertRaises(ValueError):
+            broken()
+
+    def test_timeout_threads(self):
+        """
+        Test the timeout decorator outside of the main thread
+        """
+
+        @timeout(0.1)
+        def sleepy():
+            time.sleep(1)
+
+        errors = []
+
+        def target():
+            try:
+                sleepy()
+            except TimeoutError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=target) for idx in xrange(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        self.assertEqual(len(errors), 4)
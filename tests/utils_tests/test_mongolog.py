@@ -17,9 +17,15 @@ Simple tests for logging to MongoDB
 ## Imports
 ##########################################################################
 
+import os
+import sys
+import shutil
 import logging
+import tempfile
 import unittest
 
+from bson import json_util
+
 from mongomock import MongoClient as MockMongoClient
 
 try:
@@ -62,3 +68,160 @@ class MongoLogHandlerTests(unittest.TestCase):
 
         # Ensure there is now a log message
         self.assertEqual(handler.collection.count(), 1)
+
+
+##########################################################################
+## Mongo Formatter Tests
+##########################################################################
+
+class MongoFormatterTests(unittest.TestCase):
+
+    def make_record(self, exc_info=None, **extra):
+        record = logging.LogRecord(
+            'baleen.ingest', logging.ERROR, __file__, 42,
+            "Error on Feed %d (%s)", (1, "http://example.com/"), exc_info,
+        )
+        record.__dict__.update(extra)
+        return record
+
+    @mock.patch('baleen.utils.mongolog.getpass.getuser', return_value='baleen')
+    @mock.patch('baleen.utils.mongolog.gethostname', return_value='example')
+    def test_format(self, mock_host, mock_user):
+        """
+        Test that only the stored fields are formatted
+        """
+        formatter = ml.MongoFormatter()
+        for idx in range(3):
+            data = formatter.format(self.make_record(job='abc'))
+
+        # The user and host are only looked up once
+        self.assertEqual(mock_user.call_count, 1)
+        self.assertEqual(mock_host.call_count, 1)
+
+        self.assertEqual(set(data), {
+            'logger', 'message', 'timestamp', 'level', 'error', 'user', 'host',
+            'asctime', 'job',
+        })
+        self.assertEqual(data['logger'], 'baleen.ingest')
+        self.assertTrue(data['message'].endswith("-- Error on Feed 1 (http://example.com/)"))
+        self.assertEqual(data['level'], {'number': logging.ERROR, 'name': 'ERROR'})
+        self.assertEqual(data['error'], {'info': None, 'text': None})
+        self.assertEqual(data['user'], 'baleen')
+        self.assertEqual(data['host'], 'example')
+        self.assertEqual(data['job'], 'abc')
+
+    def test_format_exception(self):
+        """
+        Test that exceptions are formatted so that they can be stored
+        """
+        try:
+            raise ValueError("bad entry")
+        except ValueError:
+            record = self.make_record(sys.exc_info())
+
+        data = ml.MongoFormatter().format(record)
+        self.assertEqual(data['error']['info'], 'ValueError')
+        self.assertIn("ValueError: bad entry", data['error']['text'])
+        json_util.dumps(data)
+
+
+##########################################################################
+## Buffered Mongo Log Handler Tests
+##########################################################################
+
+@mock.patch('baleen.utils.mongolog.MongoClient', MockMongoClient)
+class BufferedMongoHandlerTests(unittest.TestCase):
+    """
+    Tests the batching, flushing and overflow of the buffered handler.
+    """
+
+    def setUp(self):
+        self.logger = logging.getLogger('test.mongo.logger.buffered')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.handlers = []
+
+    def tearDown(self):
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+
+    def make_handler(self, **kwargs):
+        kwargs.setdefault('interval', 60)
+        handler = ml.MongoHandler(buffered=True, **kwargs)
+        self.logger.addHandler(handler)
+        self.handlers.append(handler)
+        return handler
+
+    def test_flush(self):
+        """
+        Test that buffered records are written when flushed
+        """
+        handler = self.make_handler(capacity=100)
+        for idx in range(5):
+            self.logger.info(tmsgf("Buffered message {}".format(idx)))
+
+        self.assertEqual(handler.collection.count(), 0)
+        handler.flush()
+        self.assertEqual(handler.collection.count(), 5)
+
+    def test_batch_capacity(self):
+        """
+        Test that a full batch is written without waiting for the interval
+        """
+        handler = self.make_handler(capacity=3)
+        with mock.patch.object(handler.collection, 'insert_many', wraps=handler.collection.insert_many) as insert:
+            for idx in range(6):
+                self.logger.info(tmsgf("Batched message {}".format(idx)))
+
+            handler.queue.join()
+            self.assertEqual(handler.collection.count(), 6)
+            self.assertEqual([len(call[0][0]) for call in insert.call_args_list], [3, 3])
+
+    def test_close(self):
+        """
+        Test that closing the handler writes the buffer and stops the thread
+        """
+        handler = self.make_handler()
+        flusher = handler.flusher
+        self.logger.info(tmsgf("Message before shutdown"))
+
+        handler.close()
+        self.assertFalse(flusher.is_alive())
+        self.assertEqual(handler.collection.count(), 1)
+
+    def test_drop_when_full(self):
+        """
+        Test that records are dropped rather than blocking when full
+        """
+        handler = self.make_handler()
+
+        # Stop the flusher so that nothing drains the queue
+        handler.close()
+        handler.queue = ml.Queue.Queue(2)
+        for idx in range(5):
+            handler.enqueue({'message': "Dropped message {}".format(idx)})
+
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+
+    def test_spill_failed_writes(self):
+        """
+        Test that records that can't be written are spilled to disk
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        spill = os.path.join(tmp, 'spill.json')
+
+        handler = self.make_handler(spill=spill)
+        with mock.patch.object(handler.collection, 'insert_many', side_effect=ml.PyMongoError("down")):
+            self.logger.info(tmsgf("Spilled message"))
+            handler.flush()
+
+        self.assertEqual(handler.spilled, 1)
+        with open(spill) as f:
+            records = [json_util.loads(line) for line in f]
+
+        self.assertEqual(len(records), 1)
+        self.assertIn("Spilled message", records[0]['message'])
+        self.assertEqual(records[0]['level']['name'], 'INFO')
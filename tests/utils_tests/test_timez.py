@@ -20,7 +20,12 @@ Testing for the timez time helpers library.
 import time
 import unittest
 
-from datetime import datetime
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from datetime import datetime, timedelta
 from dateutil.tz import tzutc
 from baleen.utils.timez import *
 
@@ -134,3 +139,118 @@ class TimezHelpersTests(unittest.TestCase):
         self.assertGreater(t.finished, t.started)
         self.assertEqual(t.elapsed, t.finished-t.started)
         self.assertEqual(str(t), '1 seconds')
+
+    def test_deadline(self):
+        """
+        Test the Deadline time budget
+        """
+        deadline = Deadline(0.1)
+        self.assertFalse(deadline.expired)
+        self.assertLessEqual(deadline.remaining, 0.1)
+        self.assertLessEqual(deadline.timeout(60), 0.1)
+        self.assertEqual(deadline.timeout(0.01), 0.01)
+        deadline.check()
+
+        time.sleep(0.11)
+        self.assertTrue(deadline.expired)
+        self.assertEqual(deadline.remaining, 0.0)
+
+        with self.assertRaises(TimeoutError):
+            deadline.check()
+
+        with self.assertRaises(TimeoutError):
+            deadline.timeout(60)
+
+    def test_unbounded_deadline(self):
+        """
+        Test a Deadline with no time budget
+        """
+        deadline = Deadline()
+        self.assertIsNone(deadline.remaining)
+        self.assertFalse(deadline.expired)
+        self.assertEqual(deadline.timeout(60), 60)
+        self.assertIsNone(deadline.timeout())
+
+
+##########################################################################
+## Date Parsing Test Cases
+##########################################################################
+
+class DateParserTests(unittest.TestCase):
+
+    def test_parse_rfc822(self):
+        """
+        Test strict parsing of RFC 822 dates
+        """
+        expected = datetime(2016, 3, 2, 22, 0, 6, tzinfo=tzutc())
+        self.assertEqual(parse_rfc822("Wed, 02 Mar 2016 22:00:06 GMT"), expected)
+        self.assertEqual(parse_rfc822("Wed, 02 Mar 2016 22:00:06 +0000"), expected)
+        self.assertEqual(parse_rfc822("2 Mar 2016 17:00:06 -0500"), expected)
+        self.assertEqual(parse_rfc822("Wed, 02 Mar 16 22:00:06 Z"), expected)
+        self.assertIsNone(parse_rfc822("2016-03-02T22:00:06Z"))
+        self.assertIsNone(parse_rfc822("Wed, 02 Foo 2016 22:00:06 GMT"))
+
+    def test_parse_rfc822_zones(self):
+        """
+        Test that the named zones of RFC 822 are converted to their offsets
+        """
+        expected = datetime(2016, 3, 3, 3, 0, 6, tzinfo=tzutc())
+        for zone, hours in (
+            ('EST', -5), ('EDT', -4), ('CST', -6), ('CDT', -5),
+            ('MST', -7), ('MDT', -6), ('PST', -8), ('PDT', -7),
+        ):
+            local  = expected + timedelta(hours=hours)
+            value  = local.strftime("%a, %d %b %Y %H:%M:%S ") + zone
+            parsed = parse_rfc822(value)
+            self.assertEqual(parsed, expected)
+            self.assertEqual(parsed.utcoffset(), timedelta(hours=hours))
+
+        self.assertEqual(parse_rfc822("Wed, 02 Mar 2016 22:00:06 est"), expected)
+        self.assertIsNone(parse_rfc822("Wed, 02 Mar 2016 22:00:06 XYZ"))
+
+    def test_parse_iso8601(self):
+        """
+        Test strict parsing of ISO 8601 datetimes
+        """
+        expected = datetime(2016, 3, 2, 22, 0, 6, tzinfo=tzutc())
+        self.assertEqual(parse_iso8601("2016-03-02T22:00:06Z"), expected)
+        self.assertEqual(parse_iso8601("2016-03-02T17:00:06-05:00"), expected)
+        self.assertEqual(parse_iso8601("2016-03-02 23:00:06+0100"), expected)
+        self.assertEqual(
+            parse_iso8601("2016-03-02T22:00:06.25Z"),
+            expected.replace(microsecond=250000),
+        )
+        self.assertIsNone(parse_iso8601("2016-03-02T22:00:06"))
+        self.assertIsNone(parse_iso8601("Wed, 02 Mar 2016 22:00:06 GMT"))
+
+    def test_format_cache(self):
+        """
+        Test that the format that worked is remembered by key
+        """
+        rfc822  = mock.MagicMock(side_effect=parse_rfc822)
+        iso8601 = mock.MagicMock(side_effect=parse_iso8601)
+        parser  = DateParser(formats=(rfc822, iso8601))
+
+        parser.parse("2016-03-02T22:00:06Z", key="atom")
+        self.assertEqual(parser.cache["atom"], 1)
+
+        rfc822.reset_mock()
+        parser.parse("2016-03-03T22:00:06Z", key="atom")
+        rfc822.assert_not_called()
+        iso8601.assert_called_with("2016-03-03T22:00:06Z")
+
+        # A miss on the cached format tries the others and updates the cache
+        parser.parse("Wed, 02 Mar 2016 22:00:06 GMT", key="atom")
+        self.assertEqual(parser.cache["atom"], 0)
+
+    def test_dateutil_fallback(self):
+        """
+        Test that dates in other formats fall back to dateutil
+        """
+        self.assertEqual(
+            DateParser().parse("March 2, 2016 10:00 PM"),
+            datetime(2016, 3, 2, 22, 0, 0),
+        )
+
+        with self.assertRaises(ValueError):
+            parse_datetime("not a date")
@@ -0,0 +1,157 @@
+# tests.utils_tests.test_workers
+# Tests for the bounded worker pool.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sun Oct 18 09:40:12 2026 -0400
+#
+# Copyright (C) 2026 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_workers.py [] benjamin@bengfort.com $
+
+"""
+Tests for the bounded worker pool.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import threading
+import unittest
+
+from baleen.utils.workers import WorkerPool, Stage, Pipeline
+
+
+##########################################################################
+## Worker Pool Tests
+##########################################################################
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def test_map(self):
+        """
+        Test that every item is handled by the pool
+        """
+        results = []
+        lock    = threading.Lock()
+
+        def handler(item):
+            with lock:
+                results.append(item * 2)
+
+        WorkerPool(handler, workers=4).map(xrange(100))
+        self.assertEqual(sorted(results), [idx * 2 for idx in xrange(100)])
+
+    def test_threads_used(self):
+        """
+        Test that the handler is called from the worker threads
+        """
+        names = set()
+
+        def handler(item):
+            names.add(threading.current_thread().name)
+
+        WorkerPool(handler, workers=2, name="test").map(xrange(10))
+        self.assertTrue(names)
+        self.assertTrue(names.issubset({"test-1", "test-2"}))
+
+    def test_bounded_queue(self):
+        """
+        Test the queue is bounded by twice the number of workers
+        """
+        pool = WorkerPool(lambda item: None, workers=3)
+        self.assertEqual(pool.queue.maxsize, 6)
+
+        pool = WorkerPool(lambda item: None, workers=3, maxsize=1)
+        self.assertEqual(pool.queue.maxsize, 1)
+
+    def test_handler_error(self):
+        """
+        Test that handler errors are raised to the producer
+        """
+        def handler(item):
+            if item == 42:
+                raise ValueError("the answer")
+
+        with self.assertRaises(ValueError):
+            WorkerPool(handler, workers=4).map(xrange(1000))
+
+
+##########################################################################
+## Pipeline Tests
+##########################################################################
+
+class PipelineTests(unittest.TestCase):
+
+    def test_pipeline(self):
+        """
+        Test that items flow through every stage of the pipeline
+        """
+        results = []
+        lock    = threading.Lock()
+
+        def split(item):
+            return [item, item]
+
+        def double(item):
+            return [item * 2]
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        pipeline = Pipeline(
+            Stage("split", split, workers=2),
+            Stage("double", double, workers=3, maxsize=2),
+            Stage("collect", collect),
+        )
+
+        with pipeline:
+            for idx in xrange(50):
+                pipeline.put(idx)
+
+        self.assertEqual(sorted(results), sorted(
+            [idx * 2 for idx in xrange(50)] * 2
+        ))
+
+        stats = pipeline.stats()
+        self.assertEqual([stage['name'] for stage in stats], [
+            "split", "double", "collect",
+        ])
+        self.assertEqual([stage['processed'] for stage in stats], [50, 100, 100])
+        self.assertEqual([stage['depth'] for stage in stats], [0, 0, 0])
+        self.assertEqual(stats[1]['maxsize'], 2)
+        self.assertEqual(stats[1]['workers'], 3)
+
+        for stage in stats:
+            self.assertGreater(stage['throughput'], 0)
+
+    def test_filter(self):
+        """
+        Test that stages can drop items by returning None
+        """
+        results = []
+
+        def odds(item):
+            if item % 2: return [item]
+
+        pipeline = Pipeline(Stage("odds", odds), Stage("collect", results.append))
+        with pipeline:
+            for idx in xrange(10):
+                pipeline.put(idx)
+
+        self.assertEqual(results, [1, 3, 5, 7, 9])
+
+    def test_stage_error(self):
+        """
+        Test that errors in a downstream stage are raised to the producer
+        """
+        def explode(item):
+            raise ValueError("bad stage")
+
+        pipeline = Pipeline(Stage("echo", lambda item: [item]), Stage("bad", explode))
+        with self.assertRaises(ValueError):
+            with pipeline:
+                for idx in xrange(1000):
+                    pipeline.put(idx)